@@ -1,41 +1,56 @@
+import startup
 import random
 import json
 import asyncio
-from openai import OpenAI
 import os
-from dotenv import load_dotenv
-import vk_api
-import requests
 import logging
-from typing import List, Tuple, Optional, Dict
-from datetime import datetime, time as dt_time, timedelta
+from typing import TYPE_CHECKING, List, Tuple, Optional, Dict, Iterable, Callable, Sequence
+from datetime import datetime, date, time as dt_time, timedelta
 import pytz
 from dataclasses import dataclass
 import time
-
-
-# Настройка логирования с московским временем
-class MoscowTimeFormatter(logging.Formatter):
-    def formatTime(self, record, datefmt=None):
-        moscow_tz = pytz.timezone('Europe/Moscow')
-        dt = datetime.fromtimestamp(record.created, moscow_tz)
-        if datefmt:
-            return dt.strftime(datefmt)
-        else:
-            return dt.isoformat()
-
-
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from scheduling import DeadlineTimer, get_clock
+from publishers import Publisher, TelegramPublisher, VkPublisher, publish_all, PUBLISH_DEADLINE
+from llm import (get_async_client, backoff_delay, rate_limit_delay, StreamProgress,
+                 stream_chat_completion)
+from rate_limit import limiter, SCOPE_OPENAI
+from config import get_config
+from prophecy_buffer import ProphecyBuffer, BufferRefiller
+from state_store import StateStore, STATE_DB
+from prophecy_log import ProphecyLog, get_prophecy_log, close_prophecy_log
+from similarity import SimilarityIndex, get_similarity_index, close_similarity_index
+from response_cache import get_response_cache, close_response_cache
+from log_setup import setup_logging
+from metrics import (STAGE_SECONDS, OPENAI_ATTEMPT_SECONDS, PUBLISH_LAG_SECONDS, MetricsExporter,
+                     observe_slack)
+from startup import lazy_import
+
+# Выборка (numpy), словари и пул процессов импортируются при первой генерации,
+# openai, requests и vk_api - при первом запросе: до первого дедлайна могут пройти часы
+if TYPE_CHECKING:
+    from sampling import WordSampler, SampleSummary
+    from sampling_pool import SamplingPool
+
+startup.mark('imports')
+
+
+# Настройка логирования с московским временем: запись форматируется и выводится
+# в отдельном потоке, LOG_FORMAT=json в окружении включает структурированный вывод
+setup_logging(structured=os.getenv('LOG_FORMAT') == 'json')
 logger = logging.getLogger(__name__)
 
-# Устанавливаем московское время для всех логов
-for handler in logging.root.handlers:
-    handler.setFormatter(MoscowTimeFormatter())
-
 # Константы
 TG_CHAT_ID = "@prorochestva_ot_bota"
+VK_GROUP_ID = -229101116
 GENERATION_OFFSET = 600  # 10 минут до публикации
-STATE_FILE = "prophecy_state.json"  # Файл для сохранения состояния
+STATE_FILE = "prophecy_state.json"  # Прежний файл состояния (переносится в базу STATE_DB)
+OPENAI_MODEL = "gpt-4o"
+OPENAI_STREAM = True  # Потоковые ответы OpenAI в асинхронном пути (см. get_openai_response_async)
+OPENAI_CACHE = True  # Повтор того же промпта отдаётся из кэша ответов (response_cache.py)
+BUFFER_FILE = "prophecy_buffer.json"  # Буфер заранее сгенерированных пророчеств
+SAMPLING_PARTS = ('nouns', 'verbs', 'adjectives')  # Части речи в пуле выборки (поля Vocabularies)
+DUPLICATE_MAX_ATTEMPTS = 3  # Сколько раз генерировать заново пророчество, похожее на прежнее
+RETRY_DELAY = 1  # Пауза перед повторной попыткой генерации/публикации после сбоя, секунды
 
 # Глобальный флаг для остановки
 stop_flag = False
@@ -45,33 +60,80 @@ MOSCOW_TZ = pytz.timezone('Europe/Moscow')
 
 
 @dataclass
-class ProphecySchedule:
-    """Расписание для пророчества"""
-    generation_time: datetime  # Когда генерировать
-    publish_time: datetime  # Когда публиковать
-    prophecy: Optional[str] = None  # Сгенерированное пророчество
-    generated: bool = False  # Сгенерировано ли
+class FeedConfig:
+    """Настройки одной ленты пророчеств (канала публикации)"""
+    feed_id: str = "default"  # Идентификатор ленты
+    tg_chat_id: Optional[str] = TG_CHAT_ID  # Канал Telegram (None - не публиковать)
+    vk_group_id: Optional[int] = VK_GROUP_ID  # Стена VK (None - не публиковать)
+    generation_offset: int = GENERATION_OFFSET  # За сколько секунд до публикации генерировать
+    state_file: str = STATE_FILE  # Прежний JSON-файл состояния ленты, для переноса в базу
 
 
-def load_env_keys() -> Dict[str, Optional[str]]:
+@dataclass
+class Vocabularies:
+    """Словари частей речи; один экземпляр разделяется всеми лентами процесса"""
+    nouns: Sequence[str]
+    verbs: Sequence[str]
+    adjectives: Sequence[str]
+
+
+def load_vocabularies() -> Vocabularies:
+    """Загружает словари один раз"""
+    try:
+        # Скомпилированные словари (python vocab.py) отображаются в память,
+        # иначе читаются исходные JSON
+        load_vocabulary = lazy_import('vocab').load_vocabulary
+        vocabularies = Vocabularies(
+            nouns=load_vocabulary("nouns.json"),
+            verbs=load_vocabulary("verbs.json"),
+            adjectives=load_vocabulary("adject.json")
+        )
+
+        logger.info(
+            f"Загружено: существительных - {len(vocabularies.nouns)}, глаголов - {len(vocabularies.verbs)}, прилагательных - {len(vocabularies.adjectives)}")
+        return vocabularies
+    except Exception as e:
+        logger.error(f"Ошибка загрузки словарей: {e}")
+        raise
+
+
+_shared_vocabularies: Optional[Vocabularies] = None
+
+
+def get_vocabularies() -> Vocabularies:
+    """Общие словари процесса: загружаются при первом обращении, одна копия на все ленты"""
+    global _shared_vocabularies
+    if _shared_vocabularies is None:
+        with startup.phase('vocabularies'):
+            _shared_vocabularies = load_vocabularies()
+    return _shared_vocabularies
+
+
+def create_sampling_pool(vocabularies: Optional[Vocabularies] = None) -> Optional["SamplingPool"]:
     """
-    Загружает ключи из .env файла при каждом вызове.
-    Это позволяет обновлять .env во время работы программы.
+    Пул процессов выборки, если SAMPLING_WORKERS в окружении задаёт их число (иначе None).
+    Словари загружаются, только если пул действительно нужен.
     """
-    load_dotenv(override=True)  # override=True перезагружает переменные
+    workers = int(os.getenv('SAMPLING_WORKERS') or 0)
+    if workers <= 0:
+        return None
+    vocabularies = vocabularies or get_vocabularies()
+    return lazy_import('sampling_pool').SamplingPool(
+        {part: getattr(vocabularies, part) for part in SAMPLING_PARTS}, workers)
 
-    keys = {
-        'OPENAI_API_KEY': os.getenv('OPENAI_API_KEY'),
-        'VK_TOKEN': os.getenv('VK_TOKEN'),
-        'TG_TOKEN': os.getenv('TG_TOKEN')
-    }
 
-    return keys
+def load_env_keys() -> Dict[str, Optional[str]]:
+    """
+    Возвращает ключи из .env файла.
+    Файл перечитывается, только когда он изменился, так что .env
+    по-прежнему можно обновлять во время работы программы.
+    """
+    return get_config().keys()
 
 
 def get_moscow_time() -> datetime:
-    """Возвращает текущее время в московском часовом поясе"""
-    return datetime.now(MOSCOW_TZ)
+    """Возвращает текущее время в московском часовом поясе (по часам процесса, см. scheduling.set_clock)"""
+    return get_clock().now()
 
 
 def format_moscow_time(dt: datetime = None, format_str: str = "%Y-%m-%d %H:%M:%S") -> str:
@@ -81,6 +143,14 @@ def format_moscow_time(dt: datetime = None, format_str: str = "%Y-%m-%d %H:%M:%S
     return dt.strftime(format_str)
 
 
+def publish_day(day: date) -> datetime:
+    """
+    Момент дня, на который составляется пророчество (полдень по Москве). Одинаков весь день,
+    поэтому повтор генерации даёт то же системное сообщение и попадает в кэш ответов.
+    """
+    return MOSCOW_TZ.localize(datetime.combine(day, dt_time(12)))
+
+
 def generate_next_publish_time() -> datetime:
     """Генерирует время следующей публикации (завтра в случайное время)"""
     now_moscow = get_moscow_time()
@@ -123,125 +193,110 @@ def optimized_choice_lst(lst: list, max_iterations: int = 20000) -> Tuple[list,
     return lst_choice, random.sample(missing_elements, min(2, len(missing_elements)))
 
 
-def create_dct(sampled_lst: list) -> List[Tuple[str, int]]:
-    """Создает список топ-3 самых частых слов"""
-    frequency_dict = {}
-    for word in sampled_lst:
-        frequency_dict[word] = frequency_dict.get(word, 0) + 1
-
-    sorted_items = sorted(frequency_dict.items(), key=lambda x: x[1], reverse=True)
-    return sorted_items[:3]
-
-
-def send_to_telegram(message: str) -> bool:
-    """Отправляет сообщение в Telegram канал"""
-    try:
-        # Загружаем ключи при каждом запросе
-        keys = load_env_keys()
-        tg_token = keys['TG_TOKEN']
-
-        if not tg_token:
-            logger.error("TG_TOKEN не найден в .env файле")
-            return False
-
-        url = f"https://api.telegram.org/bot{tg_token}/sendMessage"
-        payload = {
-            'chat_id': TG_CHAT_ID,
-            'text': message,
-            'parse_mode': 'HTML'
-        }
-
-        response = requests.post(url, data=payload, timeout=10)
-        response.raise_for_status()
-        logger.info("Сообщение успешно отправлено в Telegram")
-        return True
-
-    except Exception as e:
-        logger.error(f"Ошибка отправки в Telegram: {e}")
-        return False
-
+def create_dct(sampled_lst: Iterable[str], k: int = 3) -> List[Tuple[str, int]]:
+    """Создает список топ-k самых частых слов (по умолчанию топ-3)"""
+    return lazy_import('sampling').FrequencySummary(sampled_lst).top(k)
 
-def send_to_vk(message: str) -> bool:
-    """Отправляет сообщение в группу VK"""
-    try:
-        # Загружаем ключи при каждом запросе
-        keys = load_env_keys()
-        vk_token = keys['VK_TOKEN']
 
-        if not vk_token:
-            logger.error("VK_TOKEN не найден в .env файле")
-            return False
+NO_KEY_PROPHECY = "Моя магия слов закончилась ровно там, где началась ваша надежда услышать нечто волшебное. Пророчествовать не буду, ибо мой ключ API отсутствует."
+FAILED_PROPHECY = "Моя магия слов закончилась ровно там, где началась ваша надежда услышать нечто волшебное. Пророчествовать не буду, ибо моя хрустальная сфера сегодня затуманилась по техническим причинам."
 
-        vk_session = vk_api.VkApi(token=vk_token)
-        vk = vk_session.get_api()
 
-        group_id = -229101116
+GENERATION_ERROR_PROPHECY = "Пророчество не удалось сгенерировать. Попробуйте позже."
+# Заглушки вместо пророчества: их нельзя класть в буфер
+FALLBACK_PROPHECIES = {NO_KEY_PROPHECY, FAILED_PROPHECY, GENERATION_ERROR_PROPHECY}
 
-        result = vk.wall.post(
-            owner_id=group_id,
-            message=message,
-            from_group=1
-        )
-        logger.info(f"Ответ VK: {result}")
-        logger.info("Сообщение успешно отправлено в VK")
-        return True
 
-    except Exception as e:
-        logger.error(f"Ошибка отправки в VK: {e}")
-        return False
+def build_system_message(day: Optional[datetime] = None) -> str:
+    """Системное сообщение для пророка на указанный день (по умолчанию - текущий)"""
+    if day is None:
+        day = get_moscow_time()
+    return f"Ты пророк, который предсказывает будущее. Сочини пророчество на указанный день ({day.ctime()}) и в рамках дня по указанным словам, не цитируя их при этом, но передавая смысл. Меньше пафоса. В конце пророчества резюмируй двустишием"
 
 
-def get_openai_response(prompt: str, max_retries: int = 3) -> str:
+async def get_openai_response_async(prompt: str, max_retries: int = 3, day: Optional[datetime] = None,
+                                    stream: bool = OPENAI_STREAM, cache: bool = OPENAI_CACHE) -> str:
     """
-    Получает ответ от OpenAI API.
-    Ключ загружается при каждом вызове, что позволяет обновлять .env во время работы программы.
+    Получает ответ от OpenAI API через асинхронный клиент; пауза между попытками
+    (экспоненциальная с джиттером) не занимает поток пула.
+    Ключ загружается при каждом вызове, что позволяет обновлять .env во время работы программы;
+    клиент переиспользуется, пока ключ не изменится.
+    stream=True - потоковый ответ: таймаут считается между фрагментами, а после обрыва
+    следующая попытка продолжает уже полученный текст, а не генерирует его заново.
+    cache=True - ответ на уже отправленный промпт берётся из кэша ответов.
     """
-    # Загружаем ключи при каждом запросе
+    system_message = build_system_message(day)
+    if cache:
+        cached = get_response_cache().get(OPENAI_MODEL, system_message, prompt)
+        if cached is not None:
+            logger.info("Ответ OpenAI взят из кэша")
+            return cached
+
     keys = load_env_keys()
     openai_api_key = keys['OPENAI_API_KEY']
 
     if not openai_api_key:
         logger.error("OPENAI_API_KEY не найден в .env файле")
-        return "Моя магия слов закончилась ровно там, где началась ваша надежда услышать нечто волшебное. Пророчествовать не буду, ибо мой ключ API отсутствует."
+        return NO_KEY_PROPHECY
 
-    openai_client = OpenAI(
-        api_key=openai_api_key,
-        base_url="https://api.proxyapi.ru/openai/v1",
-        timeout=30
-    )
-
-    system_message = f"Ты пророк, который предсказывает будущее. Сочини пророчество на указанный день ({get_moscow_time().ctime()}) и в рамках дня по указанным словам, не цитируя их при этом, но передавая смысл. Меньше пафоса. В конце пророчества резюмируй двустишием"
+    openai_client = get_async_client(openai_api_key, keys['OPENAI_BASE_URL'])
+    messages = [
+        {"role": "system", "content": system_message},
+        {"role": "user", "content": prompt}
+    ]
+    progress = StreamProgress() if stream else None
+    rate_keys = [(SCOPE_OPENAI, openai_api_key)]
+    start = time.perf_counter()
 
     for attempt in range(max_retries):
+        await limiter.acquire(rate_keys)
         try:
             logger.info(f"Попытка {attempt + 1} получить ответ от OpenAI...")
+            attempt_start = time.perf_counter()
 
-            chat_completion = openai_client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": prompt}
-                ],
-                timeout=30
-            )
-
-            response = chat_completion.choices[0].message.content
-            logger.info("Успешно получен ответ от OpenAI")
+            if progress is not None:
+                await stream_chat_completion(openai_client, OPENAI_MODEL, messages, progress)
+                response = progress.text
+            else:
+                chat_completion = await openai_client.chat.completions.create(
+                    model=OPENAI_MODEL,
+                    messages=messages,
+                    timeout=30
+                )
+                response = chat_completion.choices[0].message.content
+
+            OPENAI_ATTEMPT_SECONDS.observe(time.perf_counter() - attempt_start, outcome='ok')
+            if progress is not None and progress.ttft is not None:
+                logger.info(f"Успешно получен ответ от OpenAI (первый фрагмент через {progress.ttft:.2f} с, "
+                            f"всего {time.perf_counter() - start:.2f} с)")
+            else:
+                logger.info("Успешно получен ответ от OpenAI")
+            if cache:
+                get_response_cache().put(OPENAI_MODEL, system_message, prompt, response)
             return response
 
         except Exception as e:
+            OPENAI_ATTEMPT_SECONDS.observe(time.perf_counter() - attempt_start, outcome='error')
             logger.warning(f"Попытка {attempt + 1} не удалась: {e}")
-            if attempt < max_retries - 1:
-                wait_time = (attempt + 1) * 5
-                logger.info(f"Ожидание {wait_time} секунд перед повторной попыткой...")
-                time.sleep(wait_time)
-            else:
+            if progress is not None and progress.parts:
+                logger.info(f"Получено {len(progress.text)} символов ответа, следующая попытка продолжит с них")
+            retry_after = rate_limit_delay(e)
+            if retry_after is not None:
+                limiter.penalize(rate_keys, retry_after)
+            if attempt == max_retries - 1:
                 logger.error("Все попытки получить ответ от OpenAI провалились")
-                return "Моя магия слов закончилась ровно там, где началась ваша надежда услышать нечто волшебное. Пророчествовать не буду, ибо моя хрустальная сфера сегодня затуманилась по техническим причинам."
+                return FAILED_PROPHECY
+            if retry_after is None:
+                wait_time = backoff_delay(attempt)
+                logger.info(f"Ожидание {wait_time:.1f} секунд перед повторной попыткой...")
+                await asyncio.sleep(wait_time)
 
 
-async def async_input_listener():
-    """Асинхронный слушатель ввода для остановки программы"""
+async def async_input_listener(on_stop: Optional[Callable[[], None]] = None):
+    """
+    Асинхронный слушатель ввода для остановки программы.
+    on_stop вызывается при остановке, чтобы разбудить спящий планировщик.
+    """
     global stop_flag
     loop = asyncio.get_event_loop()
 
@@ -260,35 +315,98 @@ async def async_input_listener():
             logger.error(f"Ошибка ввода: {e}")
             await asyncio.sleep(1)
 
+    if stop_flag and on_stop:
+        on_stop()
+
 
 class ProphecyScheduler:
     """Планировщик для генерации и публикации пророчеств"""
 
-    def __init__(self):
+    def __init__(self, feed: Optional[FeedConfig] = None, vocabularies: Optional[Vocabularies] = None,
+                 timer: Optional[DeadlineTimer] = None, buffer: Optional[ProphecyBuffer] = None,
+                 state_store: Optional[StateStore] = None, prophecy_log: Optional[ProphecyLog] = None,
+                 sampling_pool: Optional["SamplingPool"] = None,
+                 similarity_index: Optional[SimilarityIndex] = None):
+        """
+        feed - настройки ленты (по умолчанию - основной канал),
+        vocabularies, timer, buffer, state_store, prophecy_log, sampling_pool и similarity_index
+        передаются общими, когда в процессе много лент. Без sampling_pool выборка идёт в потоке цикла событий.
+        """
+        self.feed = feed or FeedConfig()
         self.next_publish_time: Optional[datetime] = None
         self.next_generation_time: Optional[datetime] = None
         self.current_prophecy: Optional[str] = None
         self.is_generating: bool = False
         self.generated_for_current_cycle: bool = False  # Флаг для предотвращения повторной генерации
-
-        # Загружаем словари один раз
-        try:
-            with open("nouns.json", "r", encoding='utf-8') as fh:
-                self.nouns = json.load(fh)
-            with open("verbs.json", "r", encoding='utf-8') as fh:
-                self.verbs = json.load(fh)
-            with open("adject.json", "r", encoding='utf-8') as fh:
-                self.adjectives = json.load(fh)
-
-            logger.info(
-                f"Загружено: существительных - {len(self.nouns)}, глаголов - {len(self.verbs)}, прилагательных - {len(self.adjectives)}")
-        except Exception as e:
-            logger.error(f"Ошибка загрузки словарей: {e}")
-            raise
+        # Промпт генерации текущего цикла: сохраняется до запроса, чтобы после сбоя повторить
+        # тот же промпт и получить ответ из кэша, а не платить за новый. Промпт годится
+        # только для того же дня генерации (cycle_prompt_day, ISO), иначе строится заново
+        self.cycle_prompt: Optional[str] = None
+        self.cycle_prompt_day: Optional[str] = None
+
+        # Таймер дедлайнов: спим до ближайшего события, а не опрашиваем часы каждую секунду
+        self.timer = timer or DeadlineTimer(get_moscow_time)
+        self.buffer = buffer  # Заранее сгенерированные пророчества (None - генерировать вживую)
+        self.state_store = state_store or StateStore(STATE_DB)
+        self.prophecy_log = prophecy_log or get_prophecy_log()
+        # Почти-повторы по всем лентам (пустой индекс ложен по len, поэтому сравнение с None)
+        self.similarity_index = similarity_index if similarity_index is not None else get_similarity_index()
+        self._retry_at: Dict[str, datetime] = {}  # Отложенные повторы после сбоев
+        # Вызывается, когда меняется потребность ленты в буфере (после публикации или взятия из буфера)
+        self.demand_listener: Optional[Callable[[], None]] = None
+
+        # Словари загружаются один раз, при первой выборке (не на старте)
+        self._vocabularies = vocabularies
+        self._samplers: Optional[Tuple["WordSampler", "WordSampler", "WordSampler"]] = None
+        self.sampling_pool = sampling_pool
+
+        # Цели публикации ленты; HTTP-сессии общие для всех лент процесса
+        self.publishers: List[Publisher] = []
+        if self.feed.tg_chat_id:
+            self.publishers.append(TelegramPublisher(self.feed.tg_chat_id, load_env_keys))
+        if self.feed.vk_group_id:
+            self.publishers.append(VkPublisher(self.feed.vk_group_id, load_env_keys))
+
+    @property
+    def vocabularies(self) -> Vocabularies:
+        if self._vocabularies is None:
+            self._vocabularies = get_vocabularies()
+        return self._vocabularies
+
+    @property
+    def nouns(self) -> Sequence[str]:
+        return self.vocabularies.nouns
+
+    @property
+    def verbs(self) -> Sequence[str]:
+        return self.vocabularies.verbs
+
+    @property
+    def adjectives(self) -> Sequence[str]:
+        return self.vocabularies.adjectives
+
+    def _get_samplers(self) -> Tuple["WordSampler", "WordSampler", "WordSampler"]:
+        # Выборка работает по индексам словарей, без списков строк
+        if self._samplers is None:
+            word_sampler = lazy_import('sampling').WordSampler
+            self._samplers = (word_sampler(self.nouns), word_sampler(self.verbs), word_sampler(self.adjectives))
+        return self._samplers
+
+    @property
+    def noun_sampler(self) -> "WordSampler":
+        return self._get_samplers()[0]
+
+    @property
+    def verb_sampler(self) -> "WordSampler":
+        return self._get_samplers()[1]
+
+    @property
+    def adjective_sampler(self) -> "WordSampler":
+        return self._get_samplers()[2]
 
     def save_state(self):
         """
-        Сохраняет текущее состояние в файл.
+        Сохраняет текущее состояние ленты в базу (атомарно, только если оно изменилось).
         Это позволяет восстановить состояние после перезапуска программы.
         """
         try:
@@ -297,29 +415,41 @@ class ProphecyScheduler:
                 'next_generation_time': self.next_generation_time.isoformat() if self.next_generation_time else None,
                 'current_prophecy': self.current_prophecy,
                 'is_generating': self.is_generating,
-                'generated_for_current_cycle': self.generated_for_current_cycle
+                'generated_for_current_cycle': self.generated_for_current_cycle,
+                'cycle_prompt': self.cycle_prompt,
+                'cycle_prompt_day': self.cycle_prompt_day
             }
 
-            with open(STATE_FILE, 'w', encoding='utf-8') as f:
-                json.dump(state, f, ensure_ascii=False, indent=2)
-
-            logger.debug(f"Состояние сохранено в {STATE_FILE}")
+            if self.state_store.save(self.feed.feed_id, state):
+                logger.debug(f"Состояние ленты {self.feed.feed_id} сохранено в {self.state_store.path}")
         except Exception as e:
             logger.error(f"Ошибка сохранения состояния: {e}")
 
+    def _load_legacy_state(self) -> Optional[dict]:
+        """Читает прежний JSON-файл состояния и переносит его в базу"""
+        if not os.path.exists(self.feed.state_file):
+            return None
+
+        with open(self.feed.state_file, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+
+        self.state_store.save(self.feed.feed_id, state)
+        logger.info(f"Состояние из {self.feed.state_file} перенесено в {self.state_store.path}")
+        return state
+
     def load_state(self) -> bool:
         """
-        Загружает состояние из файла, если он существует.
+        Загружает состояние ленты из базы (или из прежнего JSON-файла), если оно есть.
         Возвращает True, если состояние успешно загружено, False в противном случае.
         """
         try:
-            if not os.path.exists(STATE_FILE):
-                logger.info(f"Файл состояния {STATE_FILE} не найден, начинаем с нуля")
+            state = self.state_store.load(self.feed.feed_id)
+            if state is None:
+                state = self._load_legacy_state()
+            if state is None:
+                logger.info(f"Состояние ленты {self.feed.feed_id} не найдено, начинаем с нуля")
                 return False
 
-            with open(STATE_FILE, 'r', encoding='utf-8') as f:
-                state = json.load(f)
-
             # Восстанавливаем времена
             if state['next_publish_time']:
                 self.next_publish_time = datetime.fromisoformat(state['next_publish_time'])
@@ -330,8 +460,10 @@ class ProphecyScheduler:
             self.current_prophecy = state.get('current_prophecy')
             self.is_generating = state.get('is_generating', False)
             self.generated_for_current_cycle = state.get('generated_for_current_cycle', False)
+            self.cycle_prompt = state.get('cycle_prompt')
+            self.cycle_prompt_day = state.get('cycle_prompt_day')
 
-            logger.info(f"Состояние восстановлено из {STATE_FILE}")
+            logger.info(f"Состояние ленты {self.feed.feed_id} восстановлено из {self.state_store.path}")
             if self.next_publish_time:
                 logger.info(f"Следующая публикация: {format_moscow_time(self.next_publish_time)}")
             if self.next_generation_time:
@@ -376,7 +508,7 @@ class ProphecyScheduler:
 
             # Генерируем время следующей публикации (на завтра)
             self.next_publish_time = generate_next_publish_time()
-            self.next_generation_time = self.next_publish_time - timedelta(seconds=GENERATION_OFFSET)
+            self.next_generation_time = self.next_publish_time - timedelta(seconds=self.feed.generation_offset)
 
             # Сбрасываем флаг генерации для нового цикла
             self.generated_for_current_cycle = False
@@ -393,8 +525,8 @@ class ProphecyScheduler:
     async def _generate_and_publish_immediate(self):
         """Немедленная генерация и публикация пророчества (при старте программы)"""
         try:
-            # Генерируем пророчество
-            prophecy = await self._generate_prophecy()
+            # Генерируем пророчество (не похожее на прежние)
+            prophecy = await self._generate_unique_prophecy(publish_day(get_moscow_time().date()))
 
             # Генерируем время следующей публикации
             next_next_publish_time = self.next_publish_time
@@ -409,10 +541,8 @@ class ProphecyScheduler:
             self.save_state()
 
             # Логируем пророчество
-            with open("prophecies_log.txt", "a", encoding="utf-8") as log_file:
-                log_file.write(f"\n{format_moscow_time()} - ПЕРВОЕ ПРОРОЧЕСТВО\n")
-                log_file.write(f"Следующая публикация: {next_next_time_str}\n")
-                log_file.write(f"{prophecy}\n{'-' * 50}\n")
+            self.prophecy_log.record('first', self.feed.feed_id, prophecy=prophecy,
+                                     next_publish_time=next_next_publish_time.isoformat())
 
             # Публикуем
             await self._publish_prophecy(full_message)
@@ -423,34 +553,72 @@ class ProphecyScheduler:
         except Exception as e:
             logger.error(f"Ошибка при немедленной генерации и публикации: {e}")
 
+    def wake(self):
+        """Будит основной цикл (остановка или внешнее изменение состояния)"""
+        self.timer.wake()
+
+    def _schedule_events(self):
+        """Пересчитывает дедлайны генерации и публикации по текущему состоянию"""
+        generate_key = (self.feed.feed_id, 'generate')
+        if self.next_generation_time and not self.generated_for_current_cycle:
+            self.timer.schedule(generate_key, max(self.next_generation_time,
+                                                  self._retry_at.get('generate', self.next_generation_time)))
+        else:
+            self.timer.cancel(generate_key)
+
+        publish_key = (self.feed.feed_id, 'publish')
+        if self.current_prophecy and self.next_publish_time:
+            self.timer.schedule(publish_key, max(self.next_publish_time,
+                                                 self._retry_at.get('publish', self.next_publish_time)))
+        else:
+            self.timer.cancel(publish_key)
+
+    async def step(self):
+        """Выполняет наступившие события ленты и планирует следующие"""
+        now = get_moscow_time()
+
+        # Проверяем, пора ли генерировать следующее пророчество
+        # ВАЖНО: генерируем только если еще не генерировали для текущего цикла
+        if (self.next_generation_time and
+            now >= self.next_generation_time and
+            not self.is_generating and
+            not self.generated_for_current_cycle):
+            logger.info(f"Пора генерировать следующее пророчество!")
+            await self._generate_next_prophecy()
+            self._track_retry('generate', not self.generated_for_current_cycle)
+
+        # Проверяем, пора ли публиковать
+        if self.current_prophecy and self.next_publish_time and now >= self.next_publish_time:
+            logger.info(f"Пора публиковать пророчество!")
+            await self._publish_scheduled_prophecy()
+            self._track_retry('publish', self.current_prophecy is not None and now >= self.next_publish_time)
+
+        self._schedule_events()
+
     async def run(self):
         """Основной цикл планировщика"""
         logger.info("Запуск основного цикла планировщика...")
 
+        self._schedule_events()
         while not stop_flag:
-            now = get_moscow_time()
-
-            # Проверяем, пора ли генерировать следующее пророчество
-            # ВАЖНО: генерируем только если еще не генерировали для текущего цикла
-            if (self.next_generation_time and
-                now >= self.next_generation_time and
-                not self.is_generating and
-                not self.generated_for_current_cycle):
-                logger.info(f"Пора генерировать следующее пророчество!")
-                await self._generate_next_prophecy()
+            # Спим до ближайшего дедлайна или досрочного пробуждения
+            await self.timer.wait_due()
+            if stop_flag:
+                break
 
-            # Проверяем, пора ли публиковать
-            if self.current_prophecy and self.next_publish_time and now >= self.next_publish_time:
-                logger.info(f"Пора публиковать пророчество!")
-                await self._publish_scheduled_prophecy()
-
-            # Точное ожидание 1 секунды
-            await asyncio.sleep(1)
+            await self.step()
 
         # Сохраняем состояние при выходе
         logger.info("Сохранение состояния перед выходом...")
         self.save_state()
 
+    def _track_retry(self, kind: str, failed: bool):
+        """Откладывает повтор после сбоя, чтобы просроченный дедлайн не крутил цикл вхолостую"""
+        if failed:
+            self._retry_at[kind] = get_moscow_time() + timedelta(seconds=RETRY_DELAY)
+        else:
+            self._retry_at.pop(kind, None)
+
     async def _generate_next_prophecy(self):
         """Генерация следующего пророчества по расписанию"""
         self.is_generating = True
@@ -459,8 +627,14 @@ class ProphecyScheduler:
         try:
             logger.info("Начало генерации пророчества по расписанию...")
 
-            # Генерируем пророчество
-            prophecy = await self._generate_prophecy()
+            # Берём заранее сгенерированное пророчество на день публикации, иначе генерируем вживую
+            prophecy = None
+            if self.buffer is not None:
+                prophecy = self.buffer.take(self.next_publish_time.date(), get_moscow_time())
+                if prophecy:
+                    logger.info("Пророчество взято из буфера")
+                    self._demand_changed()
+            prophecy = await self._generate_unique_prophecy(self.next_publish_time, prophecy)
 
             # Определяем время СЛЕДУЮЩЕЙ публикации (после той, которая сейчас запланирована)
             next_next_publish_time = generate_next_publish_time()
@@ -476,14 +650,13 @@ class ProphecyScheduler:
             self.save_state()  # Сохраняем сгенерированное пророчество
 
             logger.info(f"Пророчество сгенерировано, готово к публикации в {current_publish_time_str}")
+            observe_slack(self.feed.feed_id, (self.next_publish_time - get_moscow_time()).total_seconds())
             logger.info(f"Следующее пророчество после этой публикации будет в {next_next_time_str}")
 
             # Логируем сгенерированное пророчество
-            with open("prophecies_log.txt", "a", encoding="utf-8") as log_file:
-                log_file.write(f"\n{format_moscow_time()} - СГЕНЕРИРОВАНО ДЛЯ ПУБЛИКАЦИИ\n")
-                log_file.write(f"Время публикации: {current_publish_time_str}\n")
-                log_file.write(f"Следующая публикация: {next_next_time_str}\n")
-                log_file.write(f"{prophecy}\n{'-' * 50}\n")
+            self.prophecy_log.record('generated', self.feed.feed_id, day=self.next_publish_time.date().isoformat(),
+                                     prophecy=prophecy, publish_time=self.next_publish_time.isoformat(),
+                                     next_publish_time=next_next_publish_time.isoformat())
 
         except Exception as e:
             logger.error(f"Ошибка генерации пророчества: {e}")
@@ -493,44 +666,137 @@ class ProphecyScheduler:
             self.is_generating = False
             self.save_state()
 
-    async def _generate_prophecy(self) -> str:
-        """Генерация пророчества на основе случайных слов"""
-        try:
-            # Генерация случайных выборок
+    def _demand_changed(self):
+        if self.demand_listener is not None:
+            self.demand_listener()
+
+    def pending_publish_dates(self) -> Dict[date, int]:
+        """Дни предстоящих публикаций, для которых пророчество ещё не сгенерировано"""
+        if self.next_publish_time and not self.generated_for_current_cycle:
+            return {self.next_publish_time.date(): 1}
+        return {}
+
+    async def pregenerate(self, day: date) -> Optional[str]:
+        """Генерация текста пророчества на день day для буфера (None при неудаче)"""
+        prophecy = await self._generate_prophecy(publish_day(day))
+        if prophecy in FALLBACK_PROPHECIES:
+            return None
+        return prophecy
+
+    async def sample_words(self, sample_size: int) -> Tuple["SampleSummary", "SampleSummary", "SampleSummary"]:
+        """Выборка и частотный анализ трёх частей речи: в пуле процессов, если он есть"""
+        if self.sampling_pool is not None:
+            summaries = await self.sampling_pool.summarize_all(SAMPLING_PARTS, sample_size)
+            return summaries['nouns'], summaries['verbs'], summaries['adjectives']
+
+        return (self.noun_sampler.summarize(sample_size), self.verb_sampler.summarize(sample_size),
+                self.adjective_sampler.summarize(sample_size))
+
+    async def build_prompt(self, day: Optional[datetime] = None, sample_size: Optional[int] = None) -> str:
+        """
+        Промпт из случайных слов на день day: выборка, частотный анализ и запись в журнал.
+        sample_size по умолчанию выбирается случайно от 100 до 20000.
+        """
+        # Генерация случайных выборок
+        if sample_size is None:
             sample_size = random.randint(100, 20000)
 
-            # Создание случайных выборок
-            noun_samples = [random.choice(self.nouns) for _ in range(sample_size)]
-            verb_samples = [random.choice(self.verbs) for _ in range(sample_size)]
-            adjective_samples = [random.choice(self.adjectives) for _ in range(sample_size)]
+        # Выборка и частотный анализ по индексам словарей
+        nouns, verbs, adjectives = await self.sample_words(sample_size)
 
-            # Анализ частотности
-            choice_nouns, rare_nouns = optimized_choice_lst(noun_samples)
-            choice_verbs, rare_verbs = optimized_choice_lst(verb_samples)
-            choice_adjectives, rare_adjectives = optimized_choice_lst(adjective_samples)
+        top_nouns, rare_nouns = nouns.top, nouns.rare
+        top_verbs, rare_verbs = verbs.top, verbs.rare
+        top_adjectives, rare_adjectives = adjectives.top, adjectives.rare
 
-            top_nouns = create_dct(choice_nouns)
-            top_verbs = create_dct(choice_verbs)
-            top_adjectives = create_dct(choice_adjectives)
-
-            # Формирование промпта
+        # Формирование промпта
+        with STAGE_SECONDS.time(stage='prompt'):
             prompt = f"Существительные: {top_nouns} / {rare_nouns}\n" \
                      f"Глаголы: {top_verbs} / {rare_verbs}\n" \
                      f"Прилагательные: {top_adjectives} / {rare_adjectives}"
 
-            # Логирование промпта
-            with open("prophecies_log.txt", "a", encoding="utf-8") as log_file:
-                log_file.write(f"\n{format_moscow_time()} - ГЕНЕРАЦИЯ\n{prompt}\n{'+' * 50}\n")
+        # Логирование промпта
+        self.prophecy_log.record('prompt', self.feed.feed_id, day=day.date().isoformat() if day else None,
+                                 prompt=prompt, sample_size=sample_size)
+        return prompt
+
+    async def _generate_prophecy(self, day: Optional[datetime] = None, sample_size: Optional[int] = None,
+                                 prompt: Optional[str] = None) -> str:
+        """
+        Генерация пророчества на основе случайных слов (на день day, по умолчанию - текущий).
+        prompt - готовый промпт (выборка слов не выполняется).
+        """
+        try:
+            if prompt is None:
+                prompt = await self.build_prompt(day, sample_size)
 
-            # Получение ответа от OpenAI (синхронно в отдельном потоке)
-            loop = asyncio.get_event_loop()
-            prophecy = await loop.run_in_executor(None, get_openai_response, prompt)
+            # Получение ответа от OpenAI (асинхронно, без занятия потока пула)
+            prophecy = await get_openai_response_async(prompt, day=day)
 
             return prophecy
 
         except Exception as e:
             logger.error(f"Ошибка в процессе генерации: {e}")
-            return "Пророчество не удалось сгенерировать. Попробуйте позже."
+            return GENERATION_ERROR_PROPHECY
+
+    async def _generate_unique_prophecy(self, day: datetime, candidate: Optional[str] = None) -> str:
+        """
+        Пророчество на день day, не похожее на прежние пророчества всех лент.
+        Кандидат (например, из буфера) или свежая генерация проверяется по индексу похожести;
+        слишком близкий текст генерируется заново, не больше DUPLICATE_MAX_ATTEMPTS раз.
+        Принятый текст добавляется в индекс.
+        """
+        prophecy = candidate or await self._generate_cycle_prophecy(day)
+        attempts = 0
+        while prophecy not in FALLBACK_PROPHECIES:
+            # Своё пророчество на этот день - ответ, полученный до сбоя, а не повтор
+            match = self.similarity_index.nearest(prophecy, exclude=(self.feed.feed_id, day.date().isoformat()))
+            if match is None:
+                break
+            if attempts >= DUPLICATE_MAX_ATTEMPTS:
+                logger.warning(f"После {attempts} повторных генераций пророчество всё ещё похоже на прежнее, "
+                               f"оставляем последний вариант")
+                break
+
+            attempts += 1
+            logger.warning(f"Пророчество похоже на пророчество ленты {match.feed_id} на {match.day} "
+                           f"(сходство {match.similarity:.2f}), генерируем заново")
+            self.prophecy_log.record('duplicate', self.feed.feed_id, day=day.date().isoformat(), prophecy=prophecy,
+                                     similar_feed_id=match.feed_id, similar_day=match.day,
+                                     similarity=match.similarity)
+            self._drop_cycle_prompt()
+            prophecy = await self._generate_cycle_prophecy(day)
+
+        if prophecy not in FALLBACK_PROPHECIES:
+            self.similarity_index.add(prophecy, self.feed.feed_id, day.date().isoformat())
+        self._drop_cycle_prompt()
+        return prophecy
+
+    def _drop_cycle_prompt(self):
+        """Забывает промпт цикла и его день"""
+        self.cycle_prompt = None
+        self.cycle_prompt_day = None
+
+    async def _generate_cycle_prophecy(self, day: datetime) -> str:
+        """
+        Генерация для текущего цикла: промпт сохраняется в состоянии вместе с днём до запроса
+        к OpenAI. Промпт, сохранённый для другого дня (например, для немедленной публикации,
+        прерванной сбоем), отбрасывается.
+        """
+        if self.cycle_prompt is not None and self.cycle_prompt_day != day.isoformat():
+            logger.info("Сохранённый промпт относится к другому дню, строим новый")
+            self._drop_cycle_prompt()
+
+        if self.cycle_prompt is None:
+            try:
+                self.cycle_prompt = await self.build_prompt(day)
+            except Exception as e:
+                logger.error(f"Ошибка в процессе генерации: {e}")
+                return GENERATION_ERROR_PROPHECY
+            self.cycle_prompt_day = day.isoformat()
+            self.save_state()
+        else:
+            logger.info("Повторяем промпт, сохранённый до перезапуска")
+        return await self._generate_prophecy(day, prompt=self.cycle_prompt)
 
     async def _publish_scheduled_prophecy(self):
         """Публикация запланированного пророчества"""
@@ -540,14 +806,16 @@ class ProphecyScheduler:
                 return
 
             logger.info(f"Публикация запланированного пророчества...")
+            lag = (get_moscow_time() - self.next_publish_time).total_seconds()
+            PUBLISH_LAG_SECONDS.observe(max(lag, 0.0), feed=self.feed.feed_id)
 
             # Публикуем
-            await self._publish_prophecy(self.current_prophecy)
+            await self._publish_prophecy(self.current_prophecy, self.next_publish_time)
 
             # Определяем время следующей публикации
             next_next_publish_time = generate_next_publish_time()
             self.next_publish_time = next_next_publish_time
-            self.next_generation_time = self.next_publish_time - timedelta(seconds=GENERATION_OFFSET)
+            self.next_generation_time = self.next_publish_time - timedelta(seconds=self.feed.generation_offset)
 
             # Очищаем текущее пророчество и сбрасываем флаг генерации
             self.current_prophecy = None
@@ -555,6 +823,7 @@ class ProphecyScheduler:
 
             # Сохраняем новое состояние
             self.save_state()
+            self._demand_changed()
 
             logger.info(
                 f"Следующее пророчество запланировано: генерация в {format_moscow_time(self.next_generation_time)}, публикация в {format_moscow_time(self.next_publish_time)}")
@@ -562,23 +831,33 @@ class ProphecyScheduler:
         except Exception as e:
             logger.error(f"Ошибка публикации пророчества: {e}")
 
-    async def _publish_prophecy(self, message: str):
-        """Публикация пророчества в соцсети"""
+    @staticmethod
+    def _publish_deadline(publish_time: Optional[datetime]) -> float:
+        """
+        Срок ожидания очереди лимита частоты (get_clock().monotonic()): PUBLISH_DEADLINE
+        от назначенного времени публикации, а не от начала отправки - опоздавшая публикация
+        не получает новые полчаса. Просроченная сильнее (публикация после перезапуска)
+        и немедленная (publish_time=None) отсчитывают срок от текущего момента.
+        """
+        remaining = PUBLISH_DEADLINE
+        if publish_time is not None:
+            remaining = (publish_time - get_moscow_time()).total_seconds() + PUBLISH_DEADLINE
+            if remaining <= 0:
+                remaining = PUBLISH_DEADLINE
+        return get_clock().monotonic() + remaining
+
+    async def _publish_prophecy(self, message: str, publish_time: Optional[datetime] = None):
+        """Публикация пророчества в соцсети; publish_time - назначенное время (см. _publish_deadline)"""
         try:
-            # Отправка в социальные сети
-            success_count = 0
-            if send_to_telegram(message):
-                success_count += 1
-            if send_to_vk(message):
-                success_count += 1
+            # Отправка во все социальные сети одновременно, без блокировки цикла событий
+            results = await publish_all(self.publishers, message, self._publish_deadline(publish_time))
+            success_count = sum(result.ok for result in results)
 
-            logger.info(f"Пророчество опубликовано в {success_count} из 2 социальных сетей")
+            logger.info(f"Пророчество опубликовано в {success_count} из {len(results)} социальных сетей")
 
             # Логирование публикации
-            with open("prophecies_log.txt", "a", encoding="utf-8") as log_file:
-                log_file.write(f"\n{format_moscow_time()} - ПУБЛИКАЦИЯ\n")
-                log_file.write(f"Опубликовано в {success_count} соцсетей\n")
-                log_file.write(f"{'-' * 50}\n")
+            self.prophecy_log.record('published', self.feed.feed_id, success_count=success_count,
+                                     targets={result.target: result.ok for result in results})
 
         except Exception as e:
             logger.error(f"Ошибка при публикации: {e}")
@@ -592,17 +871,38 @@ async def main():
     logger.info(f"Текущее время: {format_moscow_time()} МСК")
     logger.info(f"Генерация за {GENERATION_OFFSET} секунд до публикации")
 
+    sampling_pool = None
+    buffer = None
     try:
-        # Создаем планировщик
-        scheduler = ProphecyScheduler()
+        # Создаем планировщик с буфером заранее сгенерированных пророчеств
+        # и, если задан SAMPLING_WORKERS, с выборкой в пуле процессов.
+        # Словари планировщик загрузит при первой выборке
+        with startup.phase('scheduler'):
+            buffer = ProphecyBuffer(BUFFER_FILE)
+            sampling_pool = create_sampling_pool()
+            scheduler = ProphecyScheduler(buffer=buffer, sampling_pool=sampling_pool)
+            refiller = BufferRefiller(buffer, scheduler.pregenerate, scheduler.pending_publish_dates,
+                                      get_moscow_time, next_deadline=scheduler.timer.next_deadline)
+            scheduler.demand_listener = refiller.wake
+            # Метрики: METRICS_PORT - адрес /metrics, METRICS_FILE - файл снимка
+            exporter = MetricsExporter()
 
         # Инициализируем (восстанавливаем состояние или публикуем первое пророчество)
-        await scheduler.initialize()
+        with startup.phase('initialize'):
+            await scheduler.initialize()
+        logger.info(startup.report())
+
+        def on_stop():
+            scheduler.wake()
+            refiller.stop()
+            exporter.stop()
 
-        # Запускаем планировщик и слушатель ввода параллельно
+        # Запускаем планировщик, пополнение буфера, метрики и слушатель ввода параллельно
         await asyncio.gather(
             scheduler.run(),
-            async_input_listener()
+            refiller.run(lambda: stop_flag),
+            exporter.run(lambda: stop_flag),
+            async_input_listener(on_stop=on_stop)
         )
     except KeyboardInterrupt:
         logger.info("Программа остановлена по Ctrl+C")
@@ -610,6 +910,13 @@ async def main():
         logger.error(f"Критическая ошибка: {e}")
     finally:
         stop_flag = True
+        if sampling_pool is not None:
+            sampling_pool.close()
+        if buffer is not None:
+            buffer.close()
+        close_prophecy_log()
+        close_similarity_index()
+        close_response_cache()
         logger.info("Программа завершена")
 
 
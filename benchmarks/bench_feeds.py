@@ -0,0 +1,107 @@
+"""
+Память и CPU на одну дополнительную ленту в многоканальном планировщике.
+
+Отдельный запуск из корня репозитория: python benchmarks/bench_feeds.py --feeds 10 100 1000
+OpenAI, Telegram и VK заменены заглушками внутри процесса, состояние пишется во временный каталог.
+"""
+import argparse
+import asyncio
+import json
+import time
+import tracemalloc
+from datetime import timedelta
+from typing import Any, Dict, List
+
+from common import ai_prorok, seed_all, scratch_dir, stub_providers, result
+from ai_prorok import FeedConfig, load_vocabularies, get_moscow_time
+from feeds import FeedManager
+
+QUICK_FEED_COUNTS = [10, 100]
+FULL_FEED_COUNTS = [10, 100, 1000]
+
+
+def make_feeds(count: int):
+    return [FeedConfig(feed_id=f"feed{i}", tg_chat_id=f"@feed{i}", vk_group_id=-i - 1,
+                       state_file=f"state_{i}.json") for i in range(count)]
+
+
+async def measure(count: int, vocabularies, idle_seconds: float) -> dict:
+    """Создание лент, простой и один полный цикл генерации+публикации для count лент"""
+    ai_prorok.stop_flag = False
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    manager = FeedManager(make_feeds(count), vocabularies=vocabularies)
+    now = get_moscow_time()
+    for scheduler in manager.schedulers.values():
+        scheduler.next_publish_time = now + timedelta(days=1)
+        scheduler.next_generation_time = scheduler.next_publish_time - timedelta(seconds=600)
+    construct_seconds = time.perf_counter() - start
+    memory_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    # Простой: все дедлайны далеко, цикл должен спать
+    run_task = asyncio.create_task(manager.run())
+    cpu_start = time.process_time()
+    await asyncio.sleep(idle_seconds)
+    idle_cpu = time.process_time() - cpu_start
+
+    # Полный цикл: все ленты генерируют и публикуют прямо сейчас
+    now = get_moscow_time()
+    for scheduler in manager.schedulers.values():
+        scheduler.next_generation_time = now
+        scheduler.next_publish_time = now
+        scheduler._schedule_events()
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    while any(scheduler.next_publish_time <= now for scheduler in manager.schedulers.values()) \
+            or manager._running:
+        await asyncio.sleep(0.01)
+    cycle_cpu = time.process_time() - cpu_start
+    cycle_wall = time.perf_counter() - wall_start
+
+    ai_prorok.stop_flag = True
+    manager.wake()
+    await run_task
+
+    return {
+        'construct_seconds': construct_seconds,
+        'memory_bytes': memory_bytes,
+        'memory_bytes_per_feed': memory_bytes / count,
+        'idle_seconds': idle_seconds,
+        'idle_cpu_seconds': idle_cpu,
+        'idle_cpu_seconds_per_feed': idle_cpu / count,
+        'cycle_cpu_seconds': cycle_cpu,
+        'cycle_wall_seconds': cycle_wall,
+        'cycle_cpu_seconds_per_feed': cycle_cpu / count,
+    }
+
+
+def run(seed: int, quick: bool, counts: List[int] = None, idle_seconds: float = None) -> List[Dict[str, Any]]:
+    counts = counts or (QUICK_FEED_COUNTS if quick else FULL_FEED_COUNTS)
+    if idle_seconds is None:
+        idle_seconds = 1.0 if quick else 5.0
+
+    vocabularies = load_vocabularies()
+    stub_providers()
+    results = []
+    with scratch_dir():
+        for count in counts:
+            seed_all(seed)
+            results.append(result('feeds', {'feeds': count, 'seed': seed},
+                                  asyncio.run(measure(count, vocabularies, idle_seconds))))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--feeds', type=int, nargs='+', default=FULL_FEED_COUNTS)
+    parser.add_argument('--idle', type=float, default=2.0, help="длительность замера простоя, секунды")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.seed, False, args.feeds, args.idle), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Конвейер генерации: optimized_choice_lst, create_dct, WordSampler, SamplingPool и _generate_prophecy
+на разных размерах выборки и словаря.
+"""
+import asyncio
+import os
+import random
+from typing import Any, Dict, List
+
+from common import (ai_prorok, seed_all, synthetic_vocabulary, synthetic_vocabularies, scratch_dir,
+                    stub_providers, timed, result)
+from sampling import WordSampler, COLLECT_MODE_BATCH, COLLECT_MODE_ANALYTIC
+from sampling_pool import SamplingPool
+
+QUICK_SAMPLE_SIZES = [100, 1000, 10_000, 100_000]
+FULL_SAMPLE_SIZES = [100, 1000, 10_000, 100_000, 1_000_000, 10_000_000]
+QUICK_VOCAB_SIZES = [1000, 100_000]
+FULL_VOCAB_SIZES = [1000, 10_000, 100_000, 1_000_000]
+
+
+def repeats(sample_size: int) -> int:
+    """Меньше повторов для самых больших выборок"""
+    return 5 if sample_size <= 100_000 else 2
+
+
+def pool_sizes() -> List[int]:
+    """Один процесс и все ядра - чтобы видеть масштабирование"""
+    return sorted({1, os.cpu_count() or 1})
+
+
+def run(seed: int, quick: bool) -> List[Dict[str, Any]]:
+    sample_sizes = QUICK_SAMPLE_SIZES if quick else FULL_SAMPLE_SIZES
+    vocab_sizes = QUICK_VOCAB_SIZES if quick else FULL_VOCAB_SIZES
+    stub_providers()
+    results = []
+
+    for vocab_size in vocab_sizes:
+        vocabulary = synthetic_vocabulary(vocab_size)
+
+        for sample_size in sample_sizes:
+            params = {'vocab_size': vocab_size, 'sample_size': sample_size, 'seed': seed}
+            repeat = repeats(sample_size)
+
+            # Прежний путь: список строк + перебор + сортировка
+            seed_all(seed)
+            samples = random.choices(vocabulary, k=sample_size)
+            results.append(result('optimized_choice_lst', params,
+                                  timed(lambda: ai_prorok.optimized_choice_lst(samples), repeat)))
+            results.append(result('create_dct', params, timed(lambda: ai_prorok.create_dct(samples), repeat)))
+            del samples
+
+            for mode in (COLLECT_MODE_BATCH, COLLECT_MODE_ANALYTIC):
+                sampler = WordSampler(vocabulary, seed_all(seed), mode=mode)
+                results.append(result(f'word_sampler_{mode}', params,
+                                      timed(lambda: sampler.summarize(sample_size), repeat)))
+
+    # Три части речи в пуле процессов (время старта пула не входит в замер)
+    for vocab_size in vocab_sizes:
+        vocabulary = synthetic_vocabulary(vocab_size)
+        for workers in pool_sizes():
+            pool = SamplingPool({part: vocabulary for part in ai_prorok.SAMPLING_PARTS}, workers, seed=seed)
+            loop = asyncio.new_event_loop()
+            try:
+                loop.run_until_complete(pool.summarize_all(ai_prorok.SAMPLING_PARTS, 100))
+                for sample_size in sample_sizes:
+                    params = {'vocab_size': vocab_size, 'sample_size': sample_size, 'seed': seed, 'workers': workers}
+                    results.append(result('sampling_pool', params, timed(
+                        lambda: loop.run_until_complete(pool.summarize_all(ai_prorok.SAMPLING_PARTS, sample_size)),
+                        repeats(sample_size))))
+            finally:
+                loop.close()
+                pool.close()
+
+    # Полная генерация промпта (OpenAI - заглушка) на общем планировщике
+    with scratch_dir():
+        for vocab_size in vocab_sizes:
+            scheduler = ai_prorok.ProphecyScheduler(vocabularies=synthetic_vocabularies(vocab_size))
+            for sampler in (scheduler.noun_sampler, scheduler.verb_sampler, scheduler.adjective_sampler):
+                sampler.rng = seed_all(seed)
+
+            loop = asyncio.new_event_loop()
+            try:
+                for sample_size in sample_sizes:
+                    params = {'vocab_size': vocab_size, 'sample_size': sample_size, 'seed': seed}
+                    results.append(result('generate_prophecy', params, timed(
+                        lambda: loop.run_until_complete(scheduler._generate_prophecy(sample_size=sample_size)),
+                        repeats(sample_size))))
+            finally:
+                loop.close()
+
+    return results
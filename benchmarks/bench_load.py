@@ -0,0 +1,131 @@
+"""
+Сквозная пропускная способность и хвостовые задержки цикла генерация+публикация.
+
+Отдельный запуск из корня репозитория: python benchmarks/bench_load.py --cycles 500 --concurrency 10 50
+Запросы идут настоящими клиентами OpenAI, Telegram и VK в локальный stub_server.py
+с заданной задержкой, долей ошибок и лимитом частоты. Ограничитель частоты клиентов
+настраивается на лимит заменителя (--no-client-limit - без него, только Retry-After).
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from common import ai_prorok, seed_all, scratch_dir, real_providers, result
+from config import get_config
+from publishers import TelegramPublisher, VkPublisher, publish_all
+from rate_limit import limiter, DEFAULT_LIMITS, RateLimit, SCOPE_OPENAI, SCOPE_TELEGRAM, SCOPE_TELEGRAM_CHAT, SCOPE_VK
+from stub_server import StubServer, StubSettings
+
+QUICK_CYCLES = 40
+FULL_CYCLES = 500
+QUICK_CONCURRENCY = [10]
+FULL_CONCURRENCY = [1, 10, 50]
+STUB_LATENCY = 0.05  # Средняя задержка ответа заменителя, секунды
+STUB_JITTER = 0.02
+CLIENT_RATE_MARGIN = 0.9  # Клиенты идут чуть медленнее лимита заменителя: окна у сторон не совпадают по фазе
+
+
+def write_env(url: str):
+    """Направляет все клиенты на заменитель через .env рабочего каталога"""
+    with open(".env", "w", encoding='utf-8') as fh:
+        fh.write(f"OPENAI_API_KEY=stub\nTG_TOKEN=stub\nVK_TOKEN=stub\n"
+                 f"OPENAI_BASE_URL={url}/openai/v1\nTG_API_URL={url}\nVK_API_URL={url}\n")
+
+
+async def measure(cycles: int, concurrency: int, settings: StubSettings) -> Dict[str, Any]:
+    """cycles циклов генерации и публикации, не более concurrency одновременно"""
+    server = StubServer(settings)
+    await server.start()
+    write_env(server.url)
+    get_config()
+
+    publishers = [TelegramPublisher("@load", ai_prorok.load_env_keys, retry_delay=0.1),
+                  VkPublisher(-1, ai_prorok.load_env_keys, retry_delay=0.1)]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    failures = 0
+
+    async def cycle():
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            # Кэш ответов отключён: все циклы должны доходить до заменителя
+            prophecy = await ai_prorok.get_openai_response_async("нагрузка", max_retries=3, cache=False)
+            results = await publish_all(publishers, prophecy)
+            latencies.append(time.perf_counter() - start)
+            if prophecy in ai_prorok.FALLBACK_PROPHECIES or not all(r.ok for r in results):
+                failures += 1
+
+    wall_start = time.perf_counter()
+    try:
+        await asyncio.gather(*(cycle() for _ in range(cycles)))
+    finally:
+        await server.stop()
+    wall = time.perf_counter() - wall_start
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        'wall_seconds': wall,
+        'cycles_per_second': cycles / wall,
+        'latency_p50_seconds': float(p50),
+        'latency_p95_seconds': float(p95),
+        'latency_p99_seconds': float(p99),
+        'latency_max_seconds': max(latencies),
+        'failed_cycles': failures,
+        'stub_stats': dict(server.stats),
+    }
+
+
+def configure_limiter(rate_limit: Optional[float]):
+    """Лимиты клиентов под заменитель: его лимит на провайдера (с запасом) или никаких"""
+    for scope in (SCOPE_OPENAI, SCOPE_TELEGRAM, SCOPE_VK):
+        limiter.configure(scope, RateLimit(rate_limit * CLIENT_RATE_MARGIN) if rate_limit else None)
+    limiter.configure(SCOPE_TELEGRAM_CHAT, None)
+
+
+def run(seed: int, quick: bool, cycles: int = None, concurrency: List[int] = None,
+        settings: StubSettings = None, client_limit: bool = True) -> List[Dict[str, Any]]:
+    cycles = cycles or (QUICK_CYCLES if quick else FULL_CYCLES)
+    concurrency = concurrency or (QUICK_CONCURRENCY if quick else FULL_CONCURRENCY)
+    settings = settings or StubSettings(latency=STUB_LATENCY, jitter=STUB_JITTER)
+
+    real_providers()
+    configure_limiter(settings.rate_limit if client_limit else None)
+    results = []
+    try:
+        with scratch_dir():
+            for level in concurrency:
+                seed_all(seed)
+                params = {'cycles': cycles, 'concurrency': level, 'seed': seed, 'latency': settings.latency,
+                          'jitter': settings.jitter, 'error_rate': settings.error_rate,
+                          'rate_limit': settings.rate_limit, 'client_limit': client_limit}
+                results.append(result('load', params, asyncio.run(measure(cycles, level, settings))))
+    finally:
+        for scope, limit in DEFAULT_LIMITS.items():
+            limiter.configure(scope, limit)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cycles', type=int, default=FULL_CYCLES)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=FULL_CONCURRENCY)
+    parser.add_argument('--latency', type=float, default=STUB_LATENCY)
+    parser.add_argument('--jitter', type=float, default=STUB_JITTER)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=float, default=None)
+    parser.add_argument('--no-client-limit', action='store_true', help="без ограничителя частоты клиентов")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    settings = StubSettings(args.latency, args.jitter, args.error_rate, args.rate_limit)
+    print(json.dumps(run(args.seed, False, args.cycles, args.concurrency, settings, not args.no_client_limit),
+                     ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
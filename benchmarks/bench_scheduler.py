@@ -0,0 +1,76 @@
+"""
+Планировщик: время старта ProphecyScheduler до первой выборки (JSON и скомпилированные словари)
+и CPU в простое основного цикла.
+"""
+import asyncio
+import os
+import shutil
+import time
+from datetime import timedelta
+from typing import Any, Dict, List
+
+from common import ROOT, ai_prorok, seed_all, scratch_dir, stub_providers, timed, result
+from vocab import compile_vocabulary
+
+VOCAB_FILES = ["nouns.json", "verbs.json", "adject.json"]
+STARTUP_SAMPLE_SIZE = 100  # Первая выборка - маленькая: замеряется загрузка словарей, а не перебор
+
+
+def startup(repeat: int) -> Dict[str, float]:
+    """
+    Создание планировщика и первая выборка. Словари загружаются лениво, при первой выборке,
+    поэтому общая копия процесса сбрасывается перед каждым повтором: иначе замерялся бы
+    только пустой конструктор.
+    """
+    loop = asyncio.new_event_loop()
+
+    def first_sample():
+        ai_prorok._shared_vocabularies = None
+        scheduler = ai_prorok.ProphecyScheduler()
+        loop.run_until_complete(scheduler.sample_words(STARTUP_SAMPLE_SIZE))
+
+    try:
+        return timed(first_sample, repeat)
+    finally:
+        loop.close()
+        ai_prorok._shared_vocabularies = None
+
+
+async def idle_cpu(seconds: float) -> Dict[str, float]:
+    """CPU основного цикла, когда ближайший дедлайн далеко"""
+    ai_prorok.stop_flag = False
+    scheduler = ai_prorok.ProphecyScheduler()
+    scheduler.next_publish_time = ai_prorok.get_moscow_time() + timedelta(hours=12)
+    scheduler.next_generation_time = scheduler.next_publish_time - timedelta(seconds=ai_prorok.GENERATION_OFFSET)
+
+    task = asyncio.create_task(scheduler.run())
+    await asyncio.sleep(0.1)
+    cpu_start = time.process_time()
+    await asyncio.sleep(seconds)
+    cpu = time.process_time() - cpu_start
+
+    ai_prorok.stop_flag = True
+    scheduler.wake()
+    await task
+    return {'idle_seconds': seconds, 'cpu_seconds': cpu, 'cpu_fraction': cpu / seconds}
+
+
+def run(seed: int, quick: bool) -> List[Dict[str, Any]]:
+    seed_all(seed)
+    stub_providers()
+    repeat = 3 if quick else 10
+    results = []
+
+    with scratch_dir() as workdir:
+        for name in VOCAB_FILES:
+            shutil.copy(os.path.join(ROOT, name), workdir)
+        results.append(result('scheduler_startup', {'vocabulary': 'json'}, startup(repeat)))
+
+        for name in VOCAB_FILES:
+            compile_vocabulary(name)
+        results.append(result('scheduler_startup', {'vocabulary': 'compiled'}, startup(repeat)))
+
+        seconds = 2.0 if quick else 10.0
+        results.append(result('scheduler_idle_cpu', {'seconds': seconds}, asyncio.run(idle_cpu(seconds))))
+
+    return results
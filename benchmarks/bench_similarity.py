@@ -0,0 +1,49 @@
+"""
+Индекс похожести: время проверки кандидата (nearest) и добавления (add) при разном объёме истории.
+"""
+import random
+from typing import Any, Dict, List
+
+from common import seed_all, synthetic_vocabulary, scratch_dir, timed, result
+from similarity import SimilarityIndex
+
+QUICK_HISTORY_SIZES = [1000, 10_000]
+FULL_HISTORY_SIZES = [1000, 10_000, 100_000, 1_000_000]  # 10^6 - несколько лет сотен лент
+TEXT_WORDS = 40  # Слов в искусственном пророчестве
+VOCAB_SIZE = 5000
+INSERT_BATCH = 10_000
+
+
+def synthetic_text(vocabulary: List[str]) -> str:
+    return " ".join(random.choices(vocabulary, k=TEXT_WORDS))
+
+
+def run(seed: int, quick: bool) -> List[Dict[str, Any]]:
+    sizes = QUICK_HISTORY_SIZES if quick else FULL_HISTORY_SIZES
+    vocabulary = synthetic_vocabulary(VOCAB_SIZE)
+    results = []
+
+    with scratch_dir():
+        seed_all(seed)
+        index = SimilarityIndex("bench_similarity.db")
+        try:
+            history = 0
+            for size in sizes:
+                # История наращивается пачками до нужного объёма
+                while history < size:
+                    batch = min(INSERT_BATCH, size - history)
+                    index.add_many((synthetic_text(vocabulary), f"feed{i % 100}", "2024-01-01") for i in range(batch))
+                    history += batch
+
+                params = {'history': size, 'seed': seed}
+                known, fresh = synthetic_text(vocabulary), synthetic_text(vocabulary)
+                index.add(known, "bench", "2024-01-02")
+                results.append(result('similarity_nearest_miss', params, timed(lambda: index.nearest(fresh), 20)))
+                results.append(result('similarity_nearest_hit', params, timed(lambda: index.nearest(known), 20)))
+                results.append(result('similarity_add', params,
+                                      timed(lambda: index.add(synthetic_text(vocabulary), "bench", "2024-01-02"), 20)))
+                history = len(index)
+        finally:
+            index.close()
+
+    return results
@@ -0,0 +1,126 @@
+"""Общие помощники бенчмарков: заглушки сервисов, сид, замер времени, метаданные."""
+import itertools
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import ai_prorok  # noqa: E402
+import publishers  # noqa: E402
+from prophecy_log import close_prophecy_log  # noqa: E402
+from similarity import close_similarity_index  # noqa: E402
+from response_cache import close_response_cache  # noqa: E402
+from rate_limit import limiter, DEFAULT_LIMITS  # noqa: E402
+from ai_prorok import Vocabularies  # noqa: E402
+
+
+# Настоящие клиенты сервисов - для замеров против stub_server.py после stub_providers()
+_REAL_PROVIDERS = (ai_prorok.get_openai_response_async, publishers.TelegramPublisher.send,
+                   publishers.VkPublisher.send, publishers.Publisher.token)
+
+
+def stub_providers():
+    """Заменяет OpenAI, Telegram и VK заглушками внутри процесса (без токенов и лимитов частоты)"""
+    numbers = itertools.count(1)
+
+    async def openai_stub(prompt, max_retries=3, day=None, **kwargs):
+        # Номер делает тексты разными: иначе индекс похожести отправлял бы их на повторную генерацию
+        return f"Пророчество-заглушка {next(numbers)}"
+
+    ai_prorok.get_openai_response_async = openai_stub
+    publishers.TelegramPublisher.send = lambda self, message: {'ok': True}
+    publishers.VkPublisher.send = lambda self, message: {'post_id': 1}
+    publishers.Publisher.token = lambda self: "stub"
+    for scope in DEFAULT_LIMITS:
+        limiter.configure(scope, None)
+
+
+def real_providers():
+    """Возвращает настоящие клиенты OpenAI, Telegram и VK"""
+    (ai_prorok.get_openai_response_async, publishers.TelegramPublisher.send,
+     publishers.VkPublisher.send, publishers.Publisher.token) = _REAL_PROVIDERS
+    for scope, limit in DEFAULT_LIMITS.items():
+        limiter.configure(scope, limit)
+
+
+def seed_all(seed: int) -> np.random.Generator:
+    """Фиксирует random и возвращает генератор numpy с тем же сидом"""
+    random.seed(seed)
+    return np.random.default_rng(seed)
+
+
+def synthetic_vocabulary(size: int) -> List[str]:
+    """Искусственный словарь заданного размера"""
+    return [f"слово{i}" for i in range(size)]
+
+
+def synthetic_vocabularies(size: int) -> Vocabularies:
+    words = synthetic_vocabulary(size)
+    return Vocabularies(nouns=words, verbs=words, adjectives=words)
+
+
+@contextmanager
+def scratch_dir():
+    """Временный рабочий каталог: состояние, журналы и буферы не попадают в репозиторий"""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            yield workdir
+        finally:
+            # Общие журнал пророчеств, индекс похожести и кэш ответов привязаны к каталогу - закрываем вместе с ним
+            close_prophecy_log()
+            close_similarity_index()
+            close_response_cache()
+            os.chdir(cwd)
+
+
+def timed(func: Callable[[], Any], repeat: int = 5) -> Dict[str, float]:
+    """Время выполнения func: минимум, медиана и максимум по repeat запускам"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return {
+        'repeat': repeat,
+        'min_seconds': min(samples),
+        'median_seconds': statistics.median(samples),
+        'max_seconds': max(samples),
+    }
+
+
+def result(benchmark: str, params: Dict[str, Any], measurements: Dict[str, Any]) -> Dict[str, Any]:
+    """Одна запись результата в машиночитаемом виде"""
+    return {'benchmark': benchmark, 'params': params, **measurements}
+
+
+def environment() -> Dict[str, Any]:
+    """Метаданные запуска для сравнения результатов между версиями"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+
+    return {
+        'commit': commit,
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
@@ -0,0 +1,62 @@
+"""
+Запуск набора бенчмарков без сети: OpenAI, Telegram и VK заменены заглушками
+(в наборе load - локальным stub_server.py).
+
+    python benchmarks/run.py                       # все наборы, быстрый режим
+    python benchmarks/run.py --full --seed 7 -o bench.json
+    python benchmarks/run.py --suite generation scheduler
+
+Результат - JSON с метаданными окружения (коммит, версии, процессор) и списком замеров,
+пригодный для сравнения между версиями.
+"""
+import argparse
+import importlib
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import environment  # noqa: E402
+
+SUITES = {
+    'generation': 'bench_generation',
+    'scheduler': 'bench_scheduler',
+    'feeds': 'bench_feeds',
+    'load': 'bench_load',
+    'similarity': 'bench_similarity',
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--suite', nargs='+', choices=sorted(SUITES), default=list(SUITES),
+                        help="какие наборы запускать")
+    parser.add_argument('--seed', type=int, default=1, help="сид генераторов случайных чисел")
+    parser.add_argument('--full', action='store_true',
+                        help="полные диапазоны: выборки до 10^7, словари до 10^6")
+    parser.add_argument('-o', '--output', help="файл для JSON-результата (по умолчанию - stdout)")
+    args = parser.parse_args()
+
+    # Логи планировщика не нужны в выводе замеров
+    logging.getLogger().setLevel(logging.WARNING)
+
+    report = {'environment': environment(), 'seed': args.seed, 'full': args.full, 'suites': {}}
+    for name in args.suite:
+        start = time.perf_counter()
+        module = importlib.import_module(SUITES[name])
+        report['suites'][name] = module.run(args.seed, quick=not args.full)
+        print(f"{name}: {time.perf_counter() - start:.1f} с", file=sys.stderr)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as fh:
+            fh.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
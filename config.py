@@ -0,0 +1,116 @@
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from dotenv import dotenv_values
+
+logger = logging.getLogger(__name__)
+
+ENV_FILE = ".env"
+
+# Адреса сервисов по умолчанию; переопределяются одноимёнными переменными .env
+# (например, чтобы направить трафик на локальный stub_server.py)
+OPENAI_BASE_URL = "https://api.proxyapi.ru/openai/v1"
+TG_API_URL = "https://api.telegram.org"
+VK_API_URL = "https://api.vk.ru"
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    """Неизменяемый снимок ключей; читатели получают его целиком, без гонок с перезагрузкой"""
+    openai_api_key: Optional[str] = None
+    vk_token: Optional[str] = None
+    tg_token: Optional[str] = None
+    openai_base_url: str = OPENAI_BASE_URL
+    tg_api_url: str = TG_API_URL
+    vk_api_url: str = VK_API_URL
+
+    def keys(self) -> Dict[str, Optional[str]]:
+        """Ключи и адреса в формате load_env_keys"""
+        return {
+            'OPENAI_API_KEY': self.openai_api_key,
+            'VK_TOKEN': self.vk_token,
+            'TG_TOKEN': self.tg_token,
+            'OPENAI_BASE_URL': self.openai_base_url,
+            'TG_API_URL': self.tg_api_url,
+            'VK_API_URL': self.vk_api_url
+        }
+
+
+class ConfigCache:
+    """
+    Кеш конфигурации из .env. Файл перечитывается только когда меняются
+    его mtime, inode или размер (проверка через os.stat), так что правка .env
+    во время работы по-прежнему подхватывается, но без разбора файла на каждом вызове.
+    Подписчики on_change узнают о смене ключей и пересоздают свои клиенты.
+    """
+
+    def __init__(self, path: str = ENV_FILE):
+        self.path = path
+        self._signature: Optional[Tuple[int, int, int]] = None
+        self._snapshot: Optional[ConfigSnapshot] = None
+        self._listeners: List[Callable[[ConfigSnapshot, ConfigSnapshot], None]] = []
+        self._lock = threading.Lock()
+
+    def _stat_signature(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_ino, stat.st_size
+
+    def get(self) -> ConfigSnapshot:
+        """Текущий снимок; перечитывает .env только если файл изменился"""
+        signature = self._stat_signature()
+        snapshot = self._snapshot
+        if snapshot is not None and signature == self._signature:
+            return snapshot
+
+        with self._lock:
+            if self._snapshot is not None and signature == self._signature:
+                return self._snapshot
+
+            old = self._snapshot
+            self._snapshot = self._load()
+            self._signature = signature
+            new = self._snapshot
+
+        if old is not None and old != new:
+            logger.info("Обнаружены изменения ключей в .env")
+            for listener in list(self._listeners):
+                try:
+                    listener(old, new)
+                except Exception as e:
+                    logger.error(f"Ошибка обработчика смены конфигурации: {e}")
+        return new
+
+    def _load(self) -> ConfigSnapshot:
+        """Разбирает .env; значения из файла переопределяют окружение, как load_dotenv(override=True)"""
+        values = dotenv_values(self.path) if os.path.exists(self.path) else {}
+        for key, value in values.items():
+            if value is not None:
+                os.environ[key] = value
+
+        logger.debug(f"Конфигурация загружена из {self.path}")
+        return ConfigSnapshot(
+            openai_api_key=os.getenv('OPENAI_API_KEY'),
+            vk_token=os.getenv('VK_TOKEN'),
+            tg_token=os.getenv('TG_TOKEN'),
+            openai_base_url=(os.getenv('OPENAI_BASE_URL') or OPENAI_BASE_URL).rstrip('/'),
+            tg_api_url=(os.getenv('TG_API_URL') or TG_API_URL).rstrip('/'),
+            vk_api_url=(os.getenv('VK_API_URL') or VK_API_URL).rstrip('/')
+        )
+
+    def on_change(self, listener: Callable[[ConfigSnapshot, ConfigSnapshot], None]):
+        """Подписка на смену ключей: listener(старый снимок, новый снимок)"""
+        self._listeners.append(listener)
+
+
+config_cache = ConfigCache()
+
+
+def get_config() -> ConfigSnapshot:
+    """Снимок конфигурации процесса"""
+    return config_cache.get()
@@ -0,0 +1,200 @@
+import asyncio
+import json
+import logging
+import sys
+from datetime import date
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+import ai_prorok
+import startup
+from ai_prorok import (FeedConfig, ProphecyScheduler, Vocabularies, create_sampling_pool,
+                       get_moscow_time, format_moscow_time, async_input_listener)
+from scheduling import DeadlineTimer
+from prophecy_buffer import ProphecyBuffer, BufferRefiller
+from state_store import StateStore, STATE_DB
+from prophecy_log import close_prophecy_log
+from similarity import SimilarityIndex, close_similarity_index
+from response_cache import close_response_cache
+from metrics import MetricsExporter
+
+if TYPE_CHECKING:
+    from sampling_pool import SamplingPool
+
+logger = logging.getLogger(__name__)
+
+FEEDS_FILE = "feeds.json"  # Конфигурация лент по умолчанию
+INIT_CONCURRENCY = 50  # Сколько лент инициализируются одновременно
+FEEDS_BUFFER_FILE = "prophecy_buffer_feeds.json"  # Общий буфер пророчеств всех лент
+
+
+def load_feed_configs(path: str = FEEDS_FILE) -> List[FeedConfig]:
+    """
+    Загружает список лент из JSON-файла вида
+    [{"feed_id": "main", "tg_chat_id": "@channel", "vk_group_id": -1, "generation_offset": 600}, ...]
+    Состояние хранится в общей базе; state_file (по умолчанию prophecy_state_<feed_id>.json)
+    нужен только для переноса прежнего JSON-состояния.
+    """
+    with open(path, "r", encoding='utf-8') as fh:
+        entries = json.load(fh)
+
+    configs = []
+    for entry in entries:
+        entry = dict(entry)
+        entry.setdefault('state_file', f"prophecy_state_{entry['feed_id']}.json")
+        configs.append(FeedConfig(**entry))
+    return configs
+
+
+class FeedManager:
+    """
+    Множество лент пророчеств в одном процессе: общий таймер дедлайнов,
+    одна копия словарей, одна база состояний и общие HTTP-пулы.
+    Каждая лента - отдельный ProphecyScheduler со своими целями, сдвигом и состоянием.
+    Буфер заранее сгенерированных пророчеств тоже общий: тексты привязаны только к дню,
+    как и пул процессов выборки.
+    """
+
+    def __init__(self, feeds: List[FeedConfig], vocabularies: Optional[Vocabularies] = None,
+                 buffer: Optional[ProphecyBuffer] = None, state_store: Optional[StateStore] = None,
+                 sampling_pool: Optional["SamplingPool"] = None, similarity_index: Optional[SimilarityIndex] = None):
+        # Без лент нечего публиковать, а генерации для буфера (pregenerate) нужна хотя бы одна
+        if not feeds:
+            raise ValueError("Список лент пуст: нужна хотя бы одна лента")
+
+        self.vocabularies = vocabularies  # None - общие словари процесса, загружаются при первой выборке
+        self.state_store = state_store or StateStore(STATE_DB)
+        self.timer = DeadlineTimer(get_moscow_time)
+        self.buffer = buffer
+        self.sampling_pool = sampling_pool
+        self.similarity_index = similarity_index
+        self.demand_listener: Optional[Callable[[], None]] = None  # См. ProphecyScheduler.demand_listener
+        self.schedulers: Dict[str, ProphecyScheduler] = {}
+        self._running: Dict[str, asyncio.Task] = {}
+
+        for feed in feeds:
+            self.add_feed(feed)
+
+    def add_feed(self, feed: FeedConfig) -> ProphecyScheduler:
+        """Добавляет ленту, разделяя с ней словари и таймер"""
+        if feed.feed_id in self.schedulers:
+            raise ValueError(f"Лента {feed.feed_id} уже добавлена")
+
+        scheduler = ProphecyScheduler(feed, vocabularies=self.vocabularies, timer=self.timer, buffer=self.buffer,
+                                      state_store=self.state_store, sampling_pool=self.sampling_pool,
+                                      similarity_index=self.similarity_index)
+        scheduler.demand_listener = self.demand_listener
+        self.schedulers[feed.feed_id] = scheduler
+        return scheduler
+
+    def set_demand_listener(self, listener: Optional[Callable[[], None]]):
+        """Подписывает все ленты (и добавленные позже) на изменения потребности в буфере"""
+        self.demand_listener = listener
+        for scheduler in self.schedulers.values():
+            scheduler.demand_listener = listener
+
+    def pending_publish_dates(self) -> Dict[date, int]:
+        """Суммарная потребность всех лент в пророчествах по дням"""
+        demand: Dict[date, int] = {}
+        for scheduler in self.schedulers.values():
+            for day, count in scheduler.pending_publish_dates().items():
+                demand[day] = demand.get(day, 0) + count
+        return demand
+
+    async def pregenerate(self, day: date) -> Optional[str]:
+        """Генерация текста для буфера; выборка слов не зависит от ленты"""
+        return await next(iter(self.schedulers.values())).pregenerate(day)
+
+    def wake(self):
+        """Будит общий цикл (остановка или внешнее изменение состояния)"""
+        self.timer.wake()
+
+    async def initialize(self):
+        """Инициализирует все ленты с ограничением параллелизма"""
+        semaphore = asyncio.Semaphore(INIT_CONCURRENCY)
+
+        async def init_one(scheduler: ProphecyScheduler):
+            async with semaphore:
+                try:
+                    await scheduler.initialize()
+                except Exception as e:
+                    logger.error(f"Ошибка инициализации ленты {scheduler.feed.feed_id}: {e}")
+
+        await asyncio.gather(*(init_one(scheduler) for scheduler in self.schedulers.values()))
+
+    async def run(self):
+        """Общий цикл: ждёт ближайший дедлайн любой ленты и запускает её шаг отдельной задачей"""
+        logger.info(f"Запуск планировщика для {len(self.schedulers)} лент...")
+
+        for scheduler in self.schedulers.values():
+            scheduler._schedule_events()
+
+        while not ai_prorok.stop_flag:
+            due = await self.timer.wait_due()
+            if ai_prorok.stop_flag:
+                break
+
+            for feed_id in {key[0] for key in due}:
+                # Медленная лента не задерживает остальные; повторный шаг не запускаем
+                if feed_id in self._running:
+                    continue
+                task = asyncio.create_task(self.schedulers[feed_id].step())
+                self._running[feed_id] = task
+                task.add_done_callback(lambda _, feed_id=feed_id: self._running.pop(feed_id, None))
+
+        if self._running:
+            await asyncio.gather(*self._running.values(), return_exceptions=True)
+
+        logger.info("Сохранение состояния лент перед выходом...")
+        for scheduler in self.schedulers.values():
+            scheduler.save_state()
+
+
+async def main(config_path: str = FEEDS_FILE):
+    """Запуск всех лент из файла конфигурации"""
+    logger.info(f"Запуск многоканального планировщика пророчеств (время МСК): {format_moscow_time()} МСК")
+
+    sampling_pool = None
+    buffer = None
+    try:
+        # Словари загрузятся при первой выборке (или сразу, если SAMPLING_WORKERS задаёт пул)
+        with startup.phase('scheduler'):
+            sampling_pool = create_sampling_pool()
+            buffer = ProphecyBuffer(FEEDS_BUFFER_FILE)
+            manager = FeedManager(load_feed_configs(config_path), buffer=buffer, sampling_pool=sampling_pool)
+        refiller = BufferRefiller(manager.buffer, manager.pregenerate, manager.pending_publish_dates,
+                                  get_moscow_time, next_deadline=manager.timer.next_deadline)
+        manager.set_demand_listener(refiller.wake)
+        exporter = MetricsExporter()
+        with startup.phase('initialize'):
+            await manager.initialize()
+        logger.info(startup.report())
+
+        def on_stop():
+            manager.wake()
+            refiller.stop()
+            exporter.stop()
+
+        await asyncio.gather(
+            manager.run(),
+            refiller.run(lambda: ai_prorok.stop_flag),
+            exporter.run(lambda: ai_prorok.stop_flag),
+            async_input_listener(on_stop=on_stop)
+        )
+    except KeyboardInterrupt:
+        logger.info("Программа остановлена по Ctrl+C")
+    except Exception as e:
+        logger.error(f"Критическая ошибка: {e}")
+    finally:
+        ai_prorok.stop_flag = True
+        if sampling_pool is not None:
+            sampling_pool.close()
+        if buffer is not None:
+            buffer.close()
+        close_prophecy_log()
+        close_similarity_index()
+        close_response_cache()
+        logger.info("Программа завершена")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else FEEDS_FILE))
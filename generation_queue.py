@@ -0,0 +1,219 @@
+"""
+Пакетная генерация пророчеств впрок: промпты на много дней и лент собираются в очередь
+и отправляются одним заходом - параллельно с ограничением или batch-заданием OpenAI.
+Готовые тексты кладутся в буфер пророчеств, откуда их забирают ленты в свой день.
+
+    python generation_queue.py --days 7                       # одна лента, буфер prophecy_buffer.json
+    python generation_queue.py --days 7 --feeds feeds.json    # все ленты, общий буфер
+    python generation_queue.py --days 7 --mode batch          # batch-задание (/v1/batches)
+"""
+import argparse
+import asyncio
+import json
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+import ai_prorok
+from ai_prorok import (ProphecyScheduler, OPENAI_MODEL, FALLBACK_PROPHECIES, BUFFER_FILE,
+                       build_system_message, get_moscow_time, load_env_keys, publish_day)
+from llm import get_async_client
+from prophecy_buffer import ProphecyBuffer
+from prophecy_log import close_prophecy_log
+from similarity import close_similarity_index
+from response_cache import close_response_cache
+
+logger = logging.getLogger(__name__)
+
+QUEUE_CONCURRENCY = 8  # Одновременных запросов в режиме concurrent
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+BATCH_POLL_INTERVAL = 60  # Как часто проверять статус batch-задания, секунды
+BATCH_FINAL_STATUSES = {'completed', 'failed', 'expired', 'cancelled'}
+MODE_CONCURRENT = "concurrent"
+MODE_BATCH = "batch"
+
+
+@dataclass
+class GenerationJob:
+    """Один промпт в очереди и его результат"""
+    custom_id: str  # Уникальный идентификатор строки batch-задания
+    day: date  # День публикации
+    prompt: str
+    result: Optional[str] = None  # Текст пророчества или None, если не получен
+
+
+class GenerationQueue:
+    """Очередь промптов на генерацию с двумя способами отправки"""
+
+    def __init__(self):
+        self.jobs: List[GenerationJob] = []
+
+    def add(self, day: date, prompt: str) -> GenerationJob:
+        job = GenerationJob(f"{day.isoformat()}-{len(self.jobs)}", day, prompt)
+        self.jobs.append(job)
+        return job
+
+    def pending(self) -> List[GenerationJob]:
+        return [job for job in self.jobs if job.result is None]
+
+    async def run_concurrent(self, concurrency: int = QUEUE_CONCURRENCY):
+        """Отправляет незавершённые промпты обычными запросами, не более concurrency одновременно"""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_one(job: GenerationJob):
+            async with semaphore:
+                text = await ai_prorok.get_openai_response_async(job.prompt, day=publish_day(job.day))
+                if text not in FALLBACK_PROPHECIES:
+                    job.result = text
+
+        await asyncio.gather(*(run_one(job) for job in self.pending()))
+
+    def batch_lines(self, model: str = OPENAI_MODEL) -> List[str]:
+        """Строки batch-задания OpenAI (JSONL) для незавершённых промптов"""
+        lines = []
+        for job in self.pending():
+            request = {
+                'custom_id': job.custom_id,
+                'method': "POST",
+                'url': BATCH_ENDPOINT,
+                'body': {
+                    'model': model,
+                    'messages': [
+                        {"role": "system", "content": build_system_message(publish_day(job.day))},
+                        {"role": "user", "content": job.prompt}
+                    ]
+                }
+            }
+            lines.append(json.dumps(request, ensure_ascii=False))
+        return lines
+
+    def write_batch_file(self, path: str, model: str = OPENAI_MODEL) -> int:
+        """Записывает batch-задание в файл; возвращает число строк"""
+        lines = self.batch_lines(model)
+        with open(path, 'w', encoding='utf-8') as fh:
+            fh.write("\n".join(lines) + "\n")
+        return len(lines)
+
+    def apply_batch_output(self, output: str) -> int:
+        """Разбирает результат batch-задания (JSONL) и заполняет задачи; возвращает число успешных"""
+        jobs = {job.custom_id: job for job in self.jobs}
+        applied = 0
+        for line in output.splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            job = jobs.get(entry.get('custom_id'))
+            response = entry.get('response') or {}
+            if job is None or entry.get('error') or response.get('status_code') != 200:
+                logger.warning(f"Строка batch-задания {entry.get('custom_id')} не выполнена: "
+                               f"{entry.get('error') or response.get('status_code')}")
+                continue
+            job.result = response['body']['choices'][0]['message']['content']
+            applied += 1
+        return applied
+
+    async def run_batch(self, path: str, poll_interval: float = BATCH_POLL_INTERVAL) -> Optional[str]:
+        """
+        Отправляет незавершённые промпты batch-заданием OpenAI и ждёт результата.
+        Возвращает идентификатор задания (None, если отправлять нечего или нет ключа).
+        """
+        keys = load_env_keys()
+        if not keys['OPENAI_API_KEY']:
+            logger.error("OPENAI_API_KEY не найден в .env файле")
+            return None
+        if not self.write_batch_file(path):
+            return None
+
+        client = get_async_client(keys['OPENAI_API_KEY'], keys['OPENAI_BASE_URL'])
+        with open(path, 'rb') as fh:
+            input_file = await client.files.create(file=fh, purpose="batch")
+        batch = await client.batches.create(input_file_id=input_file.id, endpoint=BATCH_ENDPOINT,
+                                            completion_window=BATCH_COMPLETION_WINDOW)
+        logger.info(f"Batch-задание {batch.id} отправлено: {len(self.pending())} промптов")
+
+        while batch.status not in BATCH_FINAL_STATUSES:
+            await asyncio.sleep(poll_interval)
+            batch = await client.batches.retrieve(batch.id)
+            logger.info(f"Batch-задание {batch.id}: {batch.status}")
+
+        if batch.output_file_id:
+            output = await client.files.content(batch.output_file_id)
+            applied = self.apply_batch_output(output.text)
+            logger.info(f"Batch-задание {batch.id}: получено пророчеств - {applied}")
+        else:
+            logger.error(f"Batch-задание {batch.id} завершилось без результата: {batch.status}")
+        return batch.id
+
+    def fill_buffer(self, buffer: ProphecyBuffer, now: datetime) -> int:
+        """Кладёт полученные тексты в буфер на их дни; возвращает число добавленных"""
+        done = [(job.result, job.day) for job in self.jobs if job.result is not None]
+        buffer.put_many(done, now)
+        return len(done)
+
+
+def plan_days(start: date, days: int) -> List[date]:
+    """days дней публикаций подряд, начиная с start"""
+    return [start + timedelta(days=offset) for offset in range(days)]
+
+
+async def bulk_generate(scheduler: ProphecyScheduler, buffer: ProphecyBuffer, days: List[date], feeds: int = 1,
+                        mode: str = MODE_CONCURRENT, concurrency: int = QUEUE_CONCURRENCY,
+                        batch_path: Optional[str] = None) -> Dict[str, int]:
+    """
+    Догенерирует в буфер недостающие пророчества: по одному на ленту на каждый день из days.
+    Промпты строит scheduler (выборка слов от ленты не зависит).
+    """
+    now = get_moscow_time()
+    buffer.evict(now)
+    deficits = buffer.deficits({day: feeds for day in days})
+
+    queue = GenerationQueue()
+    for day, missing in sorted(deficits.items()):
+        for _ in range(missing):
+            queue.add(day, await scheduler.build_prompt(publish_day(day)))
+    logger.info(f"В очереди генерации {len(queue.jobs)} промптов на {len(deficits)} дн.")
+
+    if mode == MODE_BATCH:
+        await queue.run_batch(batch_path or f"prophecy_batch_{now.strftime('%Y%m%d-%H%M%S')}.jsonl")
+    else:
+        await queue.run_concurrent(concurrency)
+
+    added = queue.fill_buffer(buffer, get_moscow_time())
+    logger.info(f"В буфер добавлено пророчеств: {added} из {len(queue.jobs)}")
+    return {'queued': len(queue.jobs), 'added': added}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Пакетная генерация пророчеств впрок")
+    parser.add_argument('--days', type=int, default=7, help="на сколько дней вперёд, начиная с завтра")
+    parser.add_argument('--feeds', help="файл лент (feeds.json): по пророчеству на ленту в день, общий буфер")
+    parser.add_argument('--mode', choices=[MODE_CONCURRENT, MODE_BATCH], default=MODE_CONCURRENT)
+    parser.add_argument('--concurrency', type=int, default=QUEUE_CONCURRENCY)
+    parser.add_argument('--batch-file', help="куда записать batch-задание (JSONL)")
+    args = parser.parse_args()
+
+    feeds = 1
+    buffer_path = BUFFER_FILE
+    if args.feeds:
+        from feeds import load_feed_configs, FEEDS_BUFFER_FILE
+        feeds = len(load_feed_configs(args.feeds))
+        buffer_path = FEEDS_BUFFER_FILE
+
+    buffer = None
+    try:
+        scheduler = ProphecyScheduler()
+        buffer = ProphecyBuffer(buffer_path)
+        days = plan_days(get_moscow_time().date() + timedelta(days=1), args.days)
+        await bulk_generate(scheduler, buffer, days, feeds, args.mode, args.concurrency, args.batch_file)
+    finally:
+        if buffer is not None:
+            buffer.close()
+        close_prophecy_log()
+        close_similarity_index()
+        close_response_cache()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
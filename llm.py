@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from config import ConfigSnapshot, config_cache, OPENAI_BASE_URL
+from metrics import OPENAI_TTFT_SECONDS
+from rate_limit import parse_retry_after, DEFAULT_RETRY_AFTER
+from startup import lazy_import
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+OPENAI_TIMEOUT = 30  # Таймаут запроса, секунды
+OPENAI_STREAM_IDLE_TIMEOUT = 15  # В потоковом режиме - максимальная пауза между фрагментами, секунды
+CONTINUE_PROMPT = "Продолжи ответ ровно с того места, где он оборвался, не повторяя уже написанное."
+
+BACKOFF_BASE = 2.0  # Первая пауза между попытками, секунды
+BACKOFF_CAP = 30.0  # Максимальная пауза, секунды
+
+# Пакет openai импортируется при создании первого клиента: на старте он не нужен
+_async_clients: Dict[Tuple[str, str, int], "AsyncOpenAI"] = {}
+_lock = threading.Lock()
+
+
+def get_async_client(api_key: str, base_url: str = OPENAI_BASE_URL) -> "AsyncOpenAI":
+    """
+    Асинхронный клиент OpenAI, закешированный по ключу, адресу и циклу событий
+    (соединения асинхронного клиента привязаны к циклу, в котором созданы).
+    Клиент прежнего ключа не закрывается, а только забывается: запросы, начатые на нём,
+    дорабатывают, и он уходит в сборщик мусора.
+    """
+    loop_id = id(asyncio.get_running_loop())
+    with _lock:
+        client = _async_clients.get((api_key, base_url, loop_id))
+        if client is None:
+            for key in [key for key in _async_clients if key[1] == base_url and key[2] == loop_id]:
+                del _async_clients[key]
+            # Встроенные повторы клиента отключены: повторами с паузами управляет вызывающий код
+            client = lazy_import('openai').AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=OPENAI_TIMEOUT, max_retries=0)
+            _async_clients[(api_key, base_url, loop_id)] = client
+            logger.debug(f"Создан асинхронный клиент OpenAI для {base_url}")
+        return client
+
+
+def _on_config_change(old: ConfigSnapshot, new: ConfigSnapshot):
+    """Сбрасывает клиенты только при реальной смене ключа OpenAI"""
+    if old.openai_api_key == new.openai_api_key:
+        return
+
+    with _lock:
+        for key in [key for key in _async_clients if key[0] != new.openai_api_key]:
+            del _async_clients[key]
+    logger.info("Ключ OpenAI изменился, клиенты будут пересозданы")
+
+
+config_cache.on_change(_on_config_change)
+
+
+def backoff_delay(attempt: int, base: float = BACKOFF_BASE, cap: float = BACKOFF_CAP) -> float:
+    """Экспоненциальная пауза с полным джиттером перед попыткой attempt + 1 (attempt с нуля)"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def rate_limit_delay(error: Exception) -> Optional[float]:
+    """
+    Пауза по подсказке сервиса, если ошибка - отказ OpenAI по лимиту (HTTP 429), иначе None.
+    Учитываются заголовки retry-after-ms и Retry-After.
+    """
+    if getattr(error, 'status_code', None) != 429:
+        return None
+    response = getattr(error, 'response', None)
+    headers = response.headers if response is not None else {}
+    retry_after_ms = parse_retry_after(headers.get('retry-after-ms'))
+    if retry_after_ms is not None:
+        return retry_after_ms / 1000
+    retry_after = parse_retry_after(headers.get('retry-after'))
+    return retry_after if retry_after is not None else DEFAULT_RETRY_AFTER
+
+
+class StreamProgress:
+    """
+    Накопленный текст потокового ответа. Живёт между попытками: после обрыва
+    следующая попытка продолжает с частичного ответа, а не генерирует его заново.
+    """
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self.finished = False
+        self.ttft: Optional[float] = None  # Время до первого фрагмента последней попытки, секунды
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    def messages(self, messages: List[dict]) -> List[dict]:
+        """Сообщения для очередной попытки: с частичным ответом и просьбой продолжить, если он есть"""
+        partial = self.text
+        if not partial:
+            return messages
+        return messages + [{"role": "assistant", "content": partial}, {"role": "user", "content": CONTINUE_PROMPT}]
+
+
+async def stream_chat_completion(client: "AsyncOpenAI", model: str, messages: List[dict], progress: StreamProgress,
+                                 idle_timeout: float = OPENAI_STREAM_IDLE_TIMEOUT):
+    """
+    Одна попытка потокового запроса chat.completions. Фрагменты дописываются в progress
+    по мере поступления, поэтому при исключении уже полученный текст не теряется.
+    Таймаут - пауза между фрагментами, а не длина всего ответа: медленный, но живой хвост не обрывается.
+    """
+    start = time.perf_counter()
+    progress.ttft = None
+    stream = await client.chat.completions.create(model=model, messages=progress.messages(messages),
+                                                  stream=True, timeout=idle_timeout)
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        choice = chunk.choices[0]
+        if choice.delta and choice.delta.content:
+            if progress.ttft is None:
+                progress.ttft = time.perf_counter() - start
+                OPENAI_TTFT_SECONDS.observe(progress.ttft)
+            progress.parts.append(choice.delta.content)
+        if choice.finish_reason:
+            progress.finished = True
+
+    if not progress.finished:
+        raise RuntimeError(f"Поток ответа оборвался после {len(progress.text)} символов")
@@ -0,0 +1,116 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+from datetime import datetime
+from typing import Optional
+
+import pytz
+
+MOSCOW_TZ = pytz.timezone('Europe/Moscow')
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class MoscowTimeFormatter(logging.Formatter):
+    """
+    Форматтер с московским временем. Часовой пояс создаётся один раз,
+    а строка времени кешируется посекундно - для записей в пределах одной
+    секунды подставляются только микросекунды.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cached_second: Optional[int] = None
+        self._cached_datefmt: Optional[str] = None
+        self._cached_prefix = ""
+        self._cached_suffix = ""
+
+    def formatTime(self, record, datefmt=None):
+        second = int(record.created)
+        if second != self._cached_second or datefmt != self._cached_datefmt:
+            dt = datetime.fromtimestamp(second, MOSCOW_TZ)
+            if datefmt:
+                self._cached_prefix, self._cached_suffix = dt.strftime(datefmt), ""
+            else:
+                self._cached_prefix = dt.strftime("%Y-%m-%dT%H:%M:%S")
+                self._cached_suffix = dt.strftime("%z")
+                self._cached_suffix = f"{self._cached_suffix[:3]}:{self._cached_suffix[3:]}"
+            self._cached_second = second
+            self._cached_datefmt = datefmt
+
+        if datefmt:
+            return self._cached_prefix
+        micros = int((record.created - second) * 1_000_000)
+        return f"{self._cached_prefix}.{micros:06d}{self._cached_suffix}"
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Обработчик очереди без подготовки записи. Стандартный QueueHandler.prepare
+    форматирует запись в вызывающем потоке (подставляет аргументы, печатает
+    трассировку и убирает exc_info) - ради передачи между процессами. Очередь здесь
+    внутри процесса, поэтому запись уходит как есть, а всё форматирование
+    выполняет поток QueueListener.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class JsonFormatter(MoscowTimeFormatter):
+    """Структурированный вывод: одна JSON-запись на строку"""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack_info'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def setup_logging(level: int = logging.INFO, structured: bool = False) -> logging.handlers.QueueListener:
+    """
+    Настраивает логирование через очередь: обработчик в вызывающем потоке только
+    кладёт запись в очередь (см. DeferredQueueHandler), а подстановку аргументов,
+    трассировки, форматирование и вывод выполняет поток QueueListener.
+    structured=True включает JSON-вывод.
+    """
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+
+    formatter = JsonFormatter() if structured else MoscowTimeFormatter(TEXT_FORMAT)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    """Дописывает оставшиеся записи и останавливает поток вывода"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
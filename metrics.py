@@ -0,0 +1,289 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм, секунды: от микросекундных этапов выборки до минутных ответов OpenAI
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Запас времени до публикации, секунды
+SLACK_BUCKETS = (0, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+METRICS_SNAPSHOT_INTERVAL = 60  # Как часто переписывать файл снимка, секунды
+DEADLINE_RISK_SECONDS = 60  # Пророчество готово меньше чем за столько секунд до публикации - дедлайн под угрозой
+
+LabelValues = Tuple[str, ...]
+
+
+class _Metric:
+    """Общая часть метрик: имя, описание, имена меток и блокировка (метрики пишут и потоки пула)"""
+    kind = "untyped"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def _format_labels(self, values: LabelValues, extra: Sequence[Tuple[str, str]] = ()) -> str:
+        pairs = list(zip(self.labels, values)) + list(extra)
+        if not pairs:
+            return ""
+        escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Монотонный счётчик"""
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            lines += [f"{self.name}{self._format_labels(key)} {value}" for key, value in sorted(self._values.items())]
+        return lines
+
+
+class Gauge(_Metric):
+    """Последнее значение"""
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def value(self, **labels) -> Optional[float]:
+        return self._values.get(self._key(labels))
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            lines += [f"{self.name}{self._format_labels(key)} {value}" for key, value in sorted(self._values.items())]
+        return lines
+
+
+class Histogram(_Metric):
+    """
+    Гистограмма с фиксированными корзинами: на наблюдение - поиск корзины и два сложения,
+    память не растёт с числом наблюдений.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelValues, List[float]] = {}  # счётчики корзин + [+Inf, сумма]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Замеряет длительность блока, в том числе завершившегося исключением"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return int(sum(series[:-1])) if series else 0
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0.0
+                for bound, hits in zip(self.buckets, series):
+                    cumulative += hits
+                    lines.append(f"{self.name}_bucket{self._format_labels(key, [('le', repr(float(bound)))])} "
+                                 f"{int(cumulative)}")
+                cumulative += series[len(self.buckets)]
+                lines.append(f"{self.name}_bucket{self._format_labels(key, [('le', '+Inf')])} {int(cumulative)}")
+                lines.append(f"{self.name}_sum{self._format_labels(key)} {series[-1]}")
+                lines.append(f"{self.name}_count{self._format_labels(key)} {int(cumulative)}")
+        return lines
+
+
+class MetricsRegistry:
+    """Набор метрик процесса с выводом в текстовом формате Prometheus"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, description: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, description, labels))
+
+    def gauge(self, name: str, description: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, description, labels))
+
+    def histogram(self, name: str, description: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, description, labels, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    'prophecy_stage_seconds', "Длительность этапов генерации и сохранения", ['stage'])
+OPENAI_ATTEMPT_SECONDS = registry.histogram(
+    'prophecy_openai_attempt_seconds', "Длительность одной попытки запроса к OpenAI", ['outcome'])
+OPENAI_TTFT_SECONDS = registry.histogram(
+    'prophecy_openai_ttft_seconds', "Время до первого фрагмента потокового ответа OpenAI")
+PUBLISH_SECONDS = registry.histogram(
+    'prophecy_publish_seconds', "Длительность публикации в одну цель", ['target', 'outcome'])
+PUBLISH_SLACK_SECONDS = registry.histogram(
+    'prophecy_publish_slack_seconds', "Запас времени от готовности пророчества до публикации", ['feed'],
+    buckets=SLACK_BUCKETS)
+PUBLISH_LAG_SECONDS = registry.histogram(
+    'prophecy_publish_lag_seconds', "Опоздание публикации относительно запланированного времени", ['feed'])
+LAST_PUBLISH_SLACK = registry.gauge(
+    'prophecy_last_publish_slack_seconds', "Запас времени до публикации у последнего готового пророчества", ['feed'])
+DEADLINE_AT_RISK = registry.counter(
+    'prophecy_deadline_at_risk_total', "Пророчество готово позже порога DEADLINE_RISK_SECONDS", ['feed'])
+
+RATE_LIMIT_WAIT_SECONDS = registry.histogram(
+    'prophecy_rate_limit_wait_seconds', "Ожидание очереди в ограничителе частоты", ['scope'])
+RATE_LIMITED = registry.counter(
+    'prophecy_rate_limited_total', "Отказы сервисов по лимиту частоты (429, flood control VK)", ['scope'])
+OPENAI_CACHE_REQUESTS = registry.counter(
+    'prophecy_openai_cache_total', "Обращения к кэшу ответов OpenAI", ['result'])
+
+
+def observe_slack(feed_id: str, slack: float):
+    """Учитывает запас времени до публикации и предупреждает, если дедлайн под угрозой"""
+    PUBLISH_SLACK_SECONDS.observe(max(slack, 0.0), feed=feed_id)
+    LAST_PUBLISH_SLACK.set(slack, feed=feed_id)
+    if slack < DEADLINE_RISK_SECONDS:
+        DEADLINE_AT_RISK.inc(feed=feed_id)
+        logger.warning(f"Лента {feed_id}: пророчество готово за {slack:.0f} с до публикации - дедлайн под угрозой")
+
+
+class MetricsExporter:
+    """
+    Вывод метрик: HTTP-адрес /metrics в текстовом формате Prometheus (если задан port)
+    и/или файл снимка, переписываемый раз в interval секунд (если задан path).
+    По умолчанию берёт METRICS_PORT и METRICS_FILE из окружения.
+    """
+
+    def __init__(self, port: Optional[int] = None, path: Optional[str] = None, host: str = "127.0.0.1",
+                 interval: float = METRICS_SNAPSHOT_INTERVAL, registry: MetricsRegistry = registry):
+        if port is None and os.getenv('METRICS_PORT'):
+            port = int(os.getenv('METRICS_PORT'))
+        self.port = port
+        self.path = path or os.getenv('METRICS_FILE')
+        self.host = host
+        self.interval = interval
+        self.registry = registry
+        self._stop = asyncio.Event()
+
+    @property
+    def enabled(self) -> bool:
+        return self.port is not None or bool(self.path)
+
+    def stop(self):
+        self._stop.set()
+
+    def write_snapshot(self):
+        """Атомарно переписывает файл снимка"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as fh:
+            fh.write(self.registry.render())
+        os.replace(tmp_path, self.path)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = (await reader.readuntil(b"\r\n\r\n")).split(b"\r\n", 1)[0].decode('latin-1')
+            if request_line.split(" ")[1:2] == ["/metrics"]:
+                status, body = "200 OK", self.registry.render().encode('utf-8')
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode('latin-1') + body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    async def run(self, stop_check: Callable[[], bool]):
+        """Обслуживает /metrics и переписывает снимок до остановки"""
+        if not self.enabled:
+            return
+
+        server = None
+        if self.port is not None:
+            server = await asyncio.start_server(self._handle, self.host, self.port)
+            logger.info(f"Метрики доступны на http://{self.host}:{self.port}/metrics")
+
+        try:
+            while not stop_check() and not self._stop.is_set():
+                try:
+                    await asyncio.wait_for(self._stop.wait(), timeout=self.interval)
+                except asyncio.TimeoutError:
+                    pass
+                if self.path:
+                    try:
+                        self.write_snapshot()
+                    except OSError as e:
+                        logger.error(f"Ошибка записи снимка метрик: {e}")
+        finally:
+            if server is not None:
+                server.close()
+                await server.wait_closed()
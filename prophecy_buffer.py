@@ -0,0 +1,244 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+from collections import Counter
+from dataclasses import dataclass, asdict
+from datetime import date, datetime, timedelta
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from scheduling import get_clock
+
+logger = logging.getLogger(__name__)
+
+BUFFER_TTL = timedelta(days=8)  # Дольше пророчество в буфере не живёт (покрывает генерацию на неделю вперёд)
+REFILL_CONCURRENCY = 1  # Одновременных генераций при пополнении
+REFILL_MIN_INTERVAL = 60.0  # Минимальная пауза между запусками генераций, секунды
+REFILL_CHECK_INTERVAL = 300.0  # Как часто проверять нехватку, секунды
+REFILL_IDLE_MARGIN = 120.0  # Простой: до ближайшего дедлайна генерации или публикации не меньше, секунды
+
+
+@dataclass
+class BufferedProphecy:
+    """Заранее сгенерированный текст пророчества на конкретный день"""
+    text: str
+    for_date: str  # День публикации (МСК), YYYY-MM-DD
+    created_at: str  # Когда сгенерировано, ISO
+
+
+class ProphecyBuffer:
+    """
+    Хранимый в файле буфер заранее сгенерированных пророчеств.
+    Тексты привязаны к дню публикации: записи на прошедшие дни и старше TTL вытесняются.
+    Изменения сразу видны в памяти, а файл переписывает фоновый поток: цикл событий
+    только передаёт снимок, несколько изменений подряд сливаются в одну запись.
+    """
+
+    def __init__(self, path: str, ttl: timedelta = BUFFER_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.entries: List[BufferedProphecy] = []
+        self.load()
+
+        self._pending: Optional[List[BufferedProphecy]] = None  # Последний несохранённый снимок
+        self._pending_lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._writer, name="prophecy-buffer", daemon=True)
+        self._thread.start()
+
+    def load(self):
+        """Загружает буфер из файла, если он есть"""
+        try:
+            if not os.path.exists(self.path):
+                return
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = [BufferedProphecy(**entry) for entry in json.load(f)]
+            logger.info(f"Буфер пророчеств загружен из {self.path}: {len(self.entries)} шт.")
+        except Exception as e:
+            logger.error(f"Ошибка загрузки буфера пророчеств: {e}")
+            self.entries = []
+
+    def save(self):
+        """Ставит текущее содержимое на запись в файл (не блокирует)"""
+        with self._pending_lock:
+            self._pending = list(self.entries)
+        self._dirty.set()
+
+    def close(self):
+        """Дописывает последний снимок и останавливает фоновый поток"""
+        with self._pending_lock:
+            self._closed = True
+        self._dirty.set()
+        self._thread.join(timeout=10)
+
+    def _writer(self):
+        """Фоновый поток: сохраняет самый свежий снимок, пока буфер не закрыт"""
+        while True:
+            self._dirty.wait()
+            self._dirty.clear()
+            with self._pending_lock:
+                snapshot, self._pending = self._pending, None
+            if snapshot is not None:
+                self._write(snapshot)
+            with self._pending_lock:
+                if self._closed and self._pending is None:
+                    return
+
+    def _write(self, entries: List[BufferedProphecy]):
+        """Атомарно сохраняет буфер (временный файл + переименование)"""
+        try:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump([asdict(entry) for entry in entries], f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения буфера пророчеств: {e}")
+
+    def evict(self, now: datetime) -> int:
+        """Удаляет записи на прошедшие дни и старше TTL; возвращает число удалённых"""
+        today = now.date().isoformat()
+        kept = [entry for entry in self.entries
+                if entry.for_date >= today and now - datetime.fromisoformat(entry.created_at) <= self.ttl]
+        evicted = len(self.entries) - len(kept)
+        if evicted:
+            self.entries = kept
+            self.save()
+            logger.info(f"Из буфера вытеснено устаревших пророчеств: {evicted}")
+        return evicted
+
+    def put(self, text: str, for_date: date, now: datetime):
+        """Добавляет пророчество на день for_date"""
+        self.entries.append(BufferedProphecy(text, for_date.isoformat(), now.isoformat()))
+        self.save()
+
+    def put_many(self, items: Iterable[Tuple[str, date]], now: datetime):
+        """Добавляет пары (текст, день) с одним сохранением файла"""
+        self.entries.extend(BufferedProphecy(text, for_date.isoformat(), now.isoformat()) for text, for_date in items)
+        self.save()
+
+    def take(self, for_date: date, now: datetime) -> Optional[str]:
+        """Забирает самое свежее пророчество на день for_date, если оно есть"""
+        self.evict(now)
+        key = for_date.isoformat()
+        for i in range(len(self.entries) - 1, -1, -1):
+            if self.entries[i].for_date == key:
+                entry = self.entries.pop(i)
+                self.save()
+                return entry.text
+        return None
+
+    def deficits(self, demand: Dict[date, int]) -> Dict[date, int]:
+        """Сколько пророчеств не хватает на каждый день при заданной потребности"""
+        available = Counter(entry.for_date for entry in self.entries)
+        return {day: count - available[day.isoformat()] for day, count in demand.items()
+                if count > available[day.isoformat()]}
+
+
+class BufferRefiller:
+    """
+    Фоновое пополнение буфера: в простое догенерирует недостающие пророчества
+    на дни предстоящих публикаций, с ограничением параллелизма и частоты запросов.
+    Простой - когда до ближайшего дедлайна планировщика (next_deadline) не меньше idle_margin:
+    пополнение не спорит с генерацией и публикацией по расписанию за лимиты OpenAI.
+    """
+
+    def __init__(self, buffer: ProphecyBuffer,
+                 generate: Callable[[date], Awaitable[Optional[str]]],
+                 demand: Callable[[], Dict[date, int]],
+                 now_func: Callable[[], datetime],
+                 concurrency: int = REFILL_CONCURRENCY,
+                 min_interval: float = REFILL_MIN_INTERVAL,
+                 check_interval: float = REFILL_CHECK_INTERVAL,
+                 next_deadline: Optional[Callable[[], Optional[datetime]]] = None,
+                 idle_margin: float = REFILL_IDLE_MARGIN):
+        self.buffer = buffer
+        self.generate = generate
+        self.demand = demand
+        self.now_func = now_func
+        self.min_interval = min_interval
+        self.check_interval = check_interval
+        self.next_deadline = next_deadline
+        self.idle_margin = idle_margin
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._last_start = 0.0
+        self._rate_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self._stopped = False
+
+    def wake(self):
+        """Досрочная проверка нехватки (например, после публикации)"""
+        self._wakeup.set()
+
+    def stop(self):
+        self._stopped = True
+        self._stopping.set()
+        self._wakeup.set()
+
+    async def _sleep(self, delay: float):
+        """Пауза, которую прерывает остановка"""
+        try:
+            await asyncio.wait_for(self._stopping.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+    def idle_delay(self) -> float:
+        """Сколько ждать простоя: 0, если ближайший дедлайн дальше idle_margin, иначе - до его окончания с запасом"""
+        deadline = self.next_deadline() if self.next_deadline is not None else None
+        if deadline is None:
+            return 0.0
+        remaining = (deadline - self.now_func()).total_seconds()
+        if remaining >= self.idle_margin:
+            return 0.0
+        return max(remaining, 0.0) + self.idle_margin
+
+    async def _wait_idle(self):
+        """Ждёт простоя планировщика (или остановки)"""
+        delay = self.idle_delay()
+        while delay > 0 and not self._stopped:
+            await self._sleep(delay)
+            delay = self.idle_delay()
+
+    async def _generate_one(self, day: date):
+        async with self._semaphore:
+            # Ограничение частоты: не чаще одного запуска в min_interval и только в простое
+            async with self._rate_lock:
+                delay = self._last_start + self.min_interval - get_clock().monotonic()
+                if delay > 0:
+                    await self._sleep(delay)
+                await self._wait_idle()
+                self._last_start = get_clock().monotonic()
+            if self._stopped:
+                return
+
+            text = await self.generate(day)
+            if text:
+                self.buffer.put(text, day, self.now_func())
+                logger.info(f"В буфер добавлено пророчество на {day.isoformat()}")
+
+    async def refill_once(self):
+        """Одна проверка: вытесняет устаревшее и догенерирует недостающее"""
+        self.buffer.evict(self.now_func())
+        deficits = self.buffer.deficits(self.demand())
+        jobs = [day for day, missing in sorted(deficits.items()) for _ in range(missing)]
+        if jobs:
+            logger.info(f"Пополнение буфера пророчеств: {len(jobs)} шт.")
+            await asyncio.gather(*(self._generate_one(day) for day in jobs), return_exceptions=True)
+
+    async def run(self, stop_check: Callable[[], bool] = lambda: False):
+        """Фоновый цикл пополнения до остановки"""
+        while not self._stopped and not stop_check():
+            try:
+                await self.refill_once()
+            except Exception as e:
+                logger.error(f"Ошибка пополнения буфера пророчеств: {e}")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.check_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
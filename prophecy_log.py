@@ -0,0 +1,261 @@
+import gzip
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from metrics import STAGE_SECONDS
+from scheduling import get_clock
+
+logger = logging.getLogger(__name__)
+
+PROPHECY_LOG_FILE = "prophecies_log.jsonl"  # Текущий сегмент журнала пророчеств
+LOG_MAX_BYTES = 10 * 1024 * 1024  # Ротация по размеру сегмента
+LOG_MAX_AGE = 30 * 24 * 3600  # Ротация по возрасту сегмента, секунды
+LOG_FLUSH_INTERVAL = 1.0  # Как часто сбрасывать накопленные записи, секунды
+LOG_BATCH_SIZE = 256  # Максимум записей за один сброс
+LOG_BLOCK_BYTES = 64 * 1024  # Сжатый сегмент - цепочка независимых gzip-блоков примерно такого размера (до сжатия)
+
+# Запись индекса для чтения: (позиция в ответе, смещение, длина, смещение блока, длина блока)
+_IndexedRecord = Tuple[int, int, int, Optional[int], Optional[int]]
+
+
+class ProphecyLog:
+    """
+    Структурированный журнал пророчеств в формате JSON Lines.
+    Записи копятся в очереди и пишутся пачками фоновым потоком, не блокируя цикл событий.
+    Сегменты ротируются по размеру или возрасту и сжимаются gzip независимыми блоками
+    (последовательность gzip-членов - обычный файл .gz для zcat).
+    Индекс (SQLite) хранит для каждой записи день, ленту, событие и положение в сегменте
+    (для сжатого - блок и смещение внутри него), так что пророчество на нужный день
+    находится запросом и распаковкой одного блока, без чтения всего журнала.
+    """
+
+    def __init__(self, path: str = PROPHECY_LOG_FILE, max_bytes: int = LOG_MAX_BYTES,
+                 max_age: float = LOG_MAX_AGE, flush_interval: float = LOG_FLUSH_INTERVAL):
+        self.path = os.path.abspath(path)
+        self.index_path = os.path.splitext(self.path)[0] + ".index.db"
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.flush_interval = flush_interval
+
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+        self._index_lock = threading.Lock()
+        self._index = sqlite3.connect(self.index_path, check_same_thread=False, isolation_level=None)
+        self._index.execute("PRAGMA journal_mode=WAL")
+        self._index.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            "day TEXT NOT NULL, feed_id TEXT NOT NULL, event TEXT NOT NULL, "
+            "segment TEXT NOT NULL, offset INTEGER NOT NULL, length INTEGER NOT NULL, "
+            "block INTEGER, block_length INTEGER)"
+        )
+        self._index.execute("CREATE INDEX IF NOT EXISTS records_day ON records (day, feed_id)")
+
+        self._segment_started = self._read_segment_start()
+
+        self._thread = threading.Thread(target=self._writer, name="prophecy-log", daemon=True)
+        self._thread.start()
+
+    def record(self, event: str, feed_id: str, day: Optional[str] = None, **fields):
+        """
+        Ставит запись в очередь (не блокирует).
+        day - день, к которому относится пророчество (YYYY-MM-DD), по умолчанию - день записи.
+        """
+        now = get_clock().now()
+        entry = {'ts': now.isoformat(), 'day': day or now.date().isoformat(), 'feed_id': feed_id, 'event': event}
+        entry.update(fields)
+        self._queue.put(entry)
+
+    def find(self, day: str, feed_id: Optional[str] = None, event: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Записи за день day (с фильтром по ленте и событию) по индексу"""
+        query = "SELECT segment, offset, length, block, block_length FROM records WHERE day = ?"
+        params: List[Any] = [day]
+        if feed_id is not None:
+            query += " AND feed_id = ?"
+            params.append(feed_id)
+        if event is not None:
+            query += " AND event = ?"
+            params.append(event)
+
+        with self._index_lock:
+            rows = self._index.execute(query + " ORDER BY rowid", params).fetchall()
+
+        # Каждый сегмент открывается один раз за запрос, каждый блок распаковывается один раз
+        by_segment: Dict[str, List[_IndexedRecord]] = {}
+        for position, (segment, offset, length, block, block_length) in enumerate(rows):
+            by_segment.setdefault(segment, []).append((position, offset, length, block, block_length))
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(rows)
+        for segment, records in by_segment.items():
+            for position, data in self._read_records(segment, records):
+                results[position] = json.loads(data)
+        return results
+
+    def _read_records(self, segment: str, records: List[_IndexedRecord]) -> Iterable[Tuple[int, bytes]]:
+        """Данные записей одного сегмента: (позиция в ответе, байты записи)"""
+        path = os.path.join(os.path.dirname(self.path), segment)
+        if not segment.endswith(".gz"):
+            with open(path, 'rb') as fh:
+                for position, offset, length, _, _ in records:
+                    fh.seek(offset)
+                    yield position, fh.read(length)
+            return
+
+        with open(path, 'rb') as fh:
+            blocks: Dict[int, bytes] = {}
+            for position, offset, length, block, block_length in records:
+                if block not in blocks:
+                    fh.seek(block)
+                    blocks[block] = gzip.decompress(fh.read(block_length))
+                yield position, blocks[block][offset:offset + length]
+
+    def flush(self, timeout: float = 5.0):
+        """Дожидается записи всего, что уже поставлено в очередь"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def close(self):
+        """Сбрасывает очередь и останавливает фоновый поток"""
+        self._queue.put(None)
+        self._thread.join(timeout=10)
+        with self._index_lock:
+            self._index.close()
+
+    def _writer(self):
+        """Фоновый поток: собирает пачку записей и дописывает её одним вызовом write"""
+        running = True
+        while running:
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+
+            while len(batch) < LOG_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            running = None not in batch
+            entries = [entry for entry in batch if entry is not None]
+
+            try:
+                if entries:
+                    with STAGE_SECONDS.time(stage='log_write'):
+                        self._write_batch(entries)
+            except Exception as e:
+                logger.error(f"Ошибка записи журнала пророчеств: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write_batch(self, entries: List[Dict[str, Any]]):
+        self._maybe_rotate()
+
+        segment = os.path.basename(self.path)
+        offset = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        chunks = []
+        rows = []
+        for entry in entries:
+            data = (json.dumps(entry, ensure_ascii=False) + "\n").encode('utf-8')
+            chunks.append(data)
+            rows.append((entry['day'], entry['feed_id'], entry['event'], segment, offset, len(data)))
+            offset += len(data)
+
+        with open(self.path, 'ab') as fh:
+            fh.write(b"".join(chunks))
+
+        with self._index_lock:
+            self._index.execute("BEGIN")
+            self._index.executemany(
+                "INSERT INTO records (day, feed_id, event, segment, offset, length) VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._index.execute("COMMIT")
+
+    def _read_segment_start(self) -> Optional[float]:
+        """Время первой записи текущего сегмента (для ротации по возрасту)"""
+        try:
+            with open(self.path, 'rb') as fh:
+                return datetime.fromisoformat(json.loads(fh.readline())['ts']).timestamp()
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _maybe_rotate(self):
+        """Ротация текущего сегмента по размеру или возрасту со сжатием"""
+        if not os.path.exists(self.path):
+            self._segment_started = None
+            return
+
+        now = get_clock().now()
+        if self._segment_started is None:
+            self._segment_started = now.timestamp()
+        if os.path.getsize(self.path) < self.max_bytes and now.timestamp() - self._segment_started < self.max_age:
+            return
+
+        base, ext = os.path.splitext(self.path)
+        stamp = now.strftime('%Y%m%d-%H%M%S')
+        rotated = f"{base}.{stamp}{ext}.gz"
+        suffix = 1
+        while os.path.exists(rotated):
+            rotated = f"{base}.{stamp}-{suffix}{ext}.gz"
+            suffix += 1
+
+        segment = os.path.basename(self.path)
+        with self._index_lock:
+            rows = self._index.execute("SELECT rowid, offset FROM records WHERE segment = ? ORDER BY offset",
+                                       (segment,)).fetchall()
+        with open(self.path, 'rb') as src:
+            data = src.read()
+
+        # Блоки режутся по границам записей: каждая запись попадает в блок целиком
+        blocks: List[Tuple[int, List[Tuple[int, int]]]] = []
+        for rowid, offset in rows:
+            if not blocks or offset - blocks[-1][0] >= LOG_BLOCK_BYTES:
+                blocks.append((offset if blocks else 0, []))
+            blocks[-1][1].append((rowid, offset))
+        if not blocks:
+            blocks.append((0, []))
+
+        updates = []
+        written = 0
+        with open(rotated, 'wb') as dst:
+            for i, (start, block_rows) in enumerate(blocks):
+                end = blocks[i + 1][0] if i + 1 < len(blocks) else len(data)
+                compressed = gzip.compress(data[start:end])
+                dst.write(compressed)
+                updates.extend((os.path.basename(rotated), offset - start, written, len(compressed), rowid)
+                               for rowid, offset in block_rows)
+                written += len(compressed)
+
+        with self._index_lock:
+            self._index.execute("BEGIN")
+            self._index.executemany(
+                "UPDATE records SET segment = ?, offset = ?, block = ?, block_length = ? WHERE rowid = ?", updates)
+            self._index.execute("COMMIT")
+        os.remove(self.path)
+        self._segment_started = None
+        logger.info(f"Журнал пророчеств ротирован в {rotated}")
+
+
+_default_log: Optional[ProphecyLog] = None
+
+
+def get_prophecy_log() -> ProphecyLog:
+    """Общий журнал пророчеств процесса (создаётся при первом обращении)"""
+    global _default_log
+    if _default_log is None:
+        _default_log = ProphecyLog()
+    return _default_log
+
+
+def close_prophecy_log():
+    """Закрывает общий журнал процесса (следующее обращение создаст новый)"""
+    global _default_log
+    if _default_log is not None:
+        _default_log.close()
+        _default_log = None
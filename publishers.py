@@ -0,0 +1,298 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence
+
+from metrics import PUBLISH_SECONDS
+from config import ConfigSnapshot, config_cache, TG_API_URL, VK_API_URL
+from startup import lazy_import
+from scheduling import get_clock
+from rate_limit import (limiter, BucketKey, RateLimited, parse_retry_after, SCOPE_TELEGRAM_CHAT,
+                        VK_RATE_LIMIT_CODES, VK_FLOOD_CONTROL_DELAY)
+
+if TYPE_CHECKING:
+    import requests
+
+logger = logging.getLogger(__name__)
+
+PUBLISH_WORKERS = 16  # Потоки для блокирующих HTTP-вызовов публикации
+PUBLISH_TIMEOUT = 10  # Таймаут одной попытки, секунды
+PUBLISH_RETRIES = 2  # Дополнительные попытки после неудачной
+PUBLISH_RETRY_DELAY = 1.0  # Базовая пауза между попытками, секунды
+PUBLISH_DEADLINE = 30 * 60  # Сколько публикация может ждать очереди лимита частоты, секунды
+PUBLISH_RATE_LIMIT_RETRIES = 3  # Повторы после отказов по лимиту (сверх них - ошибка, а не ожидание до срока)
+VK_API_VERSION = '5.92'  # Та же версия, что у vk_api по умолчанию
+
+# Отдельный пул потоков: медленная соцсеть не занимает пул по умолчанию (там слушатель ввода)
+_executor = ThreadPoolExecutor(max_workers=PUBLISH_WORKERS, thread_name_prefix="publish")
+
+# requests и vk_api импортируются при первой публикации: на старте они не нужны
+_sessions: Dict[str, "requests.Session"] = {}
+_vk_apis: Dict[str, Any] = {}
+_lock = threading.Lock()
+
+
+def get_session(provider: str) -> "requests.Session":
+    """Долгоживущая keep-alive сессия на провайдера, общая для всех лент процесса"""
+    with _lock:
+        session = _sessions.get(provider)
+        if session is None:
+            session = lazy_import('requests').Session()
+            adapter = lazy_import('requests.adapters').HTTPAdapter(pool_connections=1, pool_maxsize=PUBLISH_WORKERS)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[provider] = session
+        return session
+
+
+def get_vk_api(token: str):
+    """Клиент VK API, закешированный по токену (внутри - своя keep-alive сессия)"""
+    with _lock:
+        api = _vk_apis.get(token)
+        if api is None:
+            api = lazy_import('vk_api').VkApi(token=token).get_api()
+            _vk_apis[token] = api
+        return api
+
+
+def _on_config_change(old: ConfigSnapshot, new: ConfigSnapshot):
+    """Сбрасывает клиенты VK только при реальной смене токена"""
+    if old.vk_token == new.vk_token:
+        return
+
+    with _lock:
+        for token in [token for token in _vk_apis if token != new.vk_token]:
+            del _vk_apis[token]
+    logger.info("Токен VK изменился, клиент будет пересоздан")
+
+
+config_cache.on_change(_on_config_change)
+
+
+@dataclass
+class PublishResult:
+    """Результат публикации в одну цель"""
+    target: str  # Имя цели, например telegram:@channel
+    ok: bool  # Успешно ли
+    attempts: int  # Сколько попыток потрачено
+    latency: float  # Суммарное время, секунды
+    error: Optional[str] = None  # Текст последней ошибки
+    response: Any = None  # Ответ сервиса при успехе
+    timed_out: bool = False  # Последняя попытка прервана по таймауту
+
+
+class Publisher:
+    """
+    Цель публикации. send() - блокирующая отправка (бросает исключение при ошибке,
+    RateLimited - при отказе по лимиту), publish() - асинхронная обёртка с таймаутом,
+    бюджетом повторов и очередью в общем ограничителе частоты.
+    """
+    provider = "base"
+    token_key: Optional[str] = None
+
+    def __init__(self, keys_func: Callable[[], Dict[str, Optional[str]]], timeout: float = PUBLISH_TIMEOUT,
+                 retries: int = PUBLISH_RETRIES, retry_delay: float = PUBLISH_RETRY_DELAY):
+        self.keys_func = keys_func
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+    @property
+    def name(self) -> str:
+        return self.provider
+
+    def token(self) -> str:
+        token = self.keys_func().get(self.token_key)
+        if not token:
+            raise RuntimeError(f"{self.token_key} не найден в .env файле")
+        return token
+
+    def endpoint(self, key: str, default: str) -> str:
+        """Базовый адрес сервиса из .env (по умолчанию - боевой)"""
+        return self.keys_func().get(key) or default
+
+    def rate_keys(self) -> List[BucketKey]:
+        """Вёдра ограничителя частоты: по умолчанию - токен провайдера"""
+        return [(self.provider, self.token())]
+
+    def send(self, message: str) -> Any:
+        raise NotImplementedError
+
+    async def publish(self, message: str, deadline: Optional[float] = None) -> PublishResult:
+        """
+        Отправка с таймаутом на попытку и повторами, не блокирует цикл событий.
+        deadline (get_clock().monotonic()) - до какого момента можно ждать очереди лимита частоты,
+        по умолчанию - PUBLISH_DEADLINE от текущего момента.
+        """
+        if deadline is None:
+            deadline = get_clock().monotonic() + PUBLISH_DEADLINE
+        result = await self._publish(message, deadline)
+        outcome = 'ok' if result.ok else 'timeout' if result.timed_out else 'error'
+        PUBLISH_SECONDS.observe(result.latency, target=result.target, outcome=outcome)
+        return result
+
+    async def _send(self, message: str) -> Any:
+        """Одна попытка отправки: блокирующий send() в отдельном пуле потоков"""
+        return await asyncio.get_running_loop().run_in_executor(_executor, self.send, message)
+
+    async def _publish(self, message: str, deadline: float) -> PublishResult:
+        start = time.perf_counter()
+        error = None
+        attempt = 0
+        failures = 0  # Неудачи, кроме отказов по лимиту
+        limited = 0  # Отказы по лимиту: повторяются после паузы, пока позволяют deadline и их бюджет
+
+        while True:
+            try:
+                keys = self.rate_keys()
+            except Exception as e:
+                return PublishResult(self.name, False, attempt, time.perf_counter() - start, error=str(e))
+            if not await limiter.acquire(keys, deadline):
+                error = f"очередь лимита частоты не подошла до срока публикации (последняя ошибка: {error})"
+                return PublishResult(self.name, False, attempt, time.perf_counter() - start, error=error)
+
+            attempt += 1
+            try:
+                response = await asyncio.wait_for(self._send(message), timeout=self.timeout)
+                return PublishResult(self.name, True, attempt, time.perf_counter() - start, response=response)
+            except asyncio.TimeoutError:
+                # Запрос мог дойти до сервиса - повтор рискует задублировать пост
+                error = f"таймаут {self.timeout} с"
+                logger.warning(f"{self.name}: попытка {attempt} превысила таймаут, повтор не выполняется")
+                return PublishResult(self.name, False, attempt, time.perf_counter() - start, error=error,
+                                     timed_out=True)
+            except RateLimited as e:
+                # Пост не принят - повтор безопасен; паузу выдержит ограничитель
+                error = str(e)
+                limiter.penalize(keys, e.retry_after)
+                limited += 1
+                if e.retryable and limited <= PUBLISH_RATE_LIMIT_RETRIES:
+                    continue
+                logger.warning(f"{self.name}: отказ по лимиту, повтор не выполняется: {error}")
+                return PublishResult(self.name, False, attempt, time.perf_counter() - start, error=error)
+            except Exception as e:
+                error = str(e)
+
+            failures += 1
+            logger.warning(f"{self.name}: попытка {attempt} не удалась: {error}")
+            if failures > self.retries:
+                return PublishResult(self.name, False, attempt, time.perf_counter() - start, error=error)
+            await asyncio.sleep(self.retry_delay * failures)
+
+
+class TelegramPublisher(Publisher):
+    """Канал Telegram"""
+    provider = "telegram"
+    token_key = "TG_TOKEN"
+
+    def __init__(self, chat_id: str, keys_func, **kwargs):
+        super().__init__(keys_func, **kwargs)
+        self.chat_id = chat_id
+
+    @property
+    def name(self) -> str:
+        return f"telegram:{self.chat_id}"
+
+    def rate_keys(self) -> List[BucketKey]:
+        """Лимиты бота и отдельного канала"""
+        return super().rate_keys() + [(SCOPE_TELEGRAM_CHAT, str(self.chat_id))]
+
+    def send(self, message: str) -> Any:
+        url = f"{self.endpoint('TG_API_URL', TG_API_URL)}/bot{self.token()}/sendMessage"
+        payload = {
+            'chat_id': self.chat_id,
+            'text': message,
+            'parse_mode': 'HTML'
+        }
+
+        response = get_session(self.provider).post(url, data=payload, timeout=self.timeout)
+        if response.status_code == 429:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if retry_after is None:
+                try:
+                    retry_after = response.json().get('parameters', {}).get('retry_after')
+                except ValueError:
+                    pass
+            raise RateLimited("Telegram: слишком много запросов (429)", retry_after)
+        response.raise_for_status()
+        return response.json()
+
+
+class VkPublisher(Publisher):
+    """Стена группы VK"""
+    provider = "vk"
+    token_key = "VK_TOKEN"
+
+    def __init__(self, group_id: int, keys_func, **kwargs):
+        super().__init__(keys_func, **kwargs)
+        self.group_id = group_id
+
+    @property
+    def name(self) -> str:
+        return f"vk:{self.group_id}"
+
+    def send(self, message: str) -> Any:
+        base_url = self.endpoint('VK_API_URL', VK_API_URL)
+        if base_url == VK_API_URL:
+            try:
+                return get_vk_api(self.token()).wall.post(
+                    owner_id=self.group_id,
+                    message=message,
+                    from_group=1
+                )
+            except Exception as e:
+                # vk_api.exceptions.ApiError: код ошибки VK в атрибуте code
+                self._raise_rate_limited(getattr(e, 'code', None), str(e))
+                raise
+
+        # vk_api не позволяет сменить адрес API - для другого адреса вызываем метод напрямую
+        payload = {
+            'owner_id': self.group_id,
+            'message': message,
+            'from_group': 1,
+            'access_token': self.token(),
+            'v': VK_API_VERSION
+        }
+        response = get_session(self.provider).post(f"{base_url}/method/wall.post", data=payload,
+                                                   timeout=self.timeout)
+        response.raise_for_status()
+        body = response.json()
+        if 'error' in body:
+            error = body['error']
+            message = f"[{error.get('error_code')}] {error.get('error_msg')}"
+            self._raise_rate_limited(error.get('error_code'), message)
+            raise RuntimeError(message)
+        return body['response']
+
+    @staticmethod
+    def _raise_rate_limited(code: Optional[int], message: str):
+        """
+        Ошибки VK 6 (частота запросов) и 9 (flood control) - отказ по лимиту. Flood control
+        на wall.post - суточный лимит постов или повтор того же текста: через минуту пост
+        не пройдёт, поэтому он не повторяется, а только приостанавливает вёдра токена.
+        """
+        if code in VK_RATE_LIMIT_CODES:
+            if code == 6:
+                raise RateLimited(f"VK: {message}")
+            raise RateLimited(f"VK: {message}", VK_FLOOD_CONTROL_DELAY, retryable=False)
+
+
+async def publish_all(publishers: Sequence[Publisher], message: str,
+                      deadline: Optional[float] = None) -> List[PublishResult]:
+    """
+    Публикует во все цели одновременно и возвращает результат по каждой.
+    Очередь лимита частоты ждём не дольше deadline (см. Publisher.publish).
+    """
+    results = await asyncio.gather(*(publisher.publish(message, deadline) for publisher in publishers))
+
+    for result in results:
+        if result.ok:
+            logger.info(f"Сообщение успешно отправлено в {result.target} "
+                        f"(попыток: {result.attempts}, {result.latency:.2f} с)")
+        else:
+            logger.error(f"Ошибка отправки в {result.target}: {result.error}")
+
+    return list(results)
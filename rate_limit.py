@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Sequence, Tuple
+
+from metrics import RATE_LIMIT_WAIT_SECONDS, RATE_LIMITED
+from scheduling import get_clock
+
+logger = logging.getLogger(__name__)
+
+# Области лимитов: провайдер целиком (на токен) и отдельная цель внутри провайдера
+SCOPE_OPENAI = "openai"  # На ключ API
+SCOPE_TELEGRAM = "telegram"  # На токен бота: ~30 сообщений в секунду
+SCOPE_TELEGRAM_CHAT = "telegram_chat"  # На канал: ~20 сообщений в минуту
+SCOPE_VK = "vk"  # На токен: 3 запроса в секунду
+
+VK_RATE_LIMIT_CODES = {6, 9}  # "Слишком много запросов в секунду" и "Flood control"
+VK_FLOOD_CONTROL_DELAY = 60.0  # Пауза после flood control VK (подсказки Retry-After у VK нет), секунды
+DEFAULT_RETRY_AFTER = 1.0  # Пауза после отказа по лимиту без подсказки, секунды
+
+BucketKey = Tuple[str, str]  # (область, токен или цель)
+
+
+@dataclass
+class RateLimit:
+    """Лимит области: rate запросов в секунду в среднем, не более burst подряд"""
+    rate: float
+    burst: int = 1
+
+
+DEFAULT_LIMITS: Dict[str, RateLimit] = {
+    SCOPE_OPENAI: RateLimit(500 / 60, burst=10),
+    SCOPE_TELEGRAM: RateLimit(30, burst=30),
+    SCOPE_TELEGRAM_CHAT: RateLimit(20 / 60, burst=20),
+    SCOPE_VK: RateLimit(3, burst=3),
+}
+
+
+class RateLimited(Exception):
+    """
+    Сервис отказал по лимиту частоты; retry_after - сколько подождать, секунды.
+    retryable=False - повтор того же запроса после паузы не поможет (запрет всё равно выдерживается).
+    """
+
+    def __init__(self, message: str, retry_after: Optional[float] = None, retryable: bool = True):
+        super().__init__(message)
+        self.retry_after = retry_after if retry_after is not None else DEFAULT_RETRY_AFTER
+        self.retryable = retryable
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Значение заголовка Retry-After (секунды или HTTP-дата) в секундах"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Маркерное ведро в форме GCRA: хранится только теоретическое время следующего запроса.
+    Запрос резервирует ближайший свободный момент, поэтому ожидающие обслуживаются
+    по очереди и с максимальной разрешённой частотой. blocked_until - запрет от сервиса (Retry-After).
+    Без лимита (limit=None) ведро только выдерживает запреты сервиса.
+    """
+
+    def __init__(self, limit: Optional[RateLimit]):
+        self.interval = 1.0 / limit.rate if limit is not None else 0.0
+        self.tolerance = (limit.burst - 1) * self.interval if limit is not None else 0.0
+        self.tat = 0.0  # Теоретическое время прихода (монотонные часы процесса)
+        self.blocked_until = 0.0
+
+    def earliest(self, now: float) -> float:
+        """Ближайший момент, когда можно выполнить запрос"""
+        return max(now, self.tat - self.tolerance, self.blocked_until)
+
+    def consume(self, at: float):
+        self.tat = max(self.tat, at) + self.interval
+
+
+class RateLimiter:
+    """
+    Общие для процесса лимиты частоты по провайдерам, токенам и целям.
+    Запрос занимает место сразу во всех своих вёдрах (например, бот и канал Telegram)
+    и ждёт наступления зарезервированного момента; если он позже срока, место не занимается.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, RateLimit]] = None):
+        self.limits = dict(DEFAULT_LIMITS if limits is None else limits)
+        self._buckets: Dict[BucketKey, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, scope: str, limit: Optional[RateLimit]):
+        """Меняет лимит области (None - без лимита); существующие вёдра области пересоздаются"""
+        with self._lock:
+            if limit is None:
+                self.limits.pop(scope, None)
+            else:
+                self.limits[scope] = limit
+            for key in [key for key in self._buckets if key[0] == scope]:
+                del self._buckets[key]
+
+    def reset(self):
+        """Забывает очереди и запреты всех вёдер (например, при смене часов процесса)"""
+        with self._lock:
+            self._buckets.clear()
+
+    def _bucket(self, key: BucketKey) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.limits.get(key[0]))
+        return bucket
+
+    def reserve(self, keys: Sequence[BucketKey], deadline: Optional[float] = None) -> Optional[float]:
+        """
+        Резервирует запрос во всех вёдрах keys. Возвращает паузу до зарезервированного момента
+        или None, если он наступает позже deadline (get_clock().monotonic()) - тогда ничего не занимается.
+        """
+        now = get_clock().monotonic()
+        with self._lock:
+            buckets = [self._bucket(key) for key in keys]
+            at = max((bucket.earliest(now) for bucket in buckets), default=now)
+            if deadline is not None and at > deadline:
+                return None
+            for bucket in buckets:
+                bucket.consume(at)
+        return at - now
+
+    def blocked_for(self, keys: Sequence[BucketKey]) -> float:
+        """Сколько ещё действует запрет сервиса в вёдрах keys, секунды"""
+        now = get_clock().monotonic()
+        with self._lock:
+            return max((bucket.blocked_until - now for bucket in (self._buckets.get(key) for key in keys)
+                        if bucket is not None), default=0.0)
+
+    async def acquire(self, keys: Sequence[BucketKey], deadline: Optional[float] = None) -> bool:
+        """
+        Дожидается своей очереди; False - если очередь не подходит до deadline.
+        Если за время ожидания сервис ответил отказом по лимиту, очередь занимается заново.
+        """
+        while True:
+            delay = self.reserve(keys, deadline)
+            if delay is None:
+                return False
+            if delay > 0:
+                RATE_LIMIT_WAIT_SECONDS.observe(delay, scope=keys[0][0])
+                await asyncio.sleep(delay)
+            if self.blocked_for(keys) <= 0:
+                return True
+
+    def penalize(self, keys: Sequence[BucketKey], retry_after: float):
+        """Сервис отказал по лимиту: запрещает запросы в вёдрах keys на retry_after секунд"""
+        until = get_clock().monotonic() + retry_after
+        with self._lock:
+            for key in keys:
+                bucket = self._bucket(key)
+                bucket.blocked_until = max(bucket.blocked_until, until)
+        RATE_LIMITED.inc(scope=keys[0][0])
+        logger.warning(f"Лимит частоты {keys[0][0]}: сервис просит подождать {retry_after:.1f} с")
+
+
+# Общий ограничитель процесса: все ленты и все вызовы делят одни вёдра
+limiter = RateLimiter()
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from metrics import OPENAI_CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_DB = "openai_cache.db"  # Кэш ответов OpenAI
+RESPONSE_CACHE_MAX_ENTRIES = 10_000  # Больше записей не храним: вытесняются самые старые
+RESPONSE_CACHE_MAX_AGE = 30 * 24 * 3600  # Записи старше этого не отдаются и удаляются, секунды
+
+
+def cache_key(model: str, system_message: str, prompt: str) -> str:
+    """Ключ ответа: хеш модели, системного сообщения и промпта"""
+    payload = json.dumps([model, system_message, prompt], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    Хранимый в SQLite кэш ответов OpenAI.
+    Повтор того же промпта с той же моделью и системным сообщением (повторная попытка,
+    перезапуск после сбоя) отдаётся из базы, без запроса и расхода токенов.
+    Чтение не пишет в базу; при записи удаляются устаревшие записи и самые старые сверх лимита.
+    Число записей считается один раз при открытии и дальше ведётся по изменённым строкам -
+    запись вызывается из цикла событий и не должна пересчитывать таблицу.
+    """
+
+    def __init__(self, path: str = RESPONSE_CACHE_DB, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+                 max_age: float = RESPONSE_CACHE_MAX_AGE):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Потеря последних записей при сбое питания для кэша не страшна
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_created ON responses (created_at)")
+        self._size = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def get(self, model: str, system_message: str, prompt: str) -> Optional[str]:
+        """Сохранённый ответ или None (промах учитывается в счётчиках)"""
+        key = cache_key(model, system_message, prompt)
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ? AND created_at >= ?",
+                                     (key, time.time() - self.max_age)).fetchone()
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        OPENAI_CACHE_REQUESTS.inc(result='miss' if row is None else 'hit')
+        return None if row is None else row[0]
+
+    def put(self, model: str, system_message: str, prompt: str, response: str):
+        """Сохраняет ответ и вытесняет устаревшие и лишние записи"""
+        key = cache_key(model, system_message, prompt)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                size = self._size
+                inserted = self._conn.execute(
+                    "INSERT OR IGNORE INTO responses (key, response, created_at) VALUES (?, ?, ?)",
+                    (key, response, now)).rowcount
+                if inserted:
+                    size += 1
+                else:
+                    self._conn.execute("UPDATE responses SET response = ?, created_at = ? WHERE key = ?",
+                                       (response, now, key))
+                size -= self._conn.execute("DELETE FROM responses WHERE created_at < ?",
+                                           (now - self.max_age,)).rowcount
+                if size > self.max_entries:
+                    size -= self._conn.execute(
+                        "DELETE FROM responses WHERE key IN ("
+                        "SELECT key FROM responses ORDER BY created_at LIMIT ?)", (size - self.max_entries,)).rowcount
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._size = size
+
+    def stats(self) -> Dict[str, float]:
+        """Попадания, промахи, доля попаданий и число записей"""
+        requests = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'entries': self._size,
+                'hit_rate': self.hits / requests if requests else 0.0}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    """Общий кэш ответов процесса (создаётся при первом обращении)"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ResponseCache()
+    return _default_cache
+
+
+def close_response_cache():
+    """Закрывает общий кэш ответов, если он был открыт"""
+    global _default_cache
+    if _default_cache is not None:
+        stats = _default_cache.stats()
+        logger.info(f"Кэш ответов OpenAI: попаданий {stats['hits']}, промахов {stats['misses']}, "
+                    f"записей {stats['entries']}")
+        _default_cache.close()
+        _default_cache = None
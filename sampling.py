@@ -0,0 +1,302 @@
+import heapq
+import logging
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from operator import itemgetter
+from typing import List, Tuple, Optional, Sequence, Iterable, Hashable, Dict
+
+import numpy as np
+
+from metrics import STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Размер порции при переборе выборки (ограничивает пиковую память)
+COLLECT_BATCH_SIZE = 65536
+
+# Режимы перебора: пошаговая симуляция порциями или аналитический розыгрыш счётчиков
+COLLECT_MODE_BATCH = "batch"
+COLLECT_MODE_ANALYTIC = "analytic"
+
+# Сколько раз перетягивать мультиномиальную выборку в ветке "перебор не завершился"
+ANALYTIC_MAX_REJECTIONS = 100
+
+# Первая порция слов при поиске редких среди непросмотренных позиций выборки (дальше удваивается)
+RARE_SCAN_BATCH = 64
+
+
+@dataclass
+class SampleSummary:
+    """Итог анализа выборки по одной части речи"""
+    top: List[Tuple[str, int]]  # Самые частые слова с количеством попаданий
+    rare: List[str]  # Слова выборки, не попавшие в перебор
+
+
+class FrequencySummary:
+    """
+    Потоковый частотный счётчик: топ-k и низ-k за один проход.
+    Принимает любые итераторы, подсчёт идёт в C-реализации Counter,
+    а выбор k элементов - через ограниченную кучу без полной сортировки.
+    """
+
+    def __init__(self, items: Optional[Iterable[Hashable]] = None):
+        self.counts: Counter = Counter()
+        if items is not None:
+            self.update(items)
+
+    def update(self, items: Iterable[Hashable]) -> 'FrequencySummary':
+        """Добавляет элементы из итератора"""
+        self.counts.update(items)
+        return self
+
+    def top(self, k: int = 3) -> List[Tuple[Hashable, int]]:
+        """k самых частых элементов (при равенстве - в порядке первого появления)"""
+        return self.counts.most_common(k)
+
+    def bottom(self, k: int = 3) -> List[Tuple[Hashable, int]]:
+        """k самых редких элементов (при равенстве - в порядке первого появления)"""
+        return heapq.nsmallest(k, self.counts.items(), key=itemgetter(1))
+
+
+def summarize_stream(pairs: Iterable[Tuple[str, Hashable]]) -> Dict[str, FrequencySummary]:
+    """
+    Частотный анализ сразу нескольких частей речи за один проход
+    по потоку пар (часть речи, слово).
+    """
+    summaries: Dict[str, FrequencySummary] = defaultdict(FrequencySummary)
+    for (part, word), count in Counter(pairs).items():
+        summaries[part].counts[word] = count
+    return dict(summaries)
+
+
+def collector_may_finish(vocabulary_size: int, sample_size: int, max_iterations: int = 20000) -> bool:
+    """
+    Может ли перебор заметно часто встретить все уникальные элементы выборки.
+    Оценка по равномерной выборке: ожидаемое число уникальных u и время сборщика купонов u * ln(u);
+    неравные веса только удлиняют перебор. Влияет лишь на выбор более быстрого пути, не на результат.
+    """
+    if sample_size <= 0 or vocabulary_size == 0:
+        return True
+    unique = vocabulary_size * -np.expm1(-sample_size / vocabulary_size)
+    return unique * np.log(max(unique, 1.0)) <= max_iterations
+
+
+class WordSampler:
+    """
+    Выборка слов по целочисленным индексам словаря.
+    Вместо списков строк работает с массивами индексов numpy,
+    строки извлекаются из словаря только для итоговых слов.
+    """
+
+    def __init__(self, vocabulary: Sequence[str], rng: Optional[np.random.Generator] = None,
+                 mode: str = COLLECT_MODE_ANALYTIC):
+        if mode not in (COLLECT_MODE_BATCH, COLLECT_MODE_ANALYTIC):
+            raise ValueError(f"Неизвестный режим перебора: {mode}")
+
+        self.vocabulary = vocabulary
+        self.size = len(vocabulary)
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.mode = mode
+
+    def draw_sample(self, sample_size: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Случайная выборка sample_size слов с возвращением.
+        Возвращает уникальные индексы слов и количество их попаданий.
+        """
+        if sample_size <= 0 or self.size == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        if sample_size >= self.size:
+            # Выборка больше словаря: сразу разыгрываем счётчики, O(размер словаря)
+            counts = self.rng.multinomial(sample_size, np.full(self.size, 1.0 / self.size))
+            ids = np.flatnonzero(counts)
+            return ids, counts[ids]
+
+        ids, counts = np.unique(self.rng.integers(0, self.size, sample_size), return_counts=True)
+        return ids, counts
+
+    def collect(self, counts: np.ndarray, max_iterations: int = 20000) -> np.ndarray:
+        """
+        Аналог optimized_choice_lst на индексах: тянет элементы выборки
+        (с весами counts), пока не встретятся все уникальные или не кончатся итерации.
+        Возвращает число попаданий каждого уникального элемента.
+        """
+        unique_count = len(counts)
+        hits = np.zeros(unique_count, dtype=np.int64)
+        if unique_count == 0:
+            return hits
+
+        cumulative = np.cumsum(counts)
+        total = int(cumulative[-1])
+        seen = np.zeros(unique_count, dtype=bool)
+        seen_count = 0
+        drawn = 0
+
+        while drawn < max_iterations and seen_count < unique_count:
+            batch_size = min(COLLECT_BATCH_SIZE, max_iterations - drawn)
+            batch = np.searchsorted(cumulative, self.rng.integers(0, total, batch_size), side='right')
+
+            values, first_positions = np.unique(batch, return_index=True)
+            new_mask = ~seen[values]
+            new_values = values[new_mask]
+
+            if seen_count + len(new_values) == unique_count:
+                # Все элементы встретились внутри порции - обрезаем по последнему новому
+                batch = batch[:int(first_positions[new_mask].max()) + 1]
+
+            hits += np.bincount(batch, minlength=unique_count)
+            seen[new_values] = True
+            seen_count += len(new_values)
+            drawn += len(batch)
+
+        return hits
+
+    def collect_analytic(self, counts: np.ndarray, max_iterations: int = 20000) -> np.ndarray:
+        """
+        Тот же результат, что и collect, но за O(уникальных) вместо O(итераций).
+
+        Перебор до первой встречи всех элементов вкладывается в пуассоновские
+        процессы с интенсивностями p_i: время первой встречи E_i ~ Exp(p_i),
+        момент завершения - max(E_i), а попадания элемента после первой встречи
+        распределены как Poisson(p_i * (max(E) - E_i)). Если при этом число
+        шагов превышает max_iterations, перебор не завершился - тогда счётчики
+        на шаге max_iterations это мультиномиальная выборка с условием,
+        что хотя бы один элемент не встретился (разыгрывается отбраковкой).
+        """
+        unique_count = len(counts)
+        if unique_count == 0 or max_iterations <= 0:
+            return np.zeros(unique_count, dtype=np.int64)
+
+        probabilities = counts / counts.sum()
+
+        if unique_count <= max_iterations:
+            first_seen = self.rng.exponential(1.0 / probabilities)
+            finish = first_seen.max()
+            hits = 1 + self.rng.poisson(probabilities * (finish - first_seen))
+            hits[np.argmax(first_seen)] = 1
+            if hits.sum() <= max_iterations:
+                return hits
+
+        for _ in range(ANALYTIC_MAX_REJECTIONS):
+            hits = self.rng.multinomial(max_iterations, probabilities)
+            if not hits.all():
+                return hits
+
+        # Условие почти невероятно - честно досимулируем перебор
+        logger.debug("Аналитический перебор не сошёлся, используем пошаговый")
+        return self.collect(counts, max_iterations)
+
+    def top_words(self, ids: np.ndarray, hits: np.ndarray, k: int = 3) -> List[Tuple[str, int]]:
+        """Топ-k самых частых слов по числу попаданий (равные счётчики - в случайном порядке)"""
+        if len(hits) == 0 or k <= 0:
+            return []
+
+        # Попадания - маленькие числа с массой повторов, на которых argpartition вырождается:
+        # порог k-го значения ищем по убыванию значений, каждый шаг добавляет хотя бы одного кандидата
+        threshold = hits.max()
+        candidates = np.flatnonzero(hits >= threshold)
+        while len(candidates) < k:
+            lower = hits[hits < threshold]
+            if len(lower) == 0:
+                break
+            threshold = lower.max()
+            candidates = np.flatnonzero(hits >= threshold)
+
+        candidates = self.rng.permutation(candidates)
+        candidates = candidates[np.argsort(-hits[candidates], kind='stable')[:k]]
+
+        return [(self.vocabulary[int(ids[i])], int(hits[i])) for i in candidates if hits[i] > 0]
+
+    def rare_words(self, ids: np.ndarray, hits: np.ndarray, k: int = 2) -> List[str]:
+        """Случайные k слов выборки, не попавшие в перебор"""
+        missing = np.flatnonzero(hits == 0)
+        if len(missing) == 0:
+            return []
+
+        logger.debug(f"Элементы, не попавшие в выборку: {[self.vocabulary[int(ids[i])] for i in missing[:5]]}")
+
+        chosen = self.rng.choice(missing, min(k, len(missing)), replace=False)
+        return [self.vocabulary[int(ids[i])] for i in chosen]
+
+    def summarize(self, sample_size: int, max_iterations: int = 20000,
+                  top_k: int = 3, rare_k: int = 2) -> SampleSummary:
+        """Выборка, перебор и частотный анализ для одной части речи"""
+        if self.mode == COLLECT_MODE_ANALYTIC and not collector_may_finish(self.size, sample_size, max_iterations):
+            with STAGE_SECONDS.time(stage='frequency'):
+                return self.summarize_direct(sample_size, max_iterations, top_k, rare_k)
+
+        with STAGE_SECONDS.time(stage='sampling'):
+            ids, counts = self.draw_sample(sample_size)
+        return self.summarize_counts(ids, counts, max_iterations, top_k, rare_k)
+
+    def summarize_direct(self, sample_size: int, max_iterations: int = 20000,
+                         top_k: int = 3, rare_k: int = 2) -> SampleSummary:
+        """
+        Тот же результат, что draw_sample + collect, без счётчиков выборки:
+        O(max_iterations + размер словаря) при любом размере выборки.
+
+        Перебор тянет позиции выборки равновероятно, а слова на позициях независимы и равномерны
+        по словарю. Поэтому разыгрываются только max_iterations позиций перебора (повторы позиций
+        делят одно слово) и слова на различных из них. Слова непросмотренных позиций нужны только
+        для "редких": по симметрии слов вне перебора первые rare_k различных из них распределены
+        так же, как случайные rare_k элементов множества пропущенных. Если среди непросмотренных
+        позиций нет ни одного слова вне перебора, перебор на самом деле завершился раньше -
+        тогда счётчики берутся по префиксу до встречи последнего нового слова.
+        """
+        if sample_size <= 0 or self.size == 0 or max_iterations <= 0:
+            return SampleSummary(top=[], rare=[])
+
+        picks = self.rng.integers(0, sample_size, max_iterations)
+        if sample_size <= max_iterations:
+            picked = np.bincount(picks, minlength=sample_size) > 0
+            distinct = int(np.count_nonzero(picked))
+            pick_words = self.rng.integers(0, self.size, distinct)[np.cumsum(picked)[picks] - 1]
+        else:
+            # Позиций больше, чем шагов: повторы ищем сортировкой; слова - в порядке позиций
+            ordered = np.sort(picks)
+            first = np.r_[True, ordered[1:] != ordered[:-1]]
+            distinct = int(np.count_nonzero(first))
+            pick_words = self.rng.integers(0, self.size, distinct)[np.cumsum(first) - 1]
+
+        hits = np.bincount(pick_words, minlength=self.size)
+        missing = self._scan_missing(hits > 0, sample_size - distinct, max(rare_k, 1))
+        if not missing:
+            # Все слова выборки встретились: перебор остановился на первой встрече последнего из них
+            if sample_size > max_iterations:
+                in_order = np.empty_like(pick_words)
+                in_order[np.argsort(picks)] = pick_words
+                pick_words = in_order
+            _, first_seen = np.unique(pick_words, return_index=True)
+            hits = np.bincount(pick_words[:int(first_seen.max()) + 1], minlength=self.size)
+
+        ids = np.flatnonzero(hits > 0)
+        rare = [self.vocabulary[word] for word in missing[:rare_k]]
+        return SampleSummary(top=self.top_words(ids, hits[ids], top_k), rare=rare)
+
+    def _scan_missing(self, hit: np.ndarray, positions: int, k: int) -> List[int]:
+        """
+        Первые k различных слов вне перебора (hit - маска словаря) среди слов positions
+        непросмотренных позиций выборки; слова разыгрываются порциями, пока не найдутся k.
+        """
+        found: List[int] = []
+        batch = RARE_SCAN_BATCH
+        while positions > 0 and len(found) < k:
+            words = self.rng.integers(0, self.size, min(batch, positions))
+            positions -= len(words)
+            batch *= 2
+            for word in words[~hit[words]].tolist():
+                if word not in found:
+                    found.append(word)
+                    if len(found) == k:
+                        break
+        return found
+
+    def summarize_counts(self, ids: np.ndarray, counts: np.ndarray, max_iterations: int = 20000,
+                         top_k: int = 3, rare_k: int = 2) -> SampleSummary:
+        """Перебор и частотный анализ готовой выборки (уникальные индексы и их количество)"""
+        with STAGE_SECONDS.time(stage='frequency'):
+            if self.mode == COLLECT_MODE_ANALYTIC:
+                hits = self.collect_analytic(counts, max_iterations)
+            else:
+                hits = self.collect(counts, max_iterations)
+            return SampleSummary(top=self.top_words(ids, hits, top_k), rare=self.rare_words(ids, hits, rare_k))
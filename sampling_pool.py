@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from metrics import STAGE_SECONDS
+from sampling import WordSampler, SampleSummary, collector_may_finish
+from vocab import MappedVocabulary
+
+logger = logging.getLogger(__name__)
+
+SPLIT_SAMPLE_SIZE = 1_000_000  # Выборки больше этого размера разыгрываются частями в нескольких процессах
+
+# Словари рабочего процесса: подключаются один раз при старте, а не передаются с каждой задачей
+_worker_vocabularies: Dict[str, Sequence[str]] = {}
+
+VocabularySpec = Tuple[str, object]  # ('mmap', путь) или ('list', слова)
+
+
+def _vocabulary_spec(vocabulary: Sequence[str]) -> VocabularySpec:
+    """Как подключить словарь в рабочем процессе: скомпилированный - по пути (общие страницы mmap)"""
+    if isinstance(vocabulary, MappedVocabulary):
+        return 'mmap', vocabulary.path
+    return 'list', list(vocabulary)
+
+
+def _init_worker(specs: Dict[str, VocabularySpec]):
+    for part, (kind, source) in specs.items():
+        _worker_vocabularies[part] = MappedVocabulary(source) if kind == 'mmap' else source
+
+
+def _sampler(part: str, seed: np.random.SeedSequence) -> WordSampler:
+    return WordSampler(_worker_vocabularies[part], rng=np.random.default_rng(seed))
+
+
+def _summarize(part: str, sample_size: int, max_iterations: int, top_k: int, rare_k: int,
+               seed: np.random.SeedSequence) -> SampleSummary:
+    return _sampler(part, seed).summarize(sample_size, max_iterations, top_k, rare_k)
+
+
+def _draw(part: str, sample_size: int, seed: np.random.SeedSequence) -> Tuple[np.ndarray, np.ndarray]:
+    return _sampler(part, seed).draw_sample(sample_size)
+
+
+def _summarize_counts(part: str, ids: np.ndarray, counts: np.ndarray, max_iterations: int, top_k: int, rare_k: int,
+                      seed: np.random.SeedSequence) -> SampleSummary:
+    return _sampler(part, seed).summarize_counts(ids, counts, max_iterations, top_k, rare_k)
+
+
+def merge_counts(parts: List[Tuple[np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Объединяет частичные выборки (уникальные индексы и количество) в одну"""
+    ids = np.concatenate([part_ids for part_ids, _ in parts])
+    counts = np.concatenate([part_counts for _, part_counts in parts])
+    merged_ids, inverse = np.unique(ids, return_inverse=True)
+    return merged_ids, np.bincount(inverse, weights=counts).astype(np.int64)
+
+
+class SamplingPool:
+    """
+    Выборка и частотный анализ в пуле процессов, не занимая цикл событий.
+    Части речи считаются параллельно; очень большие выборки по маленьким словарям
+    (когда перебор может завершиться и нужны счётчики выборки) дополнительно
+    разыгрываются частями в нескольких процессах и складываются.
+    Скомпилированные словари рабочие процессы отображают в память сами,
+    JSON-словари передаются один раз при старте процесса.
+    Каждая задача получает собственный поток случайных чисел от SeedSequence.spawn,
+    поэтому потоки независимы, а при заданном seed результат воспроизводим.
+    """
+
+    def __init__(self, vocabularies: Dict[str, Sequence[str]], workers: Optional[int] = None,
+                 seed: Optional[int] = None, split_sample_size: int = SPLIT_SAMPLE_SIZE):
+        self.workers = workers or os.cpu_count() or 1
+        self.split_sample_size = split_sample_size
+        self._seeds = np.random.SeedSequence(seed)
+        self._sizes = {part: len(vocabulary) for part, vocabulary in vocabularies.items()}
+        specs = {part: _vocabulary_spec(vocabulary) for part, vocabulary in vocabularies.items()}
+        # spawn: в родительском процессе работают потоки логирования, fork мог бы унаследовать их блокировки
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                             initializer=_init_worker, initargs=(specs,))
+        logger.info(f"Пул выборки запущен: процессов - {self.workers}")
+
+    async def summarize(self, part: str, sample_size: int, max_iterations: int = 20000,
+                        top_k: int = 3, rare_k: int = 2) -> SampleSummary:
+        """Выборка и частотный анализ одной части речи в пуле"""
+        loop = asyncio.get_running_loop()
+        chunks = min(self.workers, -(-sample_size // self.split_sample_size))
+        # Если перебор не может завершиться, итог считается без счётчиков выборки за время, не зависящее от её размера
+        if chunks <= 1 or not collector_may_finish(self._sizes[part], sample_size, max_iterations):
+            return await loop.run_in_executor(self._executor, _summarize, part, sample_size, max_iterations,
+                                              top_k, rare_k, self._seeds.spawn(1)[0])
+
+        sizes = [sample_size // chunks + (i < sample_size % chunks) for i in range(chunks)]
+        seeds = self._seeds.spawn(chunks + 1)
+        parts = await asyncio.gather(*(loop.run_in_executor(self._executor, _draw, part, size, seed)
+                                       for size, seed in zip(sizes, seeds)))
+        ids, counts = merge_counts(parts)
+        return await loop.run_in_executor(self._executor, _summarize_counts, part, ids, counts, max_iterations,
+                                          top_k, rare_k, seeds[-1])
+
+    async def summarize_all(self, parts: Sequence[str], sample_size: int, **kwargs) -> Dict[str, SampleSummary]:
+        """Все части речи одновременно"""
+        with STAGE_SECONDS.time(stage='sampling_pool'):
+            summaries = await asyncio.gather(*(self.summarize(part, sample_size, **kwargs) for part in parts))
+        return dict(zip(parts, summaries))
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,167 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+import pytz
+
+logger = logging.getLogger(__name__)
+
+MOSCOW_TZ = pytz.timezone('Europe/Moscow')
+
+# Максимальный сон без проверки часов: ограничивает опоздание при скачке системного времени
+MAX_TIMER_SLEEP = 60.0
+# Расхождение настенных и монотонных часов, которое считаем скачком времени
+CLOCK_JUMP_THRESHOLD = 2.0
+
+
+class Clock:
+    """Часы планировщика: настенное время МСК и монотонное время. По умолчанию - системные"""
+
+    def now(self) -> datetime:
+        return datetime.now(MOSCOW_TZ)
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+
+class VirtualClock(Clock):
+    """
+    Виртуальные часы симуляции: стоят на месте, пока их не передвинут через advance().
+    Двигает их цикл событий симуляции (simulate.py) - при простое сразу к ближайшему таймеру.
+    """
+
+    def __init__(self, start: datetime):
+        self.start = start
+        self.elapsed = 0.0  # Прошло виртуальных секунд
+
+    def now(self) -> datetime:
+        return self.start + timedelta(seconds=self.elapsed)
+
+    def monotonic(self) -> float:
+        return self.elapsed
+
+    def advance(self, seconds: float):
+        self.elapsed += max(seconds, 0.0)
+
+
+_clock: Clock = Clock()
+
+
+def get_clock() -> Clock:
+    """Текущие часы процесса"""
+    return _clock
+
+
+def set_clock(clock: Clock):
+    """Подменяет часы процесса (симуляция); Clock() возвращает системные"""
+    global _clock
+    _clock = clock
+
+
+class DeadlineTimer:
+    """
+    Очередь дедлайнов: спит ровно до ближайшего события вместо опроса раз в секунду.
+    Каждое событие имеет ключ; повторное планирование ключа заменяет прежний дедлайн.
+    Ожидание прерывается досрочно через wake() (остановка, изменение состояния).
+    Скачок настенных часов обнаруживается сверкой с монотонными после каждого сна, то есть
+    не позже чем через MAX_TIMER_SLEEP; после скачка наступившие события извлекаются
+    и время сна пересчитывается сразу.
+    """
+
+    def __init__(self, now_func: Callable[[], datetime]):
+        self.now_func = now_func
+        self._heap: List[Tuple[datetime, int, Hashable]] = []
+        self._deadlines: Dict[Hashable, Tuple[datetime, int]] = {}
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+
+    def schedule(self, key: Hashable, when: datetime):
+        """Планирует (или переносит) событие key на момент when"""
+        current = self._deadlines.get(key)
+        if current is not None and current[0] == when:
+            return
+
+        seq = next(self._counter)
+        self._deadlines[key] = (when, seq)
+        heapq.heappush(self._heap, (when, seq, key))
+
+        # Новое событие раньше текущего сна - надо пересчитать время ожидания
+        if self._heap[0][1] == seq:
+            self._wakeup.set()
+
+    def cancel(self, key: Hashable):
+        """Отменяет событие key (запись в куче удаляется лениво)"""
+        self._deadlines.pop(key, None)
+
+    def next_deadline(self) -> Optional[datetime]:
+        """Ближайший актуальный дедлайн"""
+        self._drop_cancelled()
+        return self._heap[0][0] if self._heap else None
+
+    def wake(self):
+        """Прерывает текущее ожидание"""
+        self._wakeup.set()
+
+    def pop_due(self, now: datetime) -> List[Hashable]:
+        """Извлекает все события, срок которых наступил"""
+        due = []
+        self._drop_cancelled()
+        while self._heap and self._heap[0][0] <= now:
+            when, seq, key = heapq.heappop(self._heap)
+            del self._deadlines[key]
+            due.append(key)
+            self._drop_cancelled()
+        return due
+
+    async def wait_due(self) -> List[Hashable]:
+        """
+        Ждёт наступления ближайшего дедлайна и возвращает ключи наступивших событий.
+        Пустой список означает досрочное пробуждение через wake().
+        """
+        while True:
+            now = self.now_func()
+            due = self.pop_due(now)
+            if due:
+                return due
+
+            deadline = self.next_deadline()
+            delay = MAX_TIMER_SLEEP
+            if deadline is not None:
+                delay = min(max((deadline - now).total_seconds(), 0.0), MAX_TIMER_SLEEP)
+
+            mono_start = get_clock().monotonic()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+            if self._clock_jumped(now, mono_start):
+                # Дедлайны в настенном времени: после скачка проверяем их и пересчитываем сон заново
+                continue
+
+            if self._wakeup.is_set():
+                self._wakeup.clear()
+                return self.pop_due(self.now_func())
+
+    def _clock_jumped(self, wall_start: datetime, mono_start: float) -> bool:
+        """Сверяет настенные часы с монотонными: True (с предупреждением в лог) при скачке времени"""
+        mono_elapsed = get_clock().monotonic() - mono_start
+        wall_elapsed = (self.now_func() - wall_start).total_seconds()
+        if abs(wall_elapsed - mono_elapsed) <= CLOCK_JUMP_THRESHOLD:
+            return False
+        logger.warning(f"Обнаружен скачок системного времени на {wall_elapsed - mono_elapsed:.1f} с, "
+                       f"пересчитываем дедлайны")
+        return True
+
+    def _drop_cancelled(self):
+        """Убирает с вершины кучи отменённые и перенесённые записи"""
+        while self._heap:
+            when, seq, key = self._heap[0]
+            current = self._deadlines.get(key)
+            if current is not None and current[1] == seq:
+                return
+            heapq.heappop(self._heap)
@@ -0,0 +1,244 @@
+"""
+Индекс похожести пророчеств: MinHash по словесным шинглам и LSH по полосам сигнатуры.
+Хранится в SQLite рядом с базой состояния и пополняется по одному тексту,
+поэтому проверка кандидата - несколько запросов по индексу, без просмотра всей истории.
+
+    python similarity.py prophecies_log.jsonl prophecies_log.*.jsonl.gz   # заполнить индекс из журнала
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Iterable, List, Optional, Tuple
+
+from metrics import STAGE_SECONDS
+from startup import lazy_import
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SIMILARITY_DB = "prophecy_similarity.db"  # Индекс похожести (рядом с базой состояния STATE_DB)
+SIMILARITY_THRESHOLD = 0.5  # Оценка сходства Жаккара, с которой кандидат считается повтором
+SHINGLE_SIZE = 3  # Слов в шингле
+NUM_PERM = 64  # Длина сигнатуры MinHash
+LSH_BANDS = 16  # Полос LSH по NUM_PERM // LSH_BANDS значений: порог срабатывания около (1/16)^(1/4) = 0.5
+MAX_CANDIDATES = 256  # Сколько самых свежих кандидатов из LSH сравнивать по сигнатуре
+MINHASH_SEED = 20240521  # Сид перестановок; менять нельзя - сигнатуры в базе станут несравнимы
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_WORD_RE = re.compile(r"\w+")
+_permutations: Optional[Tuple["np.ndarray", "np.ndarray"]] = None
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> List[str]:
+    """Словесные шинглы текста (без регистра и пунктуации); короткий текст - один шингл"""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) <= size:
+        return [" ".join(words)] if words else []
+    return [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+
+
+def _get_permutations() -> Tuple["np.ndarray", "np.ndarray"]:
+    """Коэффициенты хеш-перестановок (a * x + b) mod p, общие для всех сигнатур"""
+    global _permutations
+    if _permutations is None:
+        np = lazy_import('numpy')
+        rng = np.random.default_rng(MINHASH_SEED)
+        # a < 2^31 и x < 2^32: произведение с прибавкой b помещается в uint64 без переполнения
+        a = rng.integers(1, 1 << 31, size=NUM_PERM, dtype=np.uint64)
+        b = rng.integers(0, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+        _permutations = a, b
+    return _permutations
+
+
+def minhash(text: str) -> Optional["np.ndarray"]:
+    """Сигнатура MinHash текста (NUM_PERM значений uint32) или None для текста без слов"""
+    items = shingles(text)
+    if not items:
+        return None
+
+    np = lazy_import('numpy')
+    hashes = np.array([int.from_bytes(hashlib.blake2b(item.encode('utf-8'), digest_size=4).digest(), 'little')
+                       for item in items], dtype=np.uint64)
+    a, b = _get_permutations()
+    permuted = (a[:, None] * hashes[None, :] + b[:, None]) % _MERSENNE_PRIME & _MAX_HASH
+    return permuted.min(axis=1).astype(np.uint32)
+
+
+def band_keys(signature: "np.ndarray") -> List[int]:
+    """Ключи полос LSH: хеш номера полосы и её значений, как знаковое 64-битное число для SQLite"""
+    rows = NUM_PERM // LSH_BANDS
+    return [int.from_bytes(hashlib.blake2b(bytes([band]) + signature[band * rows:(band + 1) * rows].tobytes(),
+                                           digest_size=8).digest(), 'little', signed=True)
+            for band in range(LSH_BANDS)]
+
+
+@dataclass
+class SimilarProphecy:
+    """Найденное в истории пророчество, похожее на кандидата"""
+    doc_id: int
+    feed_id: str
+    day: str  # День публикации, YYYY-MM-DD
+    similarity: float  # Оценка сходства Жаккара по сигнатурам
+
+
+class SimilarityIndex:
+    """
+    Хранимый индекс пророчеств для поиска почти-повторов.
+    Для каждого текста хранится сигнатура MinHash и LSH_BANDS ключей полос;
+    кандидаты - тексты, совпавшие с запросом хотя бы в одной полосе (поиск по индексу ключей),
+    сходство уточняется сравнением сигнатур только этих кандидатов.
+    """
+
+    def __init__(self, path: str = SIMILARITY_DB, threshold: float = SIMILARITY_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "id INTEGER PRIMARY KEY, feed_id TEXT NOT NULL, day TEXT NOT NULL, "
+            "signature BLOB NOT NULL, added_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS bands ("
+            "key INTEGER NOT NULL, doc_id INTEGER NOT NULL, "
+            "PRIMARY KEY (key, doc_id)) WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS documents_feed_day ON documents (feed_id, day)")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def nearest(self, text: str, exclude: Optional[Tuple[str, str]] = None) -> Optional[SimilarProphecy]:
+        """
+        Самое похожее прежнее пророчество со сходством не ниже порога или None.
+        exclude - пара (лента, день), пророчества которой не учитываются.
+        """
+        signature = minhash(text)
+        if signature is None:
+            return None
+
+        np = lazy_import('numpy')
+        keys = band_keys(signature)
+        # Исключение - в самом запросе, чтобы исключённые тексты не занимали места среди MAX_CANDIDATES
+        excluded = ""
+        params = [*keys]
+        if exclude is not None:
+            excluded = "AND doc_id NOT IN (SELECT id FROM documents WHERE feed_id = ? AND day = ?) "
+            params.extend(exclude)
+        with STAGE_SECONDS.time(stage='similarity'), self._lock:
+            rows = self._conn.execute(
+                "SELECT id, feed_id, day, signature FROM documents WHERE id IN ("
+                f"SELECT DISTINCT doc_id FROM bands WHERE key IN ({', '.join('?' * len(keys))}) {excluded}"
+                "ORDER BY doc_id DESC LIMIT ?)", (*params, MAX_CANDIDATES)
+            ).fetchall()
+
+        best = None
+        for doc_id, feed_id, day, blob in rows:
+            similarity = float(np.mean(np.frombuffer(blob, dtype=np.uint32) == signature))
+            if similarity >= self.threshold and (best is None or similarity > best.similarity):
+                best = SimilarProphecy(doc_id, feed_id, day, similarity)
+        return best
+
+    def add(self, text: str, feed_id: str, day: str) -> Optional[int]:
+        """
+        Добавляет пророчество в индекс; возвращает его номер (None для текста без слов).
+        Тот же текст той же ленты на тот же день (повтор после перезапуска) не дублируется.
+        """
+        ids = self.add_many([(text, feed_id, day)])
+        return ids[0] if ids else None
+
+    def add_many(self, items: Iterable[Tuple[str, str, str]]) -> List[int]:
+        """Добавляет тройки (текст, лента, день) одной транзакцией; уже проиндексированные не дублируются"""
+        prepared = [(signature, feed_id, day) for signature, feed_id, day
+                    in ((minhash(text), feed_id, day) for text, feed_id, day in items) if signature is not None]
+        ids = []
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for signature, feed_id, day in prepared:
+                    existing = self._conn.execute(
+                        "SELECT id FROM documents WHERE feed_id = ? AND day = ? AND signature = ?",
+                        (feed_id, day, signature.tobytes())
+                    ).fetchone()
+                    if existing is not None:
+                        ids.append(existing[0])
+                        continue
+                    doc_id = self._conn.execute(
+                        "INSERT INTO documents (feed_id, day, signature, added_at) VALUES (?, ?, ?, ?)",
+                        (feed_id, day, signature.tobytes(), time.time())
+                    ).lastrowid
+                    self._conn.executemany("INSERT OR IGNORE INTO bands (key, doc_id) VALUES (?, ?)",
+                                           [(key, doc_id) for key in band_keys(signature)])
+                    ids.append(doc_id)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return ids
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_index: Optional[SimilarityIndex] = None
+
+
+def get_similarity_index() -> SimilarityIndex:
+    """Общий индекс похожести процесса (создаётся при первом обращении)"""
+    global _default_index
+    if _default_index is None:
+        _default_index = SimilarityIndex()
+    return _default_index
+
+
+def close_similarity_index():
+    """Закрывает общий индекс похожести, если он был открыт"""
+    global _default_index
+    if _default_index is not None:
+        _default_index.close()
+        _default_index = None
+
+
+def iter_logged_prophecies(paths: Iterable[str]) -> Iterable[Tuple[str, str, str]]:
+    """Тройки (текст, лента, день) сгенерированных пророчеств из сегментов журнала (JSONL, в т.ч. .gz)"""
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, 'rt', encoding='utf-8') as fh:
+            for line in fh:
+                entry = json.loads(line)
+                if entry.get('event') in ('first', 'generated') and entry.get('prophecy'):
+                    yield entry['prophecy'], entry['feed_id'], entry['day']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Заполнение индекса похожести из журнала пророчеств")
+    parser.add_argument('segments', nargs='+', help="сегменты журнала prophecies_log*.jsonl[.gz]")
+    parser.add_argument('--index', default=SIMILARITY_DB, help="файл индекса")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    index = SimilarityIndex(args.index)
+    try:
+        added = index.add_many(iter_logged_prophecies(sorted(args.segments)))
+        logger.info(f"В индекс {args.index} добавлено пророчеств: {len(added)}, всего: {len(index)}")
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
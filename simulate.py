@@ -0,0 +1,314 @@
+"""
+Симуляция планировщика в виртуальном времени: месяцы циклов генерации и публикации
+для многих лент за секунды. OpenAI, Telegram и VK заменены заглушками с задержкой и долей отказов
+в виртуальном времени; выборка слов, расписание, таймер дедлайнов, ограничитель частоты,
+индекс похожести и состояние лент работают настоящие.
+
+    python simulate.py --days 90 --feeds 10
+    python simulate.py --days 30 --feeds 1000 --openai-latency 8 --failure-rate 0.01 -o sim.json
+
+Отчёт (JSON): пропуски дедлайнов, распределения запаса генерации, опоздания публикации
+и задержки от готовности до публикации, пропускная способность.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import selectors
+import tempfile
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+import ai_prorok
+from ai_prorok import FeedConfig, Vocabularies, MOSCOW_TZ, FAILED_PROPHECY, load_vocabularies
+from feeds import FeedManager
+from publishers import TelegramPublisher, VkPublisher
+from rate_limit import limiter
+from scheduling import Clock, VirtualClock, get_clock, set_clock
+from similarity import SimilarityIndex
+from state_store import StateStore
+from prophecy_log import close_prophecy_log
+
+logger = logging.getLogger(__name__)
+
+SIM_START = datetime(2025, 1, 1)  # Начало виртуального времени (МСК)
+MISS_TOLERANCE = 60.0  # Публикация позже расписания на столько секунд считается пропуском дедлайна
+PERCENTILES = (0, 50, 90, 99, 100)
+
+
+class _VirtualSelector(selectors.DefaultSelector):
+    """
+    Селектор цикла событий, который не ждёт таймеров: если готовых событий нет,
+    виртуальные часы сдвигаются сразу на время до ближайшего таймера.
+    """
+
+    def __init__(self, clock: VirtualClock):
+        super().__init__()
+        self.clock = clock
+
+    def select(self, timeout: Optional[float] = None):
+        events = super().select(0)
+        if events or timeout == 0:
+            return events
+        if timeout is None:
+            # Таймеров нет - ждать можно только внешних событий
+            return super().select(None)
+        self.clock.advance(timeout)
+        return []
+
+
+class VirtualTimeEventLoop(asyncio.SelectorEventLoop):
+    """
+    Цикл событий, время которого - виртуальные часы: asyncio.sleep, wait_for и таймеры
+    срабатывают без реального ожидания. Пул потоков в симуляции не используется:
+    пока поток работает, цикл не знает о нём и ушёл бы вперёд.
+    """
+
+    def __init__(self, clock: VirtualClock):
+        super().__init__(_VirtualSelector(clock))
+        self.clock = clock
+
+    def time(self) -> float:
+        return self.clock.monotonic()
+
+
+@dataclass
+class SimulationSettings:
+    """Параметры заглушек сервисов (в виртуальных секундах)"""
+    openai_latency: float = 5.0  # Медиана ответа OpenAI
+    publish_latency: float = 0.5  # Медиана ответа Telegram/VK
+    failure_rate: float = 0.0  # Доля отказов OpenAI (после всех повторов) и отдельных попыток публикации
+    latency_sigma: float = 0.5  # Разброс задержек (логнормальное распределение)
+
+
+class _SimulatedSendMixin:
+    """Отправка без сети и без пула потоков: задержка и отказы в виртуальном времени"""
+    settings: SimulationSettings
+    recorder: "SimulationRecorder"
+
+    async def _send(self, message: str) -> Any:
+        await asyncio.sleep(random.lognormvariate(np.log(self.settings.publish_latency), self.settings.latency_sigma))
+        if random.random() < self.settings.failure_rate:
+            raise RuntimeError("симулированный отказ")
+        self.recorder.posts.append(get_clock().monotonic())
+        return {'ok': True}
+
+
+class SimulatedTelegramPublisher(_SimulatedSendMixin, TelegramPublisher):
+    pass
+
+
+class SimulatedVkPublisher(_SimulatedSendMixin, VkPublisher):
+    pass
+
+
+@dataclass
+class SimulationRecorder:
+    """События симуляции по всем лентам"""
+    generation_slack: List[float] = field(default_factory=list)  # Запас от готовности до расписания, с
+    publish_lag: List[float] = field(default_factory=list)  # Опоздание публикации относительно расписания, с
+    ready_to_publish: List[float] = field(default_factory=list)  # От готовности пророчества до публикации, с
+    posts: List[float] = field(default_factory=list)  # Моменты успешных отправок (виртуальные секунды)
+    counters: Counter = field(default_factory=Counter)
+    ready_at: Dict[str, datetime] = field(default_factory=dict)
+
+    def attach(self, scheduler: ai_prorok.ProphecyScheduler):
+        """Оборачивает генерацию и публикацию ленты замерами"""
+        generate = scheduler._generate_next_prophecy
+        publish = scheduler._publish_scheduled_prophecy
+        feed_id = scheduler.feed.feed_id
+
+        async def generate_recorded():
+            await generate()
+            if not scheduler.generated_for_current_cycle:
+                self.counters['generation_errors'] += 1
+                return
+            now = get_clock().now()
+            self.ready_at[feed_id] = now
+            slack = (scheduler.next_publish_time - now).total_seconds()
+            self.generation_slack.append(slack)
+            self.counters['generations'] += 1
+            if slack < 0:
+                self.counters['late_generations'] += 1
+            if FAILED_PROPHECY in (scheduler.current_prophecy or ""):
+                self.counters['fallback_prophecies'] += 1
+
+        async def publish_recorded():
+            scheduled = scheduler.next_publish_time
+            posts_before = len(self.posts)
+            await publish()
+            now = get_clock().now()
+            lag = (now - scheduled).total_seconds()
+            self.publish_lag.append(lag)
+            self.counters['publications'] += 1
+            if lag > MISS_TOLERANCE:
+                self.counters['late_publications'] += 1
+            if len(self.posts) - posts_before < len(scheduler.publishers):
+                self.counters['failed_targets'] += len(scheduler.publishers) - (len(self.posts) - posts_before)
+            ready = self.ready_at.pop(feed_id, None)
+            if ready is not None:
+                self.ready_to_publish.append((now - ready).total_seconds())
+
+        scheduler._generate_next_prophecy = generate_recorded
+        scheduler._publish_scheduled_prophecy = publish_recorded
+
+
+def distribution(values: List[float]) -> Dict[str, float]:
+    """Перцентили распределения в секундах"""
+    if not values:
+        return {}
+    points = np.percentile(values, PERCENTILES)
+    return {f"p{p}": round(float(value), 3) for p, value in zip(PERCENTILES, points)}
+
+
+def make_feeds(count: int) -> List[FeedConfig]:
+    return [FeedConfig(feed_id=f"feed{i}", tg_chat_id=f"@sim{i}", vk_group_id=-(i + 1), state_file=f"sim_{i}.json")
+            for i in range(count)]
+
+
+async def run_simulation(feeds: int, days: float, settings: SimulationSettings, vocabularies: Vocabularies,
+                         recorder: SimulationRecorder) -> Dict[str, Any]:
+    numbers = itertools.count(1)
+
+    async def openai_stub(prompt, max_retries=3, day=None, **kwargs):
+        await asyncio.sleep(random.lognormvariate(np.log(settings.openai_latency), settings.latency_sigma))
+        if random.random() < settings.failure_rate:
+            return FAILED_PROPHECY
+        return f"Симулированное пророчество {next(numbers)}"
+
+    def keys() -> Dict[str, Optional[str]]:
+        return {'TG_TOKEN': "sim", 'VK_TOKEN': "sim"}
+
+    ai_prorok.get_openai_response_async = openai_stub
+    # Состояние и индекс похожести - в памяти: запись на диск симуляции не нужна
+    state_store, similarity_index = StateStore(":memory:"), SimilarityIndex(":memory:")
+    manager = FeedManager(make_feeds(feeds), vocabularies=vocabularies, state_store=state_store,
+                          similarity_index=similarity_index)
+    for scheduler in manager.schedulers.values():
+        publishers = []
+        for publisher in scheduler.publishers:
+            cls = SimulatedTelegramPublisher if isinstance(publisher, TelegramPublisher) else SimulatedVkPublisher
+            target = publisher.chat_id if isinstance(publisher, TelegramPublisher) else publisher.group_id
+            simulated = cls(target, keys)
+            simulated.settings, simulated.recorder = settings, recorder
+            publishers.append(simulated)
+        scheduler.publishers = publishers
+        recorder.attach(scheduler)
+
+    # Первые пророчества публикуются сразу при инициализации - в статистику циклов не входят
+    await manager.initialize()
+    recorder.posts.clear()
+    start = get_clock().monotonic()
+
+    async def stop_after():
+        await asyncio.sleep(days * 86400)
+        ai_prorok.stop_flag = True
+        manager.wake()
+
+    try:
+        await asyncio.gather(manager.run(), stop_after())
+    finally:
+        state_store.close()
+        similarity_index.close()
+    return {'virtual_seconds': get_clock().monotonic() - start}
+
+
+def simulate(feeds: int = 10, days: float = 90, settings: Optional[SimulationSettings] = None, seed: int = 1,
+             vocabularies: Optional[Vocabularies] = None) -> Dict[str, Any]:
+    """Прогоняет days виртуальных дней для feeds лент и возвращает отчёт"""
+    settings = settings or SimulationSettings()
+    vocabularies = vocabularies or load_vocabularies()
+    random.seed(seed)
+    recorder = SimulationRecorder()
+
+    clock = VirtualClock(MOSCOW_TZ.localize(SIM_START))
+    loop = VirtualTimeEventLoop(clock)
+    original_openai = ai_prorok.get_openai_response_async
+    cwd = os.getcwd()
+    wall_start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as workdir:
+        # Журнал пророчеств и прочие файлы - во временном каталоге
+        os.chdir(workdir)
+        set_clock(clock)
+        # Вёдра ограничителя частоты помнят время прежних часов
+        limiter.reset()
+        try:
+            ai_prorok.stop_flag = False
+            outcome = loop.run_until_complete(run_simulation(feeds, days, settings, vocabularies, recorder))
+        finally:
+            loop.close()
+            set_clock(Clock())
+            limiter.reset()
+            ai_prorok.stop_flag = False
+            ai_prorok.get_openai_response_async = original_openai
+            close_prophecy_log()
+            os.chdir(cwd)
+    wall = time.perf_counter() - wall_start
+
+    counters = recorder.counters
+    per_minute = Counter(int(moment // 60) for moment in recorder.posts)
+    return {
+        'feeds': feeds,
+        'days': days,
+        'seed': seed,
+        'settings': vars(settings),
+        'wall_seconds': round(wall, 3),
+        'virtual_days': round(outcome['virtual_seconds'] / 86400, 3),
+        'speedup': round(outcome['virtual_seconds'] / wall, 1),
+        'cycles': counters['publications'],
+        'cycles_per_wall_second': round(counters['publications'] / wall, 1),
+        'generations': counters['generations'],
+        'generation_errors': counters['generation_errors'],
+        'fallback_prophecies': counters['fallback_prophecies'],
+        'deadline_misses': {
+            'late_generations': counters['late_generations'],
+            'late_publications': counters['late_publications'],
+            'failed_targets': counters['failed_targets'],
+        },
+        'generation_slack_seconds': distribution(recorder.generation_slack),
+        'publish_lag_seconds': distribution(recorder.publish_lag),
+        'ready_to_publish_seconds': distribution(recorder.ready_to_publish),
+        'posts': len(recorder.posts),
+        'peak_posts_per_minute': max(per_minute.values(), default=0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--days', type=float, default=90, help="сколько виртуальных дней прогнать")
+    parser.add_argument('--feeds', type=int, default=10, help="число лент")
+    parser.add_argument('--openai-latency', type=float, default=SimulationSettings.openai_latency)
+    parser.add_argument('--publish-latency', type=float, default=SimulationSettings.publish_latency)
+    parser.add_argument('--failure-rate', type=float, default=SimulationSettings.failure_rate)
+    parser.add_argument('--vocab-size', type=int, help="искусственные словари этого размера вместо настоящих")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--verbose', action='store_true', help="логи планировщика (по умолчанию - только ошибки)")
+    parser.add_argument('-o', '--output', help="файл для JSON-отчёта (по умолчанию - stdout)")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.ERROR)
+    vocabularies = None
+    if args.vocab_size:
+        words = [f"слово{i}" for i in range(args.vocab_size)]
+        vocabularies = Vocabularies(nouns=words, verbs=words, adjectives=words)
+
+    settings = SimulationSettings(args.openai_latency, args.publish_latency, args.failure_rate)
+    report = simulate(args.feeds, args.days, settings, args.seed, vocabularies)
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as fh:
+            fh.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
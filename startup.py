@@ -0,0 +1,59 @@
+import importlib
+import sys
+import time
+from contextlib import contextmanager
+from types import ModuleType
+from typing import Dict, Iterator, List, Tuple
+
+# Отсчёт ведётся с первого импорта этого модуля (запуск интерпретатора в замер не входит)
+STARTED = time.perf_counter()
+
+_phases: List[Tuple[str, float]] = []  # (этап, длительность в секундах) в порядке выполнения
+_imports: Dict[str, float] = {}  # Отложенные импорты: модуль -> время импорта, секунды
+_last_mark = [STARTED]
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Замеряет этап запуска"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phases.append((name, time.perf_counter() - start))
+
+
+def mark(name: str):
+    """Отмечает окончание этапа, начавшегося с предыдущей отметки (или с начала запуска)"""
+    now = time.perf_counter()
+    _phases.append((name, now - _last_mark[0]))
+    _last_mark[0] = now
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Импорт тяжёлого модуля в момент первого использования.
+    Время первого импорта попадает в отчёт о запуске.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    _imports[name] = time.perf_counter() - start
+    return module
+
+
+def elapsed() -> float:
+    """Секунды с начала запуска"""
+    return time.perf_counter() - STARTED
+
+
+def report() -> str:
+    """Сводка запуска: этапы, отложенные импорты и общее время"""
+    parts = [f"{name} {duration * 1000:.1f} мс" for name, duration in _phases]
+    if _imports:
+        parts.append("отложенные импорты: " +
+                     ", ".join(f"{name} {duration * 1000:.1f} мс" for name, duration in _imports.items()))
+    return f"Запуск за {elapsed() * 1000:.1f} мс: " + "; ".join(parts)
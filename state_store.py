@@ -0,0 +1,74 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from metrics import STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+STATE_DB = "prophecy_state.db"  # Общая база состояний всех лент
+
+
+class StateStore:
+    """
+    Хранилище состояния лент в SQLite в режиме WAL.
+    Каждое сохранение - атомарная транзакция, обновляющая одну строку ленты,
+    поэтому сбой во время записи не портит файл, а тысячи лент живут в одной базе
+    без перезаписи всего содержимого. Журнал WAL сжимается автоматическими checkpoint.
+    """
+
+    def __init__(self, path: str = STATE_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._last_saved: Dict[str, str] = {}
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS feed_state ("
+            "feed_id TEXT PRIMARY KEY, "
+            "state TEXT NOT NULL, "
+            "updated_at REAL NOT NULL)"
+        )
+
+    def save(self, feed_id: str, state: Dict[str, Any]) -> bool:
+        """
+        Сохраняет состояние ленты. Неизменившееся состояние не пишется повторно.
+        Возвращает True, если запись выполнена.
+        """
+        payload = json.dumps(state, ensure_ascii=False, sort_keys=True)
+        with self._lock, STAGE_SECONDS.time(stage='state_save'):
+            if self._last_saved.get(feed_id) == payload:
+                return False
+
+            self._conn.execute(
+                "INSERT INTO feed_state (feed_id, state, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(feed_id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                (feed_id, payload, time.time())
+            )
+            self._last_saved[feed_id] = payload
+        return True
+
+    def load(self, feed_id: str) -> Optional[Dict[str, Any]]:
+        """Загружает состояние ленты или None, если его нет"""
+        with self._lock:
+            row = self._conn.execute("SELECT state FROM feed_state WHERE feed_id = ?", (feed_id,)).fetchone()
+        if row is None:
+            return None
+
+        self._last_saved[feed_id] = row[0]
+        return json.loads(row[0])
+
+    def delete(self, feed_id: str):
+        """Удаляет состояние ленты"""
+        with self._lock:
+            self._conn.execute("DELETE FROM feed_state WHERE feed_id = ?", (feed_id,))
+            self._last_saved.pop(feed_id, None)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
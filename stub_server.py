@@ -0,0 +1,292 @@
+"""
+Локальный заменитель OpenAI, Telegram и VK для нагрузочного тестирования без сети.
+
+    python stub_server.py --port 8808 --latency 0.2 --jitter 0.1 --error-rate 0.01 --rate-limit 30
+
+и в .env:
+    OPENAI_BASE_URL=http://127.0.0.1:8808/openai/v1
+    TG_API_URL=http://127.0.0.1:8808
+    VK_API_URL=http://127.0.0.1:8808
+
+Потоковые ответы chat.completions (stream=true) отдаются по словам; --stream-drop-rate
+обрывает часть потоков на середине, чтобы проверить продолжение частичного ответа.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+STUB_PROPHECY = ("Сегодня звёзды советуют не спешить: всё важное придёт само, "
+                 "если вовремя заметить мелочи.\n\nНе торопи событий бег -\nи день сложится вполне.")
+
+
+@dataclass
+class StubSettings:
+    """Поведение заменителя"""
+    latency: float = 0.0  # Средняя задержка ответа, секунды
+    jitter: float = 0.0  # Разброс задержки (равномерно ±jitter), секунды
+    error_rate: float = 0.0  # Доля ответов с ошибкой 500 (для VK - ошибка API)
+    rate_limit: Optional[float] = None  # Запросов в секунду на провайдера (None - без лимита)
+    retry_after: int = 1  # Подсказка Retry-After при превышении лимита, секунды
+    stream_drop_rate: float = 0.0  # Доля потоковых ответов, обрываемых на середине
+    token_delay: float = 0.0  # Пауза между фрагментами потокового ответа, секунды
+
+
+class _RateWindow:
+    """Простой лимит на провайдера: не более rate запросов за скользящую секунду"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.calls = []
+
+    def allow(self, now: float) -> bool:
+        self.calls = [t for t in self.calls if now - t < 1.0]
+        if len(self.calls) >= self.rate:
+            return False
+        self.calls.append(now)
+        return True
+
+
+class StubServer:
+    """
+    HTTP/1.1 сервер на asyncio с keep-alive. Понимает:
+      POST .../chat/completions      - ответ в формате OpenAI
+      POST /bot<token>/sendMessage   - ответ Telegram Bot API
+      POST /method/wall.post         - ответ VK API
+      GET  /stats                    - счётчики запросов
+    """
+
+    def __init__(self, settings: StubSettings = None, host: str = "127.0.0.1", port: int = 0):
+        self.settings = settings or StubSettings()
+        self.host = host
+        self.port = port
+        self.stats: Counter = Counter()
+        self._windows: Dict[str, _RateWindow] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+        self._post_id = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Заменитель сервисов запущен на {self.url}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            # Клиенты держат keep-alive соединения - закрываем их сами
+            for writer in list(self._connections.values()):
+                writer.transport.abort()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                status, extra_headers, payload = await self._dispatch(method, path, body)
+                if isinstance(payload, list):
+                    if not await self._write_stream(writer, extra_headers, payload):
+                        break
+                    continue
+                self._write_response(writer, status, extra_headers, payload)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.pop(task, None)
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError:
+            return None
+
+        lines = head.decode('latin-1').split("\r\n")
+        method, path, _ = lines[0].split(" ", 2)
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+
+        body = await reader.readexactly(int(headers.get('content-length', 0)))
+        return method, path, headers, body
+
+    @staticmethod
+    def _write_response(writer: asyncio.StreamWriter, status: int, headers: Dict[str, str], payload: bytes):
+        reason = {200: "OK", 404: "Not Found", 429: "Too Many Requests", 500: "Internal Server Error"}[status]
+        lines = [f"HTTP/1.1 {status} {reason}", f"Content-Length: {len(payload)}", "Connection: keep-alive"]
+        headers.setdefault('Content-Type', 'application/json')
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + payload)
+
+    async def _write_stream(self, writer: asyncio.StreamWriter, headers: Dict[str, str], events: List[bytes]) -> bool:
+        """
+        Потоковый ответ (SSE) порциями chunked-кодирования.
+        С вероятностью stream_drop_rate соединение рвётся на середине; тогда возвращает False.
+        """
+        lines = ["HTTP/1.1 200 OK", "Transfer-Encoding: chunked", "Connection: keep-alive"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+
+        drop_at = len(events) // 2 if random.random() < self.settings.stream_drop_rate else None
+        for i, event in enumerate(events):
+            if i == drop_at:
+                self.stats["openai_streams_dropped"] += 1
+                writer.transport.abort()
+                return False
+            writer.write(f"{len(event):x}\r\n".encode('latin-1') + event + b"\r\n")
+            await writer.drain()
+            if self.settings.token_delay > 0:
+                await asyncio.sleep(self.settings.token_delay)
+
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        return True
+
+    async def _dispatch(self, method: str, path: str,
+                        body: bytes) -> Tuple[int, Dict[str, str], Union[bytes, List[bytes]]]:
+        route = urlsplit(path).path
+        if method == "GET" and route == "/stats":
+            return 200, {}, json.dumps(dict(self.stats)).encode('utf-8')
+
+        if route.endswith("/chat/completions"):
+            provider = "openai"
+        elif route.startswith("/bot") and route.endswith("/sendMessage"):
+            provider = "telegram"
+        elif route == "/method/wall.post":
+            provider = "vk"
+        else:
+            return 404, {}, b'{"error": "not found"}'
+
+        self.stats[f"{provider}_requests"] += 1
+        settings = self.settings
+        delay = settings.latency + random.uniform(-settings.jitter, settings.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if settings.rate_limit is not None:
+            window = self._windows.setdefault(provider, _RateWindow(settings.rate_limit))
+            if not window.allow(time.monotonic()):
+                self.stats[f"{provider}_rate_limited"] += 1
+                return self._rate_limited(provider)
+
+        if random.random() < settings.error_rate:
+            self.stats[f"{provider}_errors"] += 1
+            if provider == "vk":
+                return 200, {}, json.dumps({'error': {'error_code': 10, 'error_msg': "Internal server error"}}).encode()
+            return 500, {}, b'{"error": {"message": "stub failure"}}'
+
+        self.stats[f"{provider}_ok"] += 1
+        if provider == "openai" and json.loads(body or b"{}").get('stream'):
+            return 200, {'Content-Type': 'text/event-stream'}, self._stream_events(json.loads(body))
+        return 200, {}, json.dumps(self._success(provider, body), ensure_ascii=False).encode('utf-8')
+
+    def _rate_limited(self, provider: str) -> Tuple[int, Dict[str, str], bytes]:
+        retry_after = self.settings.retry_after
+        if provider == "vk":
+            # VK сообщает о превышении частоты ошибкой API 6 при статусе 200
+            return 200, {}, json.dumps({'error': {'error_code': 6,
+                                                  'error_msg': "Too many requests per second"}}).encode()
+        if provider == "telegram":
+            return 429, {'Retry-After': str(retry_after)}, json.dumps({
+                'ok': False, 'error_code': 429, 'description': f"Too Many Requests: retry after {retry_after}",
+                'parameters': {'retry_after': retry_after}}).encode()
+        return 429, {'Retry-After': str(retry_after)}, json.dumps({
+            'error': {'message': "Rate limit reached", 'type': "requests", 'code': "rate_limit_exceeded"}}).encode()
+
+    def _stream_events(self, request: dict) -> List[bytes]:
+        """
+        События потокового ответа по словам. Если в запросе есть частичный ответ ассистента
+        (продолжение после обрыва), отдаётся только недостающий хвост.
+        """
+        self._post_id += 1
+        text = STUB_PROPHECY
+        partials = [m.get('content', "") for m in request.get('messages', []) if m.get('role') == "assistant"]
+        if partials and text.startswith(partials[-1]):
+            text = text[len(partials[-1]):]
+            self.stats["openai_continuations"] += 1
+
+        def event(delta: dict, finish_reason: Optional[str] = None) -> bytes:
+            chunk = {'id': f"chatcmpl-stub-{self._post_id}", 'object': "chat.completion.chunk",
+                     'created': int(time.time()), 'model': request.get('model', "gpt-4o"),
+                     'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]}
+            return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8')
+
+        tokens = re.findall(r"\S+\s*|\s+", text)
+        return ([event({'role': "assistant", 'content': ""})] + [event({'content': token}) for token in tokens]
+                + [event({}, "stop"), b"data: [DONE]\n\n"])
+
+    def _success(self, provider: str, body: bytes) -> dict:
+        self._post_id += 1
+        if provider == "telegram":
+            return {'ok': True, 'result': {'message_id': self._post_id}}
+        if provider == "vk":
+            return {'response': {'post_id': self._post_id}}
+
+        request = json.loads(body or b"{}")
+        return {
+            'id': f"chatcmpl-stub-{self._post_id}",
+            'object': "chat.completion",
+            'created': int(time.time()),
+            'model': request.get('model', "gpt-4o"),
+            'choices': [{'index': 0, 'finish_reason': "stop",
+                         'message': {'role': "assistant", 'content': STUB_PROPHECY}}],
+            'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+        }
+
+
+async def serve(settings: StubSettings, host: str, port: int):
+    server = StubServer(settings, host, port)
+    await server.start()
+    print(f"OPENAI_BASE_URL={server.url}/openai/v1\nTG_API_URL={server.url}\nVK_API_URL={server.url}")
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный заменитель OpenAI, Telegram и VK")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8808)
+    parser.add_argument('--latency', type=float, default=0.0, help="средняя задержка ответа, секунды")
+    parser.add_argument('--jitter', type=float, default=0.0, help="разброс задержки, секунды")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="доля ответов с ошибкой")
+    parser.add_argument('--rate-limit', type=float, default=None, help="запросов в секунду на провайдера")
+    parser.add_argument('--retry-after', type=int, default=1, help="подсказка Retry-After, секунды")
+    parser.add_argument('--stream-drop-rate', type=float, default=0.0, help="доля обрываемых потоковых ответов")
+    parser.add_argument('--token-delay', type=float, default=0.0, help="пауза между фрагментами потока, секунды")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    settings = StubSettings(args.latency, args.jitter, args.error_rate, args.rate_limit, args.retry_after,
+                            args.stream_drop_rate, args.token_delay)
+    try:
+        asyncio.run(serve(settings, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
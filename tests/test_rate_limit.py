@@ -0,0 +1,120 @@
+"""
+Ограничитель частоты и повторы публикации на виртуальных часах: очередь GCRA, запрет
+по Retry-After, бюджет повторов после отказов по лимиту и срок публикации
+от назначенного времени. Пауза ограничителя двигает виртуальные часы, а не ждёт.
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import scheduling
+from ai_prorok import ProphecyScheduler
+from publishers import Publisher, PUBLISH_DEADLINE, PUBLISH_RATE_LIMIT_RETRIES
+from rate_limit import RateLimiter, RateLimit, RateLimited, limiter
+from scheduling import VirtualClock, MOSCOW_TZ
+
+START = MOSCOW_TZ.localize(datetime(2030, 1, 1, 12))
+KEYS = [("test", "token"), ("test_chat", "@channel")]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Виртуальные часы процесса; asyncio.sleep передвигает их вместо ожидания"""
+    clock = VirtualClock(START)
+    scheduling.set_clock(clock)
+    limiter.reset()
+    real_sleep = asyncio.sleep
+
+    async def virtual_sleep(delay, result=None):
+        clock.advance(delay)
+        return await real_sleep(0, result)
+
+    monkeypatch.setattr(asyncio, 'sleep', virtual_sleep)
+    yield clock
+    limiter.reset()
+    scheduling.set_clock(scheduling.Clock())
+
+
+class FlakyPublisher(Publisher):
+    """Цель, отказывающая по лимиту первым refusals отправкам"""
+    provider = "test"
+    token_key = "TOKEN"
+
+    def __init__(self, refusals: int, retry_after: float = 5.0, retryable: bool = True):
+        super().__init__(lambda: {"TOKEN": "token"}, retry_delay=0.0)
+        self.refusals = refusals
+        self.retry_after = retry_after
+        self.retryable = retryable
+        self.sent = 0
+
+    def rate_keys(self):
+        return list(KEYS)
+
+    def send(self, message: str):
+        self.sent += 1
+        if self.sent <= self.refusals:
+            raise RateLimited("429", self.retry_after, retryable=self.retryable)
+        return {"ok": True}
+
+
+def test_burst_then_throttle(clock):
+    rate_limiter = RateLimiter({"test": RateLimit(2, burst=3)})
+    delays = [rate_limiter.reserve(KEYS[:1]) for _ in range(5)]
+    assert delays == pytest.approx([0.0, 0.0, 0.0, 0.5, 1.0])
+
+    # Очередь не подходит до срока - место не занимается
+    assert rate_limiter.reserve(KEYS[:1], deadline=clock.monotonic() + 1.0) is None
+    assert rate_limiter.reserve(KEYS[:1]) == pytest.approx(1.5)
+
+    clock.advance(10)
+    assert rate_limiter.reserve(KEYS[:1]) == 0.0
+
+
+def test_retry_after_blocks_all_buckets(clock):
+    rate_limiter = RateLimiter({"test": RateLimit(100, burst=100)})
+    rate_limiter.penalize(KEYS, 10.0)
+    assert rate_limiter.blocked_for(KEYS[1:]) == pytest.approx(10.0)
+    assert rate_limiter.reserve(KEYS) == pytest.approx(10.0)
+
+    clock.advance(10)
+    assert rate_limiter.blocked_for(KEYS) <= 0
+
+
+def test_publish_retries_after_rate_limit(clock):
+    publisher = FlakyPublisher(refusals=2, retry_after=5.0)
+    result = asyncio.run(publisher.publish("пророчество"))
+    assert result.ok
+    assert result.attempts == 3
+    assert clock.monotonic() == pytest.approx(10.0)  # Оба запрета выдержаны
+
+
+def test_publish_rate_limit_retries_are_bounded(clock):
+    publisher = FlakyPublisher(refusals=100, retry_after=1.0)
+    result = asyncio.run(publisher.publish("пророчество"))
+    assert not result.ok
+    assert result.attempts == publisher.sent == 1 + PUBLISH_RATE_LIMIT_RETRIES
+
+
+def test_final_rate_limit_is_not_retried(clock):
+    publisher = FlakyPublisher(refusals=100, retry_after=60.0, retryable=False)
+    result = asyncio.run(publisher.publish("пророчество"))
+    assert not result.ok
+    assert publisher.sent == 1
+    assert limiter.blocked_for(KEYS) == pytest.approx(60.0)  # Запрет всё равно выдерживается
+
+
+def test_deadline_counts_from_scheduled_publish_time(clock):
+    now = clock.monotonic()
+    late = ProphecyScheduler._publish_deadline(START - timedelta(minutes=25))
+    assert late == pytest.approx(now + PUBLISH_DEADLINE - 25 * 60)
+    # Просроченная дольше срока (перезапуск) и немедленная публикация считают от текущего момента
+    assert ProphecyScheduler._publish_deadline(START - timedelta(hours=3)) == pytest.approx(now + PUBLISH_DEADLINE)
+    assert ProphecyScheduler._publish_deadline(None) == pytest.approx(now + PUBLISH_DEADLINE)
+
+    # Запрет на 10 минут: опоздавшая на 25 минут публикация не дожидается очереди, вовремя - дожидается
+    limiter.penalize(KEYS, 10 * 60)
+    result = asyncio.run(FlakyPublisher(refusals=0).publish("пророчество", late))
+    assert not result.ok and result.attempts == 0
+    result = asyncio.run(FlakyPublisher(refusals=0).publish("пророчество", ProphecyScheduler._publish_deadline(START)))
+    assert result.ok
@@ -0,0 +1,100 @@
+"""
+Статистическая проверка аналитического перебора: collect_analytic должен давать то же
+распределение счётчиков, что пошаговый collect и исходный optimized_choice_lst.
+Сиды фиксированы, допуски - несколько стандартных ошибок разности средних.
+"""
+import random
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from ai_prorok import optimized_choice_lst
+from sampling import WordSampler, COLLECT_MODE_BATCH, COLLECT_MODE_ANALYTIC
+
+SEED = 20240521
+RUNS = 20000
+TOLERANCE = 4.5  # Допуск в стандартных ошибках разности средних
+
+WEIGHTS = [5, 3, 2, 1, 1]  # Сколько раз каждый элемент встречается в выборке
+
+
+def _stats(hits: np.ndarray) -> dict:
+    """Статистики прогонов: попадания по элементам, всего шагов, доля завершённых переборов"""
+    hits = np.asarray(hits, dtype=float)
+    return {'hits': hits, 'total': hits.sum(axis=1), 'completed': hits.all(axis=1).astype(float)}
+
+
+def _run_reference(weights, max_iterations: int) -> dict:
+    """Прогоны исходного optimized_choice_lst на списке строк"""
+    random.seed(SEED)
+    lst = [f"w{i}" for i, count in enumerate(weights) for _ in range(count)]
+    hits = np.zeros((RUNS, len(weights)))
+    for run in range(RUNS):
+        counter = Counter(optimized_choice_lst(lst, max_iterations)[0])
+        hits[run] = [counter[f"w{i}"] for i in range(len(weights))]
+    return _stats(hits)
+
+
+def _run_sampler(weights, max_iterations: int, mode: str) -> dict:
+    sampler = WordSampler([f"w{i}" for i in range(len(weights))], np.random.default_rng(SEED), mode=mode)
+    collect = sampler.collect_analytic if mode == COLLECT_MODE_ANALYTIC else sampler.collect
+    counts = np.array(weights)
+    return _stats([collect(counts, max_iterations) for _ in range(RUNS)])
+
+
+def assert_same_mean(a: np.ndarray, b: np.ndarray, what: str):
+    """Средние совпадают в пределах TOLERANCE стандартных ошибок (по каждому столбцу)"""
+    error = np.sqrt(a.var(axis=0) / len(a) + b.var(axis=0) / len(b))
+    difference = np.abs(a.mean(axis=0) - b.mean(axis=0))
+    assert np.all(difference <= TOLERANCE * error + 1e-12), \
+        f"{what}: {a.mean(axis=0)} против {b.mean(axis=0)} (допуск {TOLERANCE * error})"
+
+
+@pytest.mark.parametrize("weights, max_iterations", [
+    (WEIGHTS, 200),  # Ветка Пуассона: перебор почти всегда завершается
+    (WEIGHTS, 12),  # Ветка Пуассона с частым обрезанием и мультиномиальной отбраковкой
+    (WEIGHTS + [1, 1, 1], 6),  # Уникальных больше шагов: сразу мультиномиальная выборка без завершения
+])
+def test_collect_analytic_matches_reference(weights, max_iterations):
+    analytic = _run_sampler(weights, max_iterations, COLLECT_MODE_ANALYTIC)
+    for name, reference in (("optimized_choice_lst", _run_reference(weights, max_iterations)),
+                            ("collect", _run_sampler(weights, max_iterations, COLLECT_MODE_BATCH))):
+        assert_same_mean(analytic['hits'], reference['hits'], f"попадания по элементам ({name})")
+        assert_same_mean(analytic['total'], reference['total'], f"всего шагов ({name})")
+        assert_same_mean(analytic['completed'], reference['completed'], f"доля завершённых ({name})")
+
+
+def test_collect_analytic_branches_are_exercised():
+    """Параметры выше действительно покрывают обе ветки: и завершённые, и обрезанные переборы"""
+    completed = _run_sampler(WEIGHTS, 12, COLLECT_MODE_ANALYTIC)['completed'].mean()
+    assert 0.2 < completed < 0.8
+    assert _run_sampler(WEIGHTS, 200, COLLECT_MODE_ANALYTIC)['completed'].mean() > 0.99
+    assert _run_sampler(WEIGHTS + [1, 1, 1], 6, COLLECT_MODE_ANALYTIC)['completed'].max() == 0
+
+
+def _summary_stats(summaries) -> dict:
+    """Статистики итогов: счётчик первого слова, сумма топа, число редких слов"""
+    return {
+        'top1': np.array([s.top[0][1] if s.top else 0 for s in summaries], dtype=float),
+        'top_sum': np.array([sum(count for _, count in s.top) for s in summaries], dtype=float),
+        'rare': np.array([len(s.rare) for s in summaries], dtype=float),
+    }
+
+
+@pytest.mark.parametrize("vocabulary_size, sample_size, max_iterations", [
+    (12, 30, 40),  # Выборка меньше числа шагов, перебор часто завершается
+    (12, 100, 40),  # Выборка больше числа шагов, перебор часто завершается
+    (200, 150, 60),  # Перебор не завершается, редкие слова есть всегда
+    (200, 5000, 60),
+])
+def test_summarize_direct_matches_counts_path(vocabulary_size, sample_size, max_iterations):
+    vocabulary = [f"w{i}" for i in range(vocabulary_size)]
+    runs = RUNS // 4
+    direct = WordSampler(vocabulary, np.random.default_rng(SEED))
+    batch = WordSampler(vocabulary, np.random.default_rng(SEED), mode=COLLECT_MODE_BATCH)
+
+    expected = _summary_stats([batch.summarize(sample_size, max_iterations) for _ in range(runs)])
+    actual = _summary_stats([direct.summarize_direct(sample_size, max_iterations) for _ in range(runs)])
+    for name in expected:
+        assert_same_mean(actual[name], expected[name], name)
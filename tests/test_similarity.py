@@ -0,0 +1,50 @@
+"""
+Индекс похожести: исключённые пророчества не занимают места среди кандидатов,
+повторное добавление не дублирует записи.
+"""
+import pytest
+
+import similarity
+from similarity import SimilarityIndex
+
+TEXT = ("Завтра утренний туман рассеется над городом, и старый друг позовёт тебя "
+        "в дорогу, которую ты давно откладывал. Не спорь с ветром - он знает путь.")
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = SimilarityIndex(str(tmp_path / "similarity.db"))
+    yield index
+    index.close()
+
+
+def _rows(index: SimilarityIndex, table: str) -> int:
+    return index._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_excluded_candidates_do_not_use_up_limit(index, monkeypatch):
+    monkeypatch.setattr(similarity, 'MAX_CANDIDATES', 2)
+    index.add(TEXT, "other", "2030-01-01")
+    # Более свежие тексты исключаемой пары (лента, день): раньше они вытесняли прежнее пророчество из лимита
+    for variant in range(3):
+        index.add(f"{TEXT} Вариант {variant}.", "own", "2030-01-02")
+
+    match = index.nearest(TEXT, exclude=("own", "2030-01-02"))
+    assert match is not None
+    assert (match.feed_id, match.day) == ("other", "2030-01-01")
+
+    assert index.nearest(TEXT).feed_id == "own"
+
+
+def test_add_many_skips_already_indexed(index):
+    items = [(TEXT, "main", "2030-01-01"), (f"{TEXT} Иначе.", "main", "2030-01-02")]
+    first = index.add_many(items)
+    documents, bands = _rows(index, "documents"), _rows(index, "bands")
+
+    assert index.add_many(items) == first
+    assert index.add(TEXT, "main", "2030-01-01") == first[0]
+    assert (_rows(index, "documents"), _rows(index, "bands")) == (documents, bands)
+
+    # Тот же текст другой ленты или другого дня - отдельная запись
+    index.add(TEXT, "other", "2030-01-01")
+    assert len(index) == documents + 1
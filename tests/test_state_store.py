@@ -0,0 +1,84 @@
+"""
+Хранилище состояния лент: сохранение и загрузка по лентам, пропуск неизменившегося
+состояния, восстановление ProphecyScheduler вместе с промптом цикла и его днём.
+"""
+from datetime import date, timedelta
+
+import pytest
+
+from ai_prorok import FeedConfig, ProphecyScheduler, publish_day
+from prophecy_log import ProphecyLog
+from similarity import SimilarityIndex
+from state_store import StateStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = StateStore(str(tmp_path / "state.db"))
+    yield store
+    store.close()
+
+
+def test_round_trip_per_feed(store, tmp_path):
+    first = {'current_prophecy': "Пророчество", 'is_generating': False, 'cycle_prompt': None}
+    second = {'current_prophecy': None, 'is_generating': True, 'cycle_prompt': "Промпт"}
+    assert store.save("first", first)
+    assert store.save("second", second)
+
+    reopened = StateStore(store.path)
+    try:
+        assert reopened.load("first") == first
+        assert reopened.load("second") == second
+        assert reopened.load("missing") is None
+    finally:
+        reopened.close()
+
+    store.delete("first")
+    assert store.load("first") is None
+    assert store.load("second") == second
+
+
+def test_unchanged_state_is_not_written(store):
+    state = {'next_publish_time': "2030-01-01T12:00:00+03:00", 'generated_for_current_cycle': False}
+    assert store.save("main", state)
+    updated_at = store._conn.execute("SELECT updated_at FROM feed_state").fetchone()[0]
+
+    assert not store.save("main", dict(state))
+    assert store._conn.execute("SELECT updated_at FROM feed_state").fetchone()[0] == updated_at
+    assert store.save("main", {**state, 'generated_for_current_cycle': True})
+
+    # После загрузки (перезапуск) то же состояние тоже не переписывается
+    reopened = StateStore(store.path)
+    try:
+        loaded = reopened.load("main")
+        assert not reopened.save("main", loaded)
+    finally:
+        reopened.close()
+
+
+def test_scheduler_restores_cycle_prompt(store, tmp_path):
+    log = ProphecyLog(str(tmp_path / "log.jsonl"))
+    index = SimilarityIndex(str(tmp_path / "similarity.db"))
+    try:
+        def scheduler() -> ProphecyScheduler:
+            return ProphecyScheduler(FeedConfig(feed_id="main", state_file=str(tmp_path / "legacy.json")),
+                                     state_store=store, prophecy_log=log, similarity_index=index)
+
+        day = publish_day(date(2030, 1, 2))
+        saved = scheduler()
+        saved.next_publish_time = day
+        saved.next_generation_time = day - timedelta(minutes=10)
+        saved.cycle_prompt = "Промпт цикла"
+        saved.cycle_prompt_day = day.isoformat()
+        saved.save_state()
+
+        restored = scheduler()
+        assert restored.load_state()
+        assert restored.next_publish_time == day
+        assert restored.next_generation_time == day - timedelta(minutes=10)
+        assert (restored.cycle_prompt, restored.cycle_prompt_day) == ("Промпт цикла", day.isoformat())
+        assert restored.current_prophecy is None
+        assert not restored.is_generating
+    finally:
+        log.close()
+        index.close()
@@ -0,0 +1,110 @@
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+from typing import List, Sequence, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Формат скомпилированного словаря:
+#   заголовок: MAGIC (8 байт) + количество слов (uint64, little-endian)
+#   смещения: количество + 1 чисел uint64 little-endian
+#   блоб: слова в UTF-8 подряд, без разделителей
+VOCAB_MAGIC = b"PRVOCAB1"
+VOCAB_SUFFIX = ".vocab"
+_HEADER = struct.Struct("<8sQ")
+
+
+def compiled_path(json_path: str) -> str:
+    """Путь к скомпилированному словарю рядом с JSON-файлом"""
+    return os.path.splitext(json_path)[0] + VOCAB_SUFFIX
+
+
+def compile_vocabulary(json_path: str, out_path: str = None) -> str:
+    """
+    Конвертирует JSON-список слов в компактный формат (смещения + UTF-8 блоб).
+    Запись атомарная: сначала во временный файл, затем переименование.
+    """
+    if out_path is None:
+        out_path = compiled_path(json_path)
+
+    with open(json_path, "r", encoding='utf-8') as fh:
+        words = json.load(fh)
+
+    encoded = [word.encode('utf-8') for word in words]
+    offsets = np.zeros(len(encoded) + 1, dtype='<u8')
+    np.cumsum([len(item) for item in encoded], out=offsets[1:])
+
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "wb") as fh:
+        fh.write(_HEADER.pack(VOCAB_MAGIC, len(encoded)))
+        fh.write(offsets.tobytes())
+        for item in encoded:
+            fh.write(item)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp_path, out_path)
+
+    logger.info(f"Словарь {json_path} скомпилирован в {out_path}: {len(encoded)} слов")
+    return out_path
+
+
+class MappedVocabulary(Sequence[str]):
+    """
+    Словарь, отображённый в память. Слова декодируются лениво по индексу,
+    страницы файла разделяются между всеми процессами на хосте.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as fh:
+            self._mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, count = _HEADER.unpack_from(self._mmap, 0)
+        if magic != VOCAB_MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path} не является скомпилированным словарём")
+
+        self._count = count
+        self._offsets = np.frombuffer(self._mmap, dtype='<u8', count=count + 1, offset=_HEADER.size)
+        self._blob_start = _HEADER.size + 8 * (count + 1)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[str, List[str]]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("индекс словаря вне диапазона")
+
+        start = self._blob_start + int(self._offsets[index])
+        end = self._blob_start + int(self._offsets[index + 1])
+        return self._mmap[start:end].decode('utf-8')
+
+
+def load_vocabulary(json_path: str) -> Sequence[str]:
+    """
+    Загружает словарь: скомпилированный (mmap), если он есть и не старше JSON,
+    иначе обычный JSON-список.
+    """
+    vocab_path = compiled_path(json_path)
+    if os.path.exists(vocab_path) and (
+            not os.path.exists(json_path) or os.path.getmtime(vocab_path) >= os.path.getmtime(json_path)):
+        return MappedVocabulary(vocab_path)
+
+    with open(json_path, "r", encoding='utf-8') as fh:
+        return json.load(fh)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    for path in sys.argv[1:] or ["nouns.json", "verbs.json", "adject.json"]:
+        compile_vocabulary(path)